@@ -1,137 +1,223 @@
 from __future__ import annotations
 
+import asyncio
+import base64
 import json
+import os
+import zlib
+from collections import deque
 from datetime import datetime, timedelta
-from pathlib import Path
-from threading import Lock
-from typing import List, Optional
+from functools import partial
+from typing import Any, Callable, Deque, List, Optional, Tuple
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
 
-DATA_PATH = Path(__file__).resolve().parent / "tasks_store.json"
-LEGACY_TASKS_PATH = Path(__file__).resolve().parent.parent / "tasks.json"
+import assistant
+from dedupe import DUPLICATE_THRESHOLD, TaskDuplicates, build_index, duplicate_groups, open_titles
+from events import EventHub, sse_frame
+from jobs import JobQueue
+from metrics import Counter, Gauge, Histogram, Registry, RequestMetrics
+from profiler import SlowRequestProfiler
+from scheduler import IntervalIndex, parse_iso
+from scoring import ScoreEngine, build_engine, engine_owns, is_pinned, score_task
+from search import TaskSearch, ollama_embedder, rank_by_similarity
+from shared_store import (
+    BACKEND_DIR,
+    DB_PATH,
+    LEGACY_TASKS_PATH,
+    bootstrap_from_legacy,
+    compute_priority_label,
+    ensure_datetime,
+    json_store,
+    open_shared_store,
+    task_from_cli,
+    utc_now_iso,
+)
+from storage import FlushQueue, MemoryTaskStore, TaskStore
+from task_index import SortKey, TaskIndex, TaskRecord
 
-store_lock = Lock()
-tasks_cache: List[dict] = []
+# "sqlite" (default), "json" for the snapshot + journal files, or "memory".
+STORE_BACKEND = os.environ.get("PRIORITYOS_STORE", "sqlite").lower()
+MAX_SCHEDULE_DAYS = 30
+MAX_PAGE_SIZE = 500
+SSE_HEARTBEAT_SECONDS = 15
+# How often changes other processes made to the shared store are pulled in.
+STORE_SYNC_SECONDS = 0.5
+# Ids reserved from the shared store at a time.
+ID_BLOCK_SIZE = 32
+SHARED_ID_ERROR = "Task ids are assigned by the server while the store is shared"
+# Concurrent ollama runs for captured tasks, and how long one attempt may take.
+CAPTURE_WORKERS = int(os.environ.get("PRIORITYOS_CAPTURE_WORKERS", "2"))
+CAPTURE_TIMEOUT_SECONDS = 30
+CAPTURE_RETRIES = 2
+# Milliseconds; profile requests slower than this from startup (see /api/metrics/profiler).
+PROFILE_SLOW_MS = os.environ.get("PRIORITYOS_PROFILE_SLOW_MS")
+PROFILE_DIR = BACKEND_DIR / "profiles"
+# Local ollama model behind /api/tasks/search?mode=semantic.
+EMBED_MODEL = os.environ.get("PRIORITYOS_EMBED_MODEL", "nomic-embed-text")
+# Seconds between full rescores (age and due dates move every score); 0 turns them off.
+RESCORE_SECONDS = float(os.environ.get("PRIORITYOS_RESCORE_SECONDS", "300"))
 
+tasks_cache = TaskIndex()
+schedule_index = IntervalIndex()
+task_search = TaskSearch()
+duplicates = TaskDuplicates()
+score_engine = ScoreEngine()
+hub = EventHub()
+jobs = JobQueue(workers=CAPTURE_WORKERS, timeout=CAPTURE_TIMEOUT_SECONDS, retries=CAPTURE_RETRIES)
+registry = Registry()
+request_seconds = registry.add(
+    Histogram(
+        "priorityos_request_seconds",
+        "HTTP request duration by endpoint (streams: until they close).",
+        ("method", "endpoint"),
+    )
+)
+requests_total = registry.add(
+    Counter(
+        "priorityos_requests_total",
+        "HTTP requests by endpoint and status.",
+        ("method", "endpoint", "status"),
+    )
+)
+phase_seconds = registry.add(
+    Histogram(
+        "priorityos_phase_seconds",
+        "Time in each phase: handler (until the response starts), query, serialize, "
+        "slot_search, dedupe, score, rescore, flush_wait (write queued until its batch "
+        "starts), lock_wait (for the store's write lock), persist (per batch), compact.",
+        ("phase",),
+    )
+)
+profiler = SlowRequestProfiler(PROFILE_DIR)
 
-def utc_now_iso() -> str:
-    return datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
 
+def create_store() -> TaskStore:
+    if STORE_BACKEND == "json":
+        return json_store()
+    if STORE_BACKEND == "memory":
+        return MemoryTaskStore(bootstrap_from_legacy())
+    return open_shared_store()
 
-def compute_priority_label(score: int) -> str:
-    if score >= 8:
-        return "High"
-    if score >= 4:
-        return "Medium"
-    return "Low"
 
+store = create_store()
 
-def ensure_datetime(value: Optional[str]) -> Optional[str]:
-    if value is None or value == "":
-        return None
-    if isinstance(value, datetime):
-        return value.replace(microsecond=0).isoformat() + "Z"
-    try:
-        parsed = datetime.fromisoformat(str(value).replace("Z", ""))
-        return parsed.replace(microsecond=0).isoformat() + "Z"
-    except ValueError:
-        return None
 
+def normalise_task(task: dict) -> TaskRecord:
+    score = int(task.get("priorityScore") or 5)
+    return TaskRecord(
+        {
+            **task,
+            "priorityScore": score,
+            "priorityLabel": compute_priority_label(score),
+            "createdAt": ensure_datetime(task.get("createdAt")) or utc_now_iso(),
+            "updatedAt": ensure_datetime(task.get("updatedAt")) or utc_now_iso(),
+            "scheduledStart": ensure_datetime(task.get("scheduledStart")),
+            "scheduledEnd": ensure_datetime(task.get("scheduledEnd")),
+            "dueAt": ensure_datetime(task.get("dueAt")),
+            "priorityPinned": is_pinned(task),
+            "historyCount": int(task.get("historyCount") or 0),
+        }
+    )
 
-def bootstrap_from_legacy() -> List[dict]:
-    if not LEGACY_TASKS_PATH.exists():
-        return []
 
-    with LEGACY_TASKS_PATH.open("r", encoding="utf-8") as legacy_file:
-        try:
-            legacy_tasks = legacy_file.read()
-        except OSError:
-            legacy_tasks = "[]"
+def load_store() -> List[TaskRecord]:
+    return [normalise_task(task) for task in store.load()]
 
-    try:
-        data = json.loads(legacy_tasks)
-    except ValueError:
-        data = []
-
-    tasks: List[dict] = []
-    for item in data:
-        score = item.get("priority score") or item.get("priority_score") or 5
-        created_at = ensure_datetime(item.get("created_at")) or utc_now_iso()
-        status_updated = ensure_datetime(item.get("status_update_time")) or created_at
-        status = (item.get("status") or "Incomplete").lower()
-        tasks.append(
-            {
-                "id": int(item.get("id") or len(tasks) + 1),
-                "title": item.get("text") or "Untitled task",
-                "description": item.get("text") or "Imported task",
-                "category": item.get("category") or "Administrative",
-                "priorityScore": int(score),
-                "priorityLabel": compute_priority_label(int(score)),
-                "status": "completed" if status == "complete" else status,
-                "estimatedMinutes": None,
-                "scheduledStart": None,
-                "scheduledEnd": None,
-                "rationale": None,
-                "suggestions": [],
-                "conflict": False,
-                "history": [
-                    {
-                        "at": created_at,
-                        "description": "Imported from legacy tasks.json",
-                    }
-                ],
-                "createdAt": created_at,
-                "updatedAt": status_updated,
-            }
-        )
-    return tasks
 
+def save_store() -> None:
+    store.compact(tasks_cache)
 
-def ensure_store_exists() -> None:
-    if DATA_PATH.exists():
-        return
-    tasks = bootstrap_from_legacy()
-    if not DATA_PATH.parent.exists():
-        DATA_PATH.parent.mkdir(parents=True, exist_ok=True)
-    with DATA_PATH.open("w", encoding="utf-8") as target:
-        json.dump(tasks, target, indent=2)
 
+def snapshot_task(task: dict, history: List[dict]) -> dict:
+    # Handed to the flush thread while the loop keeps mutating the original.
+    # ``history`` is the entries added by this write, for the store's archive.
+    return {**task, "history": history}
 
-def load_store() -> List[dict]:
-    ensure_store_exists()
-    with DATA_PATH.open("r", encoding="utf-8") as source:
-        try:
-            tasks = json.load(source)
-        except ValueError:
-            tasks = []
-    normalised = []
-    for task in tasks:
-        score = int(task.get("priorityScore") or 5)
-        normalised.append(
-            {
-                **task,
-                "priorityScore": score,
-                "priorityLabel": compute_priority_label(score),
-                "createdAt": ensure_datetime(task.get("createdAt")) or utc_now_iso(),
-                "updatedAt": ensure_datetime(task.get("updatedAt")) or utc_now_iso(),
-                "scheduledStart": ensure_datetime(task.get("scheduledStart")),
-                "scheduledEnd": ensure_datetime(task.get("scheduledEnd")),
-            }
-        )
-    return normalised
 
+def add_history(task: dict, description: str, at: Optional[str] = None) -> List[dict]:
+    """Count a new history entry on ``task``; the entry itself only goes to the store."""
+    task["historyCount"] = task.get("historyCount", 0) + 1
+    return [{"at": at or utc_now_iso(), "description": description}]
 
-def save_store() -> None:
-    if not DATA_PATH.parent.exists():
-        DATA_PATH.parent.mkdir(parents=True, exist_ok=True)
-    with DATA_PATH.open("w", encoding="utf-8") as target:
-        json.dump(tasks_cache, target, indent=2)
 
+def index_schedule(task: dict) -> None:
+    schedule_index.set(
+        task["id"], parse_iso(task.get("scheduledStart")), parse_iso(task.get("scheduledEnd"))
+    )
 
-tasks_cache = load_store()
+
+# Read before loading, so nothing written in between is missed by sync_store().
+synced_version = store.current_version()
+tasks_cache = TaskIndex(load_store())
+# Only a store other processes write to (the CLI agent) needs syncing.
+shared_store = store.changes_since(synced_version) is not None
+sync_task: Optional["asyncio.Task[None]"] = None
+dedupe_task: Optional["asyncio.Task[None]"] = None
+rescore_task: Optional["asyncio.Task[None]"] = None
+# Ids reserved from the shared store and not yet used, oldest first.
+reserved_ids: Deque[int] = deque()
+for cached_task in tasks_cache:
+    index_schedule(cached_task)
+if store.needs_compaction():
+    save_store()
+flusher = FlushQueue(
+    store,
+    snapshot=lambda: [dict(task) for task in tasks_cache],
+    observe=lambda phase, seconds: phase_seconds.observe(seconds, phase),
+)
+store.observe = flusher.observe
+registry.add(Gauge("priorityos_tasks", "Tasks in the store.", lambda: len(tasks_cache)))
+registry.add(
+    Gauge("priorityos_store_disk_bytes", "Size of the store's files.", lambda: store.disk_bytes())
+)
+registry.add(
+    Gauge(
+        "priorityos_store_written_bytes_total",
+        "Bytes written to the store's files by this process.",
+        lambda: store.bytes_written(),
+        kind="counter",
+    )
+)
+registry.add(
+    Gauge(
+        "priorityos_flush_batches_total",
+        "Store transactions committed by the flush queue.",
+        lambda: flusher.batches,
+        kind="counter",
+    )
+)
+registry.add(
+    Gauge(
+        "priorityos_flush_writes_total",
+        "Store calls committed by the flush queue.",
+        lambda: flusher.writes,
+        kind="counter",
+    )
+)
+registry.add(
+    Gauge("priorityos_sse_subscribers", "Connected event streams.", lambda: hub.subscriber_count)
+)
+registry.add(
+    Gauge(
+        "priorityos_jobs",
+        "Capture jobs waiting or running.",
+        lambda: {(state,): jobs.summary()[state] for state in ("queued", "running")},
+        ("state",),
+    )
+)
+registry.add(
+    Gauge(
+        "priorityos_jobs_total",
+        "Capture job outcomes and retries.",
+        lambda: {(key,): value for key, value in jobs.stats.items()},
+        ("outcome",),
+        kind="counter",
+    )
+)
 
 
 class HistoryEntry(BaseModel):
@@ -152,6 +238,9 @@ class TaskCreate(BaseModel):
     rationale: Optional[str] = None
     suggestions: Optional[List[str]] = Field(default_factory=list)
     conflict: Optional[bool] = False
+    duplicate_of: Optional[int] = Field(None, alias="duplicateOf")
+    due_at: Optional[datetime] = Field(None, alias="dueAt")
+    priority_pinned: Optional[bool] = Field(None, alias="priorityPinned")
 
     class Config:
         populate_by_name = True
@@ -169,12 +258,54 @@ class TaskUpdate(BaseModel):
     rationale: Optional[str] = None
     suggestions: Optional[List[str]] = Field(default=None)
     conflict: Optional[bool] = None
+    duplicate_of: Optional[int] = Field(None, alias="duplicateOf")
+    due_at: Optional[datetime] = Field(None, alias="dueAt")
+    priority_pinned: Optional[bool] = Field(None, alias="priorityPinned")
     history_entry: Optional[HistoryEntry] = Field(None, alias="historyEntry")
 
     class Config:
         populate_by_name = True
 
 
+class TaskBatchUpdate(TaskUpdate):
+    id: int
+
+
+class BatchRequest(BaseModel):
+    create: List[TaskCreate] = Field(default_factory=list)
+    update: List[TaskBatchUpdate] = Field(default_factory=list)
+    delete: List[int] = Field(default_factory=list)
+
+
+class CommandRequest(BaseModel):
+    message: str = Field(..., min_length=1)
+    model: Optional[str] = None
+
+
+class CaptureRequest(BaseModel):
+    text: str = Field(..., min_length=1)
+    model: Optional[str] = None
+    on_duplicate: str = Field("flag", alias="onDuplicate", regex="^(flag|merge|allow)$")
+
+
+class DedupeRequest(BaseModel):
+    apply: bool = False
+    threshold: float = Field(DUPLICATE_THRESHOLD, gt=0, le=1)
+
+
+class RescoreResponse(BaseModel):
+    rescored: int
+    ambiguous: List[int]
+    vectorized: bool
+
+
+class ScheduleBatchRequest(BaseModel):
+    task_ids: Optional[List[int]] = Field(None, alias="taskIds")
+
+    class Config:
+        populate_by_name = True
+
+
 class TaskResponse(BaseModel):
     id: int
     title: str
@@ -182,14 +313,17 @@ class TaskResponse(BaseModel):
     category: str
     priorityScore: int
     priorityLabel: str
+    priorityPinned: bool = True
     status: str
     estimatedMinutes: Optional[int]
     scheduledStart: Optional[datetime]
     scheduledEnd: Optional[datetime]
+    dueAt: Optional[datetime] = None
     rationale: Optional[str]
     suggestions: List[str]
     conflict: bool
-    history: List[HistoryEntry]
+    duplicateOf: Optional[int] = None
+    historyCount: int = 0
     createdAt: datetime
     updatedAt: datetime
 
@@ -197,6 +331,71 @@ class TaskResponse(BaseModel):
         json_encoders = {datetime: lambda dt: dt.isoformat().replace("+00:00", "Z")}
 
 
+RESPONSE_FIELDS = list(TaskResponse.__fields__)
+# Also accepted by ``fields=``; read from the store's history archive per page.
+PROJECTED_FIELDS = set(RESPONSE_FIELDS) | {"history"}
+
+
+class HistoryResponse(BaseModel):
+    id: int
+    historyCount: int
+    history: List[HistoryEntry]
+
+    class Config:
+        json_encoders = {datetime: lambda dt: dt.isoformat().replace("+00:00", "Z")}
+
+
+def encode_task(task: dict) -> bytes:
+    """Serialise a stored task exactly as ``TaskResponse`` would, without validating it.
+
+    Tasks are normalised on the way in (ISO strings, int scores), so the
+    stored values can be dumped as-is.
+    """
+    body = {name: task.get(name) for name in RESPONSE_FIELDS}
+    body["suggestions"] = task.get("suggestions") or []
+    body["priorityPinned"] = is_pinned(task)
+    body["historyCount"] = task.get("historyCount") or 0
+    return json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def task_json(task: dict) -> bytes:
+    return tasks_cache.encoded(task, encode_task)
+
+
+def task_response(task: dict, status_code: int = 200) -> Response:
+    with phase_seconds.time("serialize"):
+        body = task_json(task)
+    return Response(body, status_code=status_code, media_type="application/json")
+
+
+class BatchItemResult(BaseModel):
+    op: str
+    index: int
+    id: Optional[int] = None
+    status: int
+    task: Optional[TaskResponse] = None
+    error: Optional[str] = None
+
+
+class BatchResponse(BaseModel):
+    results: List[BatchItemResult]
+
+
+class ScheduleBatchResponse(BaseModel):
+    scheduled: List[TaskResponse]
+    unscheduled: List[int]
+
+
+class DuplicateGroup(BaseModel):
+    keep: int
+    duplicates: List[int]
+
+
+class DedupeResponse(BaseModel):
+    groups: List[DuplicateGroup]
+    merged: int
+
+
 app = FastAPI(title="PriorityOS Mock API", version="0.1.0")
 app.add_middleware(
     CORSMiddleware,
@@ -205,157 +404,1102 @@ app.add_middleware(
     allow_methods=["*"]
     ,
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
+app.add_middleware(
+    RequestMetrics,
+    seconds=request_seconds,
+    total=requests_total,
+    phases=phase_seconds,
+    profiler=profiler,
+)
+
+
+@app.on_event("startup")
+async def bind_event_hub() -> None:
+    global sync_task, dedupe_task, rescore_task
+    hub.bind(asyncio.get_running_loop())
+    jobs.start()
+    dedupe_task = asyncio.get_running_loop().create_task(warm_duplicates())
+    rescore_task = asyncio.get_running_loop().create_task(rescore_periodically())
+    if PROFILE_SLOW_MS:
+        profiler.enable(float(PROFILE_SLOW_MS) / 1000)
+    if shared_store:
+        sync_task = asyncio.get_running_loop().create_task(sync_store())
+
+
+@app.on_event("shutdown")
+async def close_store() -> None:
+    if sync_task is not None:
+        sync_task.cancel()
+    if dedupe_task is not None:
+        dedupe_task.cancel()
+    if rescore_task is not None:
+        rescore_task.cancel()
+    await jobs.stop()
+    profiler.disable()
+    await flusher.drain()
+    store.close()
 
 
 @app.get("/api/health")
-def healthcheck() -> dict:
+async def healthcheck() -> dict:
     return {"status": "ok", "time": utc_now_iso()}
 
 
+@app.get("/api/metrics")
+async def metrics() -> Response:
+    """Request, phase, store and queue metrics in the Prometheus text format."""
+    return Response(registry.render(), media_type=registry.content_type)
+
+
+class ProfilerSettings(BaseModel):
+    enabled: bool
+    threshold_ms: Optional[float] = Field(None, alias="thresholdMs", gt=0)
+
+
+def profiler_status() -> dict:
+    return {
+        "enabled": profiler.enabled,
+        "thresholdMs": profiler.threshold * 1000,
+        "written": profiler.written,
+        "directory": str(PROFILE_DIR),
+    }
+
+
+@app.get("/api/metrics/profiler")
+async def get_profiler() -> dict:
+    return profiler_status()
+
+
+@app.post("/api/metrics/profiler")
+async def set_profiler(settings: ProfilerSettings) -> dict:
+    """Turn the slow-request sampling profiler on or off.
+
+    While on, requests slower than ``thresholdMs`` leave a ``.folded`` stack
+    file in ``backend/profiles/`` (``flamegraph.pl`` or speedscope input).
+    """
+    if settings.enabled:
+        threshold = settings.threshold_ms / 1000 if settings.threshold_ms else None
+        profiler.enable(threshold)
+    else:
+        profiler.disable()
+    return profiler_status()
+
+
+def encode_cursor(key: SortKey) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> SortKey:
+    try:
+        score, title, task_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return (int(score), str(title), int(task_id))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def parse_fields(fields: str) -> List[str]:
+    names = [name.strip() for name in fields.split(",")]
+    selected = ["id"] + [name for name in names if name and name != "id"]
+    unknown = [name for name in selected if name not in PROJECTED_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {unknown}")
+    return selected
+
+
+def list_etag(request: Request) -> str:
+    # The body depends only on the store revision and the query string.
+    query_hash = zlib.crc32(request.url.query.encode("utf-8"))
+    return f'W/"{tasks_cache.revision}-{query_hash:08x}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in [value.strip() for value in header.split(",")]
+
+
+@app.get("/api/events")
+async def task_events(
+    request: Request,
+    since: Optional[int] = None,
+    last_event_id: Optional[str] = Header(None),
+) -> StreamingResponse:
+    """Server-sent events for task creates, updates, deletes and scheduling.
+
+    Each frame's id is the store revision. A reconnecting EventSource sends
+    it back as Last-Event-ID (or pass ``since``) and the missed changes are
+    replayed first; ``resync`` tells the client to refetch the list.
+    """
+    subscriber = hub.subscribe()
+    resume = since
+    if resume is None and last_event_id and last_event_id.isdigit():
+        resume = int(last_event_id)
+    backlog: List[bytes] = []
+    if resume is not None:
+        revision = tasks_cache.revision
+        changed, deleted, reset = tasks_cache.changes_since(resume)
+        if reset:
+            backlog.append(sse_frame("resync", b"{}", revision))
+        else:
+            backlog.extend(sse_frame("task.updated", task_json(task), revision) for task in changed)
+            backlog.extend(
+                sse_frame("task.deleted", json.dumps({"id": task_id}).encode("utf-8"), revision)
+                for task_id in deleted
+            )
+
+    async def stream():
+        try:
+            yield b"retry: 3000\n\n"
+            for frame in backlog:
+                yield frame
+            while True:
+                try:
+                    frame = await asyncio.wait_for(subscriber.queue.get(), SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield b": keep-alive\n\n"
+                    continue
+                yield frame
+        finally:
+            hub.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def assistant_tasks(agent: Any) -> Any:
+    if shared_store:
+        return agent.SharedTaskManager(DB_PATH)
+    return agent.TaskManager(str(LEGACY_TASKS_PATH))
+
+
+@app.post("/api/assistant/stream")
+async def stream_command(payload: CommandRequest) -> StreamingResponse:
+    """Natural-language command through the CLI agent, streamed as server-sent events.
+
+    Tokens are sent as the model produces them and tool calls run as soon as
+    they are complete, so the first bytes arrive long before the answer ends.
+    The agent works on the same tasks as the API when the store is shared
+    (SQLite), otherwise on the legacy ``tasks.json`` list.
+    """
+    agent = assistant.load_agent()
+    if agent is None:
+        raise HTTPException(status_code=503, detail="The assistant needs the ollama package")
+    return StreamingResponse(
+        # A sync iterator, so Starlette drives the blocking ollama stream in its threadpool.
+        assistant.command_frames(
+            agent, payload.message, lambda: assistant_tasks(agent), payload.model
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/assistant/stats")
+async def assistant_stats() -> dict:
+    """Plan cache hit rates and the model time they saved."""
+    agent = assistant.load_agent()
+    if agent is None:
+        raise HTTPException(status_code=503, detail="The assistant needs the ollama package")
+    return {"planCache": assistant.plan_cache(agent).summary()}
+
+
+@app.post("/api/capture", status_code=202)
+async def capture_task(payload: CaptureRequest) -> dict:
+    """Save freeform input right away as a ``processing`` task and structure it in the background.
+
+    A job (see :class:`jobs.JobQueue`) splits the input into tasks with one
+    model call, then fills in the task's title, category and priority and
+    sets it to ``incomplete``, or to ``failed`` once its retries are used
+    up. Both outcomes are added to the task's history and published as
+    ``task.updated``. Extra tasks found in the input are created alongside
+    it. Near-duplicates of open tasks are handled as ``onDuplicate`` says
+    (see ``create_task``), both for the raw text and for the structured
+    tasks; a merged raw text returns ``status: "duplicate"`` and no job.
+    """
+    agent = assistant.load_agent()
+    if agent is None:
+        raise HTTPException(status_code=503, detail="The assistant needs the ollama package")
+    if jobs.full():
+        raise HTTPException(status_code=503, detail="Too many captures are waiting; retry later")
+    await reserve_task_ids()
+    task, written, created = create_or_merge(
+        TaskCreate(title=payload.text, description=payload.text, status="processing"),
+        payload.on_duplicate,
+    )
+    if not created:
+        await written
+        return {"taskIds": [task["id"]], "jobId": None, "status": "duplicate"}
+    job = jobs.submit(
+        "capture",
+        partial(assistant.structure_capture, agent, payload.text, payload.model),
+        on_success=partial(finish_capture, task["id"], payload.on_duplicate),
+        on_failure=partial(fail_capture, task["id"]),
+    )
+    await written
+    return {"taskIds": [task["id"]], "jobId": job.id, "status": "processing"}
+
+
+async def finish_capture(task_id: int, on_duplicate: str, added: List[dict]) -> None:
+    await reserve_task_ids(len(added) - 1)
+    written = []
+    task = tasks_cache.get(task_id)
+    first, rest = added[0], added[1:]
+    if task is not None:
+        structured = task_from_cli(first, base=task)
+        existing = None
+        if on_duplicate != "allow":
+            existing = find_duplicate(structured["title"], exclude=task_id)
+        if existing is not None and on_duplicate == "merge":
+            written.append(merge_into(existing, structured["title"]))
+            written.append(apply_delete(task_id))
+        else:
+            update = {
+                "title": structured["title"],
+                "category": structured["category"],
+                "priorityScore": structured["priorityScore"],
+                "priorityPinned": False,
+                "historyEntry": {"description": "Structured by the assistant"},
+            }
+            if on_duplicate != "allow":
+                # The raw text may have looked like another task; the title decides.
+                update["duplicateOf"] = existing["id"] if existing is not None else None
+            if task["status"] == "processing":
+                update["status"] = "incomplete"
+            written.append(apply_update(task, TaskUpdate.parse_obj(update)))
+    for item in rest:
+        structured = task_from_cli(item)
+        extra = {
+            "title": structured["title"],
+            "category": structured["category"],
+            "priorityScore": structured["priorityScore"],
+            "priorityPinned": False,
+            "status": "incomplete",
+        }
+        written.append(create_or_merge(TaskCreate.parse_obj(extra), on_duplicate)[1])
+    await asyncio.gather(*written)
+
+
+async def fail_capture(task_id: int, exc: Exception) -> None:
+    task = tasks_cache.get(task_id)
+    if task is None:
+        return
+    update: dict = {
+        "historyEntry": {"description": f"The assistant could not structure this task: {exc}"}
+    }
+    if task["status"] == "processing":
+        update["status"] = "failed"
+    await apply_update(task, TaskUpdate.parse_obj(update))
+
+
+@app.get("/api/jobs")
+async def job_stats() -> dict:
+    return jobs.summary()
+
+
+@app.get("/api/jobs/{job_id}")
+async def job_status(job_id: int) -> dict:
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+@app.get("/api/tasks/changes")
+async def task_changes(since: int = Query(..., ge=0)) -> Response:
+    """Tasks changed and ids deleted after revision ``since``.
+
+    ``reset: true`` means ``since`` is unknown to this process (older than its
+    start or its oldest remembered deletion, or ahead of it) and ``changed``
+    holds every task instead.
+    """
+    revision = tasks_cache.revision
+    changed, deleted, reset = tasks_cache.changes_since(since)
+    body = b"".join(
+        [
+            b'{"revision":%d,"reset":%s,"deleted":' % (revision, b"true" if reset else b"false"),
+            json.dumps(deleted).encode("utf-8"),
+            b',"changed":[',
+            b",".join(task_json(task) for task in changed),
+            b"]}",
+        ]
+    )
+    return Response(body, media_type="application/json")
+
+
+@app.get("/api/tasks/search")
+async def search_tasks(
+    q: str = Query(..., min_length=1),
+    mode: str = Query("text", regex="^(text|semantic)$"),
+    status: Optional[List[str]] = Query(None),
+    category: Optional[List[str]] = Query(None),
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+) -> Response:
+    """Tasks ranked by relevance to ``q``: ``{"mode", "results": [{"score", "task"}]}``.
+
+    ``text`` ranks words in the title, description, rationale and history
+    with BM25. ``semantic`` ranks by cosine similarity of embeddings from a
+    local ollama model (``PRIORITYOS_EMBED_MODEL``), so it also finds tasks
+    phrased differently; tasks are embedded on the first semantic search
+    and again only when their text changes.
+    """
+    statuses = {value.lower() for value in status} if status else None
+    categories = set(category) if category else None
+
+    def accept(task_id: int) -> bool:
+        task = tasks_cache.get(task_id)
+        return (
+            task is not None
+            and (statuses is None or task.get("status") in statuses)
+            and (categories is None or task.get("category") in categories)
+        )
+
+    filtered = accept if statuses is not None or categories is not None else None
+    with phase_seconds.time("query"):
+        stale = task_search.sync(tasks_cache)
+    if stale:
+        # Queued behind pending writes, so every entry counted is in the archive.
+        histories = await flusher.submit(store.histories, list(stale))
+        task_search.store_histories(tasks_cache, stale, histories)
+    if mode == "text":
+        with phase_seconds.time("query"):
+            ranked = task_search.search(q, limit, filtered)
+    else:
+        ranked = await semantic_search(q, limit, filtered)
+    with phase_seconds.time("serialize"):
+        results = [
+            b'{"score":%s,"task":%s}' % (repr(round(score, 4)).encode(), task_json(task))
+            for task, score in ((tasks_cache.get(task_id), score) for task_id, score in ranked)
+            if task is not None
+        ]
+        body = b'{"mode":"%s","results":[%s]}' % (mode.encode(), b",".join(results))
+    return Response(body, media_type="application/json")
+
+
+async def semantic_search(
+    query: str, limit: int, accept: Optional[Callable[[int], bool]]
+) -> List[Tuple[int, float]]:
+    embed = ollama_embedder(EMBED_MODEL)
+    if embed is None:
+        raise HTTPException(status_code=503, detail="Semantic search needs the ollama package")
+    missing = task_search.unembedded(tasks_cache)
+    try:
+        vectors = await asyncio.to_thread(embed, [query] + [text for _, text in missing])
+    except Exception as exc:  # ollama not running, or the model is not pulled
+        raise HTTPException(
+            status_code=503, detail=f"Embedding model {EMBED_MODEL} unavailable: {exc}"
+        )
+    task_search.store_vectors(missing, vectors[1:])
+    with phase_seconds.time("query"):
+        return await asyncio.to_thread(
+            rank_by_similarity, vectors[0], task_search.vectors(accept), limit
+        )
+
+
 @app.get("/api/tasks", response_model=List[TaskResponse])
-def list_tasks() -> List[TaskResponse]:
-    with store_lock:
-        ordered = sorted(
-            tasks_cache,
-            key=lambda task: (-int(task.get("priorityScore", 0)), task.get("title", ""))
+async def list_tasks(
+    request: Request,
+    status: Optional[List[str]] = Query(None),
+    category: Optional[List[str]] = Query(None),
+    min_priority: Optional[int] = Query(None, alias="minPriority", ge=0, le=10),
+    max_priority: Optional[int] = Query(None, alias="maxPriority", ge=0, le=10),
+    scheduled_from: Optional[datetime] = Query(None, alias="scheduledFrom"),
+    scheduled_to: Optional[datetime] = Query(None, alias="scheduledTo"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+) -> Response:
+    selected = parse_fields(fields) if fields else None
+    etag = list_etag(request)
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    with phase_seconds.time("query"):
+        tasks, next_after = tasks_cache.query(
+            statuses=[value.lower() for value in status] if status else None,
+            categories=category or None,
+            min_score=min_priority,
+            max_score=max_priority,
+            scheduled_from=ensure_datetime(scheduled_from),
+            scheduled_to=ensure_datetime(scheduled_to),
+            after=decode_cursor(cursor) if cursor else None,
+            limit=limit,
         )
-        return [TaskResponse.parse_obj(task) for task in ordered]
+    histories = None
+    if selected is not None and "history" in selected:
+        # Queued behind pending writes, like any other store read.
+        histories = await flusher.submit(store.histories, [task["id"] for task in tasks])
+    with phase_seconds.time("serialize"):
+        if selected is not None:
+            # Stored values are already normalised, so projections skip pydantic.
+            content = [{name: task.get(name) for name in selected} for task in tasks]
+            if histories is not None:
+                for item in content:
+                    item["history"] = histories.get(item["id"], [])
+        else:
+            body = b"[" + b",".join(task_json(task) for task in tasks) + b"]"
+    headers = {"ETag": etag}
+    if next_after:
+        headers["X-Next-Cursor"] = encode_cursor(next_after)
+    if selected is not None:
+        return JSONResponse(content, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+async def reserve_task_ids(count: int = 1) -> None:
+    """Have ``count`` ids on hand for :func:`next_task_id`; call before staging creates.
+
+    The CLI creates tasks in the same database, so a shared store hands out
+    the ids; blocks are claimed in a worker thread, since that takes the
+    database's write lock.
+    """
+    if not shared_store:
+        return
+    while len(reserved_ids) < count:
+        size = max(ID_BLOCK_SIZE, count - len(reserved_ids))
+        first = await asyncio.to_thread(store.reserve_ids, size)
+        reserved_ids.extend(range(first, first + size))
 
 
 def next_task_id() -> int:
-    existing_ids = {task["id"] for task in tasks_cache}
-    candidate = max(existing_ids, default=0) + 1
-    while candidate in existing_ids:
-        candidate += 1
-    return candidate
+    if not shared_store:
+        return tasks_cache.next_id()
+    return reserved_ids.popleft()
+
+
+async def sync_store() -> None:
+    """Pull changes other processes made to the shared store into the cache."""
+    global synced_version
+    while True:
+        await asyncio.sleep(STORE_SYNC_SECONDS)
+        # Our own writes land first, so the read sees all of them; it runs
+        # outside the write batches and takes no write lock.
+        await flusher.drain()
+        revision = tasks_cache.revision
+        try:
+            changed, deleted, version = await asyncio.to_thread(
+                store.changes_since, synced_version
+            )
+        except Exception:  # e.g. the database stayed locked; retry next tick
+            continue
+        synced_version = version
+        apply_external_changes(changed, deleted, revision)
+
+
+def apply_external_changes(changed: List[dict], deleted: List[int], revision: int) -> None:
+    # Tasks changed here after the read was queued are newer than what it saw.
+    for stored in changed:
+        task_id = int(stored["id"])
+        if tasks_cache.changed_after(task_id, revision):
+            continue
+        task = normalise_task(stored)
+        current = tasks_cache.get(task_id)
+        if current == task:
+            continue
+        if current is None:
+            tasks_cache.add(task)
+        else:
+            current.clear()
+            current.update(task)
+            tasks_cache.reindex(current)
+        index_schedule(task)
+        publish_change("task.created" if current is None else "task.updated", task_id, task)
+    for task_id in deleted:
+        if task_id in tasks_cache and not tasks_cache.changed_after(task_id, revision):
+            tasks_cache.remove(task_id)
+            schedule_index.discard(task_id)
+            publish_change("task.deleted", task_id)
+
+
+def event_data(task_id: int, task: Optional[dict] = None) -> bytes:
+    return task_json(task) if task is not None else json.dumps({"id": task_id}).encode("utf-8")
+
+
+def publish_change(event: str, task_id: int, task: Optional[dict] = None) -> None:
+    """Publish a change that is already in the store (see :func:`commit` for our own writes)."""
+    if hub.subscriber_count:
+        hub.publish(event, event_data(task_id, task), tasks_cache.revision)
+
+
+class TaskChange:
+    """A mutation made to ``tasks_cache`` whose store write is still queued.
+
+    It keeps copies of the task before and after (None when it did not
+    exist or was deleted), the store call, and the event to publish once
+    that call is written, encoded now so later changes do not leak into it.
+    """
+
+    def __init__(
+        self,
+        event: str,
+        task_id: int,
+        before: Optional[dict],
+        task: Optional[dict],
+        write: Callable[..., Any],
+        *args: Any,
+    ) -> None:
+        self.event = event
+        self.task_id = task_id
+        self.before = before
+        self.after = dict(task) if task is not None else None
+        self.call = (write, args)
+        self.revision = tasks_cache.revision
+        self.data = event_data(task_id, task) if hub.subscriber_count else None
+
+
+def commit(changes: List[TaskChange]) -> "asyncio.Future[List[Any]]":
+    """Queue the changes' store writes as one unit.
+
+    Their events are published once the writes are in the store. If the
+    unit fails, every change in it is undone in the cache instead and the
+    returned future raises.
+    """
+    written = flusher.submit_all([change.call for change in changes])
+
+    def settle(future: "asyncio.Future[List[Any]]") -> None:
+        if future.cancelled() or future.exception() is not None:
+            if not failed_changes:
+                # After every failure of this flush has been collected.
+                asyncio.get_running_loop().call_soon(revert_failed)
+            failed_changes.extend(changes)
+            return
+        for change in changes:
+            if change.data is not None:
+                hub.publish(change.event, change.data, change.revision)
+
+    written.add_done_callback(settle)
+    return written
+
+
+failed_changes: List[TaskChange] = []
+
+
+def revert_failed() -> None:
+    # Newest first, so a field several failed changes set ends at its value before all of them.
+    changes = failed_changes[:]
+    failed_changes.clear()
+    for change in reversed(changes):
+        revert(change)
+
+
+def revert(change: TaskChange) -> None:
+    """Undo ``change`` in the cache, keeping what later changes to the task did."""
+    task_id = change.task_id
+    # Events for later changes may have carried this one's values; send the fix.
+    published = tasks_cache.changed_after(task_id, change.revision)
+    current = tasks_cache.get(task_id)
+    if change.after is None:
+        if current is not None or change.before is None:
+            return
+        current = TaskRecord(change.before)
+        tasks_cache.add(current)
+        index_schedule(current)
+        if published:
+            publish_change("task.created", task_id, current)
+        return
+    if current is None:
+        return
+    if change.before is None:
+        tasks_cache.remove(task_id)
+        schedule_index.discard(task_id)
+        if published:
+            publish_change("task.deleted", task_id)
+        return
+    before, after = change.before, change.after
+    for key in set(before) | set(after):
+        if key == "historyCount" or before.get(key) == after.get(key):
+            continue
+        if current.get(key) != after.get(key):
+            continue  # set again since; that write decides
+        if key in before:
+            current[key] = before[key]
+        else:
+            del current[key]
+    added = (after.get("historyCount") or 0) - (before.get("historyCount") or 0)
+    current["historyCount"] = max(0, (current.get("historyCount") or 0) - added)
+    tasks_cache.reindex(current)
+    index_schedule(current)
+    if published:
+        publish_change("task.updated", task_id, current)
+
+
+def stage_create(payload: TaskCreate) -> Tuple[dict, TaskChange]:
+    """Add the new task to the cache; its write is queued by :func:`commit`."""
+    task_id = payload.id
+    if task_id is None or task_id in tasks_cache or shared_store:
+        task_id = next_task_id()
+
+    now_iso = utc_now_iso()
+    score = payload.priority_score or 5
+    pinned = payload.priority_pinned
+    if pinned is None:
+        pinned = "priority_score" in payload.__fields_set__
+    task = {
+        "id": task_id,
+        "title": payload.title,
+        "description": payload.description or payload.title,
+        "category": payload.category or "Administrative",
+        "priorityScore": score,
+        "priorityLabel": compute_priority_label(score),
+        "priorityPinned": pinned,
+        "status": (payload.status or "processing").lower(),
+        "estimatedMinutes": payload.estimated_minutes,
+        "scheduledStart": ensure_datetime(payload.scheduled_start),
+        "scheduledEnd": ensure_datetime(payload.scheduled_end),
+        "dueAt": ensure_datetime(payload.due_at),
+        "rationale": payload.rationale,
+        "suggestions": payload.suggestions or [],
+        "conflict": bool(payload.conflict),
+        "duplicateOf": payload.duplicate_of,
+        "historyCount": 0,
+        "createdAt": now_iso,
+        "updatedAt": now_iso,
+    }
+    history = add_history(task, "Task captured through API", now_iso)
+    task = TaskRecord(task)
+    auto_score(task)
+    tasks_cache.add(task)
+    index_schedule(task)
+    change = TaskChange(
+        "task.created", task_id, None, task, store.put, snapshot_task(task, history)
+    )
+    return task, change
+
+
+def apply_create(payload: TaskCreate) -> Tuple[dict, "asyncio.Future[List[Any]]"]:
+    task, change = stage_create(payload)
+    return task, commit([change])
+
+
+def stage_update(task: dict, payload: TaskUpdate) -> TaskChange:
+    before = dict(task)
+    updates = payload.dict(exclude_unset=True, by_alias=True)
+    score = updates.get("priorityScore")
+    if score is not None:
+        task["priorityScore"] = int(score)
+        task["priorityLabel"] = compute_priority_label(int(score))
+    if updates.get("priorityPinned") is not None:
+        task["priorityPinned"] = updates["priorityPinned"]
+    elif score is not None:
+        # A score set by hand stays until the task is unpinned.
+        task["priorityPinned"] = True
+    if updates.get("title"):
+        task["title"] = updates["title"]
+    if updates.get("description"):
+        task["description"] = updates["description"]
+    if updates.get("category"):
+        task["category"] = updates["category"]
+    if updates.get("status"):
+        task["status"] = updates["status"].lower()
+    if "estimatedMinutes" in updates:
+        task["estimatedMinutes"] = updates["estimatedMinutes"]
+    if "scheduledStart" in updates:
+        task["scheduledStart"] = ensure_datetime(updates["scheduledStart"])
+    if "scheduledEnd" in updates:
+        task["scheduledEnd"] = ensure_datetime(updates["scheduledEnd"])
+    if "dueAt" in updates:
+        task["dueAt"] = ensure_datetime(updates["dueAt"])
+    if "rationale" in updates:
+        task["rationale"] = updates["rationale"]
+    if "suggestions" in updates and updates["suggestions"] is not None:
+        task["suggestions"] = updates["suggestions"]
+    if updates.get("conflict") is not None:
+        task["conflict"] = bool(updates["conflict"])
+    if "duplicateOf" in updates:
+        task["duplicateOf"] = updates["duplicateOf"]
+    history: List[dict] = []
+    if payload.history_entry:
+        history = add_history(
+            task,
+            payload.history_entry.description,
+            ensure_datetime(payload.history_entry.at),
+        )
+    task["updatedAt"] = utc_now_iso()
+    auto_score(task)
+    tasks_cache.reindex(task)
+    index_schedule(task)
+    snapshot = snapshot_task(task, history)
+    return TaskChange("task.updated", task["id"], before, task, store.patch, snapshot, before, 0)
+
+
+def apply_update(task: dict, payload: TaskUpdate) -> "asyncio.Future[List[Any]]":
+    return commit([stage_update(task, payload)])
+
+
+def stage_delete(task_id: int) -> TaskChange:
+    task = tasks_cache.remove(task_id)
+    schedule_index.discard(task_id)
+    before = dict(task) if task is not None else None
+    return TaskChange("task.deleted", task_id, before, None, store.delete, task_id)
+
+
+def apply_delete(task_id: int) -> "asyncio.Future[List[Any]]":
+    return commit([stage_delete(task_id)])
+
+
+def auto_score(task: dict) -> None:
+    """Score an open, unpinned task with the local engine (see ``scoring.py``).
+
+    Only this task is scored. When the engine has nothing to go on (no due
+    date, unknown category) the score the task already has stays; that is
+    the only case where the assistant's suggested score is kept.
+    """
+    if not engine_owns(task):
+        return
+    with phase_seconds.time("score"):
+        score = score_task(task)
+    if score is not None:
+        task["priorityScore"] = score
+        task["priorityLabel"] = compute_priority_label(score)
+
+
+async def rescore_tasks() -> Tuple[int, List[int]]:
+    """Apply the engine's scores to every open, unpinned task whose score moved.
+
+    Returns how many moved and the ids the engine could not score.
+    """
+    with phase_seconds.time("rescore"):
+        score_engine.sync(tasks_cache)
+        moved, ambiguous = score_engine.rescore()
+    writes = []
+    for task_id, score in moved:
+        update = TaskUpdate.parse_obj({"priorityScore": score, "priorityPinned": False})
+        writes.append(apply_update(tasks_cache.get(task_id), update))
+    await asyncio.gather(*writes)
+    return len(moved), ambiguous
+
+
+async def rescore_periodically() -> None:
+    global score_engine
+    # The first load parses every task's dates; keep it off the loop.
+    revision = tasks_cache.revision
+    score_engine = await asyncio.to_thread(build_engine, list(tasks_cache), revision)
+    while RESCORE_SECONDS > 0:
+        try:
+            await rescore_tasks()
+        except Exception:  # e.g. the store failed a write; try again next time
+            pass
+        await asyncio.sleep(RESCORE_SECONDS)
+
+
+async def warm_duplicates() -> None:
+    """Build the duplicate index from a snapshot in a thread so big stores do not block the loop."""
+    revision = tasks_cache.revision
+    index = await asyncio.to_thread(build_index, open_titles(list(tasks_cache)))
+    duplicates.ready(index, revision)
+
+
+def find_duplicate(title: str, exclude: Optional[int] = None) -> Optional[dict]:
+    with phase_seconds.time("dedupe"):
+        task_id = duplicates.find(tasks_cache, title, exclude)
+    return tasks_cache.get(task_id) if task_id is not None else None
+
+
+def merge_into(existing: dict, title: str) -> "asyncio.Future[List[Any]]":
+    entry = {"historyEntry": {"description": f"Captured again: {title}"}}
+    return apply_update(existing, TaskUpdate.parse_obj(entry))
+
+
+def create_or_merge(
+    payload: TaskCreate, on_duplicate: str
+) -> Tuple[dict, "asyncio.Future[List[Any]]", bool]:
+    """Create a task unless ``on_duplicate`` merges it into a near-duplicate; True if created."""
+    if on_duplicate != "allow":
+        existing = find_duplicate(payload.title)
+        if existing is not None:
+            if on_duplicate == "merge":
+                return existing, merge_into(existing, payload.title), False
+            payload.duplicate_of = existing["id"]
+    task, written = apply_create(payload)
+    return task, written, True
 
 
 @app.post("/api/tasks", response_model=TaskResponse, status_code=201)
-def create_task(payload: TaskCreate) -> TaskResponse:
-    with store_lock:
-        task_id = payload.id
-        existing_ids = {task["id"] for task in tasks_cache}
-        if task_id is None or task_id in existing_ids:
-            task_id = next_task_id()
-
-        now_iso = utc_now_iso()
-        score = payload.priority_score or 5
-        task = {
-            "id": task_id,
-            "title": payload.title,
-            "description": payload.description or payload.title,
-            "category": payload.category or "Administrative",
-            "priorityScore": score,
-            "priorityLabel": compute_priority_label(score),
-            "status": (payload.status or "processing").lower(),
-            "estimatedMinutes": payload.estimated_minutes,
-            "scheduledStart": ensure_datetime(payload.scheduled_start),
-            "scheduledEnd": ensure_datetime(payload.scheduled_end),
-            "rationale": payload.rationale,
-            "suggestions": payload.suggestions or [],
-            "conflict": bool(payload.conflict),
-            "history": [
-                {
-                    "at": now_iso,
-                    "description": "Task captured through API",
-                }
-            ],
-            "createdAt": now_iso,
-            "updatedAt": now_iso,
-        }
-        tasks_cache.append(task)
-        save_store()
-        return TaskResponse.parse_obj(task)
+async def create_task(
+    payload: TaskCreate,
+    on_duplicate: str = Query("flag", alias="onDuplicate", regex="^(flag|merge|allow)$"),
+) -> Response:
+    """Create a task, checking its title against open tasks first.
+
+    A near-duplicate (MinHash similarity, see ``dedupe.py``) is handled as
+    ``onDuplicate`` says: ``flag`` creates the task with ``duplicateOf`` set
+    to the existing task's id, ``merge`` creates nothing and returns the
+    existing task (200) with the capture noted in its history, ``allow``
+    skips the check.
+    """
+    if shared_store and payload.id is not None:
+        raise HTTPException(status_code=409, detail=SHARED_ID_ERROR)
+    await reserve_task_ids()
+    task, written, created = create_or_merge(payload, on_duplicate)
+    response = task_response(task, status_code=201 if created else 200)
+    await written
+    return response
 
 
 @app.patch("/api/tasks/{task_id}", response_model=TaskResponse)
-def update_task(task_id: int, payload: TaskUpdate) -> TaskResponse:
-    with store_lock:
-        for index, task in enumerate(tasks_cache):
-            if task["id"] != task_id:
-                continue
-
-            updates = payload.dict(exclude_unset=True, by_alias=True)
-            score = updates.get("priorityScore")
-            if score is not None:
-                task["priorityScore"] = int(score)
-                task["priorityLabel"] = compute_priority_label(int(score))
-            if updates.get("title"):
-                task["title"] = updates["title"]
-            if updates.get("description"):
-                task["description"] = updates["description"]
-            if updates.get("category"):
-                task["category"] = updates["category"]
-            if updates.get("status"):
-                task["status"] = updates["status"].lower()
-            if "estimatedMinutes" in updates:
-                task["estimatedMinutes"] = updates["estimatedMinutes"]
-            if "scheduledStart" in updates:
-                task["scheduledStart"] = ensure_datetime(updates["scheduledStart"])
-            if "scheduledEnd" in updates:
-                task["scheduledEnd"] = ensure_datetime(updates["scheduledEnd"])
-            if "rationale" in updates:
-                task["rationale"] = updates["rationale"]
-            if "suggestions" in updates and updates["suggestions"] is not None:
-                task["suggestions"] = updates["suggestions"]
-            if updates.get("conflict") is not None:
-                task["conflict"] = bool(updates["conflict"])
-            if payload.history_entry:
-                entry_time = ensure_datetime(payload.history_entry.at) or utc_now_iso()
-                task.setdefault("history", []).append(
-                    {
-                        "at": entry_time,
-                        "description": payload.history_entry.description,
-                    }
-                )
-            task["updatedAt"] = utc_now_iso()
-            tasks_cache[index] = task
-            save_store()
-            return TaskResponse.parse_obj(task)
+async def update_task(task_id: int, payload: TaskUpdate) -> Response:
+    task = tasks_cache.get(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
 
-    raise HTTPException(status_code=404, detail="Task not found")
+    written = apply_update(task, payload)
+    response = task_response(task)
+    await written
+    return response
 
 
-@app.post("/api/tasks/{task_id}/auto_schedule", response_model=TaskResponse)
-def auto_schedule(task_id: int, minutes: int = 30) -> TaskResponse:
-    with store_lock:
-        task = next((item for item in tasks_cache if item["id"] == task_id), None)
-        if not task:
-            raise HTTPException(status_code=404, detail="Task not found")
-
-        work_start = datetime.utcnow().replace(hour=8, minute=0, second=0, microsecond=0)
-        work_end = work_start.replace(hour=18)
-        occupied = []
-        for existing in tasks_cache:
-            start_iso = ensure_datetime(existing.get("scheduledStart"))
-            end_iso = ensure_datetime(existing.get("scheduledEnd"))
-            if not start_iso or not end_iso:
-                continue
-            start_dt = datetime.fromisoformat(start_iso.replace("Z", ""))
-            end_dt = datetime.fromisoformat(end_iso.replace("Z", ""))
-            occupied.append((start_dt, end_dt))
-        candidate = work_start
-        duration = timedelta(minutes=minutes or task.get("estimatedMinutes") or 30)
-        while candidate + duration <= work_end:
-            candidate_end = candidate + duration
-            overlaps = any(
-                start < candidate_end and end > candidate
-                for start, end in occupied
+@app.get("/api/tasks/{task_id}/history", response_model=HistoryResponse)
+async def task_history(task_id: int, limit: Optional[int] = Query(None, ge=1)) -> dict:
+    """A task's history entries, oldest first; ``limit`` keeps only the newest ones.
+
+    Tasks in memory only count their history (``historyCount``); the
+    entries are read from the store's archive here, behind any queued
+    writes so a just-added entry is included.
+    """
+    task = tasks_cache.get(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    entries = await flusher.submit(store.history, task_id, limit)
+    return {"id": task_id, "historyCount": task.get("historyCount") or 0, "history": entries}
+
+
+@app.delete("/api/tasks/{task_id}", status_code=204)
+async def delete_task(task_id: int) -> Response:
+    if task_id not in tasks_cache:
+        raise HTTPException(status_code=404, detail="Task not found")
+    await apply_delete(task_id)
+    return Response(status_code=204)
+
+
+@app.post("/api/tasks/batch", response_model=BatchResponse)
+async def batch_tasks(payload: BatchRequest) -> Response:
+    # All-or-nothing: every item is checked before anything is applied, and a
+    # failing batch is rejected with 409 and per-item results.
+    errors: List[BatchItemResult] = []
+    if shared_store:
+        for index, item in enumerate(payload.create):
+            if item.id is not None:
+                errors.append(
+                    BatchItemResult(
+                        op="create", index=index, id=item.id, status=409, error=SHARED_ID_ERROR
+                    )
+                )
+    deleting = set()
+    for index, task_id in enumerate(payload.delete):
+        if task_id not in tasks_cache or task_id in deleting:
+            errors.append(
+                BatchItemResult(op="delete", index=index, id=task_id, status=404, error="Task not found")
             )
-            if not overlaps:
-                break
-            candidate = candidate + timedelta(minutes=30)
-
-        task["scheduledStart"] = ensure_datetime(candidate)
-        task["scheduledEnd"] = ensure_datetime(candidate + duration)
-        task["status"] = "scheduled"
-        task.setdefault("history", []).append(
-            {
-                "at": utc_now_iso(),
-                "description": "Auto-scheduled via backend endpoint",
-            }
+        deleting.add(task_id)
+    for index, item in enumerate(payload.update):
+        if item.id not in tasks_cache:
+            errors.append(
+                BatchItemResult(op="update", index=index, id=item.id, status=404, error="Task not found")
+            )
+        elif item.id in deleting:
+            errors.append(
+                BatchItemResult(
+                    op="update", index=index, id=item.id, status=409, error="Task is also being deleted"
+                )
+            )
+    if errors:
+        raise HTTPException(
+            status_code=409,
+            detail={"results": [error.dict(exclude_none=True) for error in errors]},
         )
-        task["updatedAt"] = utc_now_iso()
-        save_store()
-        return TaskResponse.parse_obj(task)
+
+    # Every item is applied to the cache, then written as one unit: the store
+    # commits all of it or none, and a failed commit undoes the whole batch.
+    await reserve_task_ids(len(payload.create))
+    changes: List[TaskChange] = []
+    results: List[bytes] = []
+    for index, item in enumerate(payload.create):
+        task, change = stage_create(item)
+        changes.append(change)
+        results.append(batch_result("create", index, task["id"], 201, task))
+    for index, item in enumerate(payload.update):
+        task = tasks_cache.get(item.id)
+        changes.append(stage_update(task, item))
+        results.append(batch_result("update", index, item.id, 200, task))
+    for index, task_id in enumerate(payload.delete):
+        changes.append(stage_delete(task_id))
+        results.append(batch_result("delete", index, task_id, 204))
+    await commit(changes)
+    body = b'{"results":[' + b",".join(results) + b"]}"
+    return Response(body, media_type="application/json")
+
+
+def batch_result(
+    op: str, index: int, task_id: int, status: int, task: Optional[dict] = None
+) -> bytes:
+    # A BatchItemResult, with the task encoded as the single-task endpoints send it.
+    head = json.dumps({"op": op, "index": index, "id": task_id, "status": status})
+    task_body = task_json(task) if task is not None else b"null"
+    return head[:-1].encode("utf-8") + b', "task": ' + task_body + b', "error": null}'
+
+
+@app.post("/api/tasks/rescore", response_model=RescoreResponse)
+async def rescore() -> RescoreResponse:
+    """Recompute the priority of every open, unpinned task now.
+
+    Scores come from due date, estimated minutes, category and age, over
+    all tasks at once (NumPy when installed). ``ambiguous`` lists the tasks
+    with neither a due date nor a known category; they keep their score.
+    """
+    rescored, ambiguous = await rescore_tasks()
+    return RescoreResponse(
+        rescored=rescored, ambiguous=ambiguous, vectorized=score_engine.vectorized
+    )
+
+
+@app.post("/api/tasks/dedupe", response_model=DedupeResponse)
+async def dedupe_tasks(payload: DedupeRequest) -> DedupeResponse:
+    """Find groups of near-duplicate open tasks; with ``apply``, merge each group.
+
+    The oldest task of a group is kept. It takes the group's highest
+    priority and a history entry naming the merged tasks, and the others
+    are deleted, all in one flush.
+    """
+    titles = open_titles(list(tasks_cache))
+    groups = await asyncio.to_thread(duplicate_groups, titles, payload.threshold)
+    result = [DuplicateGroup(keep=group[0], duplicates=group[1:]) for group in groups]
+    if not payload.apply:
+        return DedupeResponse(groups=result, merged=0)
+    writes = []
+    count = 0
+    for group in result:
+        keep = tasks_cache.get(group.keep)
+        # Tasks can change while the groups are computed.
+        merged = [tasks_cache.get(task_id) for task_id in group.duplicates]
+        merged = [task for task in merged if task is not None]
+        if keep is None or not merged:
+            continue
+        names = "; ".join(f"#{task['id']} {task['title']}" for task in merged)
+        update = {
+            "priorityScore": max(task["priorityScore"] for task in [keep] + merged),
+            "historyEntry": {"description": f"Merged duplicates: {names}"},
+        }
+        writes.append(apply_update(keep, TaskUpdate.parse_obj(update)))
+        writes.extend(apply_delete(task["id"]) for task in merged)
+        count += len(merged)
+    await asyncio.gather(*writes)
+    return DedupeResponse(groups=result, merged=count)
+
+
+def check_work_hours(work_start: int, work_end: int) -> None:
+    if work_start >= work_end:
+        raise HTTPException(status_code=422, detail="workStart must be before workEnd")
+
+
+def schedule_task(
+    task: dict,
+    minutes: Optional[int],
+    days: int,
+    work_start: int,
+    work_end: int,
+) -> Optional["asyncio.Future[List[Any]]"]:
+    """Place ``task`` in the first free slot and record it; None if nothing fits.
+
+    Without ``minutes`` the task's estimate is used, or 30 minutes.
+    """
+    before = dict(task)
+    # A task being rescheduled must not be blocked by its own current slot.
+    schedule_index.discard(task["id"])
+    duration = timedelta(minutes=minutes or task.get("estimatedMinutes") or 30)
+    with phase_seconds.time("slot_search"):
+        candidate = schedule_index.find_slot(
+            datetime.utcnow(),
+            duration,
+            days=days,
+            work_start_hour=work_start,
+            work_end_hour=work_end,
+        )
+    if candidate is None:
+        index_schedule(task)
+        return None
+
+    task["scheduledStart"] = ensure_datetime(candidate)
+    task["scheduledEnd"] = ensure_datetime(candidate + duration)
+    task["status"] = "scheduled"
+    history = add_history(task, "Auto-scheduled via backend endpoint")
+    task["updatedAt"] = utc_now_iso()
+    tasks_cache.reindex(task)
+    schedule_index.set(task["id"], candidate, candidate + duration)
+    snapshot = snapshot_task(task, history)
+    change = TaskChange(
+        "task.scheduled", task["id"], before, task, store.patch, snapshot, before, 0
+    )
+    return commit([change])
+
+
+@app.post("/api/tasks/auto_schedule", response_model=ScheduleBatchResponse)
+async def auto_schedule_batch(
+    payload: ScheduleBatchRequest,
+    minutes: Optional[int] = Query(None, ge=1),
+    days: int = Query(1, ge=1, le=MAX_SCHEDULE_DAYS),
+    work_start: int = Query(8, alias="workStart", ge=0, le=23),
+    work_end: int = Query(18, alias="workEnd", ge=1, le=24),
+) -> Response:
+    check_work_hours(work_start, work_end)
+    writes = []
+    scheduled: List[dict] = []
+    unscheduled: List[int] = []
+    if payload.task_ids is None:
+        candidates = [
+            task
+            for task in tasks_cache.ordered()
+            if not task.get("scheduledStart") and task.get("status") != "completed"
+        ]
+    else:
+        candidates = [tasks_cache.get(task_id) for task_id in payload.task_ids]
+        missing = [
+            task_id for task_id, task in zip(payload.task_ids, candidates) if task is None
+        ]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Tasks not found: {missing}")
+    for task in candidates:
+        written = schedule_task(task, minutes, days, work_start, work_end)
+        if written is None:
+            unscheduled.append(task["id"])
+            continue
+        writes.append(written)
+        scheduled.append(task)
+    # Tasks encoded as the single-task endpoints send them.
+    body = b"".join(
+        [
+            b'{"scheduled":[',
+            b",".join(task_json(task) for task in scheduled),
+            b'],"unscheduled":',
+            json.dumps(unscheduled).encode("utf-8"),
+            b"}",
+        ]
+    )
+    await asyncio.gather(*writes)
+    return Response(body, media_type="application/json")
+
+
+@app.post("/api/tasks/{task_id}/auto_schedule", response_model=TaskResponse)
+async def auto_schedule(
+    task_id: int,
+    minutes: Optional[int] = Query(None, ge=1),
+    days: int = Query(1, ge=1, le=MAX_SCHEDULE_DAYS),
+    work_start: int = Query(8, alias="workStart", ge=0, le=23),
+    work_end: int = Query(18, alias="workEnd", ge=1, le=24),
+) -> Response:
+    check_work_hours(work_start, work_end)
+    task = tasks_cache.get(task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    written = schedule_task(task, minutes, days, work_start, work_end)
+    if written is None:
+        raise HTTPException(status_code=409, detail="No free slot within the scheduling horizon")
+    response = task_response(task)
+    await written
+    return response
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import json
+import sys
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Callable, Iterator, List, Optional
+
+from events import sse_frame
+
+ROOT = Path(__file__).resolve().parent.parent
+SYSTEM_PROMPT_PATH = ROOT / "system_prompt.md"
+# Shared with the CLI, which keeps its plan cache in the same file.
+PLAN_CACHE_PATH = ROOT / "plan_cache.json"
+
+_plan_cache = None
+
+
+def load_agent() -> Optional[ModuleType]:
+    """The CLI's ``task_prioritizer`` module, or None when ollama is not installed."""
+    if str(ROOT) not in sys.path:
+        sys.path.append(str(ROOT))
+    try:
+        import task_prioritizer
+    except ImportError:
+        return None
+    return task_prioritizer
+
+
+def plan_cache(agent: ModuleType):
+    global _plan_cache
+    if _plan_cache is None:
+        _plan_cache = agent.PlanCache(str(PLAN_CACHE_PATH))
+    return _plan_cache
+
+
+def command_frames(
+    agent: ModuleType,
+    message: str,
+    open_tasks: Callable[[], Any],
+    model: Optional[str] = None,
+) -> Iterator[bytes]:
+    """Run one command through the agent, yielding SSE frames as the model streams.
+
+    Frames are ``token``, ``tool_call``, ``tool_result``, ``plan_cache`` (the
+    tool plan came from the cache, not the model) and a final ``done``
+    (the full answer). Failures after the response has started (ollama not
+    running, a model error) arrive as an ``error`` frame. ``open_tasks``
+    builds the agent's task manager.
+    """
+    tasks = open_tasks()
+    llm = agent.LLM(
+        agent.tools,
+        tasks,
+        system_prompt_path=SYSTEM_PROMPT_PATH,
+        plan_cache=plan_cache(agent),
+    )
+    options = {"model": model} if model else {}
+    try:
+        for event in llm.stream_command(message, **options):
+            kind = event.pop("type")
+            event.pop("messages", None)
+            yield sse_frame(kind, json.dumps(event, default=str).encode("utf-8"))
+    except Exception as exc:  # the status line is already sent
+        yield sse_frame("error", json.dumps({"detail": str(exc)}).encode("utf-8"))
+    finally:
+        tasks.close()
+
+
+def structure_capture(agent: ModuleType, text: str, model: Optional[str] = None) -> List[dict]:
+    """Split freeform input into tasks with the agent's batch capture; the tasks, in CLI format.
+
+    One model call (see ``LLM.capture_tasks``) on an empty in-memory task
+    list, so nothing is written here; the caller applies the result. Raises
+    when the reply is invalid or holds no task.
+    """
+    llm = agent.LLM(agent.tools, agent.MemoryTaskManager(), system_prompt_path=SYSTEM_PROMPT_PATH)
+    options = {"model": model} if model else {}
+    added = llm.capture_tasks(text, **options)
+    if not added:
+        raise ValueError("the assistant found no task")
+    return added
@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+import random
+from array import array
+from typing import TYPE_CHECKING, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from search import terms
+
+if TYPE_CHECKING:
+    from task_index import TaskIndex
+
+# Jaccard similarity of shingle sets from which tasks count as duplicates.
+DUPLICATE_THRESHOLD = 0.7
+# Statuses of the API's tasks that a new task cannot duplicate.
+DONE_STATUSES = {"complete", "completed"}
+HASH_MASK = (1 << 64) - 1
+
+
+def shingles(text: str, size: int = 3) -> Set[int]:
+    """Hashed character n-grams of each word, so word order and stopwords do not matter.
+
+    Hashes come from ``hash()``, so they are only comparable within one process.
+    """
+    found = set()
+    for term in terms(text):
+        padded = f" {term} "
+        found.update(
+            hash(padded[start : start + size]) & HASH_MASK
+            for start in range(max(1, len(padded) - size + 1))
+        )
+    return found
+
+
+def numbers(text: str) -> FrozenSet[str]:
+    # "Pay invoice 1043" and "Pay invoice 1044" share most shingles but are different tasks.
+    return frozenset(term for term in terms(text) if term.isdigit())
+
+
+class MinHashIndex:
+    """Near-duplicate detection with MinHash signatures and LSH banding.
+
+    Each text becomes the set of its word shingles and a signature of
+    ``permutations`` min-hashes; permutations are random XOR masks over the
+    (already well mixed) shingle hashes, so a signature costs one XOR and
+    compare per shingle and mask. The signature is cut into ``bands`` of
+    equal rows and texts sharing any band land in the same bucket, so a
+    lookup only compares with the few texts it collides with instead of
+    every text in the index. With 8 bands of 4 rows a pair at the 0.7
+    threshold collides 89% of the time, at 0.85 99.7%, at 0.3 6%.
+    Candidates are then checked against the exact Jaccard similarity of
+    the stored shingle sets, so there are no false positives, and must
+    mention the same numbers.
+    """
+
+    def __init__(
+        self, threshold: float = DUPLICATE_THRESHOLD, permutations: int = 32, bands: int = 8
+    ) -> None:
+        assert permutations % bands == 0
+        self.threshold = threshold
+        self.rows = permutations // bands
+        rng = random.Random(permutations)
+        self._masks = [rng.getrandbits(64) for _ in range(permutations)]
+        # Sorted shingle hashes and band keys of every indexed text.
+        self._shingles: Dict[int, array] = {}
+        self._keys: Dict[int, array] = {}
+        # Numbers in the text, for the texts that have any.
+        self._numbers: Dict[int, FrozenSet[str]] = {}
+        # band key -> doc id, or list of ids once several share it (most buckets hold one).
+        self._buckets: Dict[int, object] = {}
+
+    def __len__(self) -> int:
+        return len(self._shingles)
+
+    def __contains__(self, doc_id: object) -> bool:
+        return doc_id in self._shingles
+
+    def band_keys(self, features: Iterable[int]) -> array:
+        features = list(features)
+        signature = [min([value ^ mask for value in features]) for mask in self._masks]
+        rows = self.rows
+        return array(
+            "q",
+            (
+                hash((band, *signature[band * rows : (band + 1) * rows]))
+                for band in range(len(signature) // rows)
+            ),
+        )
+
+    def add(self, doc_id: int, text: str) -> None:
+        features = array("Q", sorted(shingles(text)))
+        if self._shingles.get(doc_id) == features:
+            return
+        self.remove(doc_id)
+        if not features:
+            return
+        keys = self.band_keys(features)
+        self._shingles[doc_id] = features
+        self._keys[doc_id] = keys
+        found = numbers(text)
+        if found:
+            self._numbers[doc_id] = found
+        buckets = self._buckets
+        for key in keys:
+            held = buckets.get(key)
+            if held is None:
+                buckets[key] = doc_id
+            elif isinstance(held, list):
+                held.append(doc_id)
+            else:
+                buckets[key] = [held, doc_id]
+
+    def remove(self, doc_id: int) -> None:
+        if self._shingles.pop(doc_id, None) is None:
+            return
+        self._numbers.pop(doc_id, None)
+        buckets = self._buckets
+        for key in self._keys.pop(doc_id):
+            held = buckets[key]
+            if isinstance(held, list):
+                held.remove(doc_id)
+                if len(held) == 1:
+                    buckets[key] = held[0]
+            else:
+                del buckets[key]
+
+    def _bucket_mates(self, features: Iterable[int]) -> Set[int]:
+        found: Set[int] = set()
+        for key in self.band_keys(features):
+            held = self._buckets.get(key)
+            if isinstance(held, list):
+                found.update(held)
+            elif held is not None:
+                found.add(held)
+        return found
+
+    def similarity(self, features: Set[int], doc_id: int) -> float:
+        other = self._shingles[doc_id]
+        shared = len(features.intersection(other))
+        return shared / (len(features) + len(other) - shared)
+
+    def similar(
+        self, text: str, exclude: Optional[int] = None, limit: int = 5
+    ) -> List[Tuple[int, float]]:
+        """Indexed ids whose text is a near-duplicate of ``text``, most similar first."""
+        features = shingles(text)
+        if not features:
+            return []
+        found = numbers(text)
+        scored = []
+        for doc_id in self._bucket_mates(features):
+            if doc_id == exclude or self._numbers.get(doc_id, frozenset()) != found:
+                continue
+            similarity = self.similarity(features, doc_id)
+            if similarity >= self.threshold:
+                scored.append((doc_id, similarity))
+        scored.sort(key=lambda match: (-match[1], match[0]))
+        return scored[:limit]
+
+    def groups(self) -> List[List[int]]:
+        """Every set of near-duplicates in the index (ids ascending), found from shared buckets."""
+        parent: Dict[int, int] = {}
+
+        def root(doc_id: int) -> int:
+            while parent.get(doc_id, doc_id) != doc_id:
+                doc_id = parent[doc_id]
+            return doc_id
+
+        for held in self._buckets.values():
+            if not isinstance(held, list):
+                continue
+            # Only texts with the same numbers can match ("Task 1", "Task 2", ...).
+            by_numbers: Dict[Optional[FrozenSet[str]], List[int]] = {}
+            for doc_id in held:
+                by_numbers.setdefault(self._numbers.get(doc_id), []).append(doc_id)
+            for mates in by_numbers.values():
+                for index, first in enumerate(mates):
+                    features = set(self._shingles[first])
+                    for second in mates[index + 1 :]:
+                        low, high = sorted((root(first), root(second)))
+                        # Already grouped through other pairs: no need to compare.
+                        if low == high or self.similarity(features, second) < self.threshold:
+                            continue
+                        parent.setdefault(low, low)
+                        parent[high] = low
+        grouped: Dict[int, List[int]] = {}
+        for doc_id in parent:
+            grouped.setdefault(root(doc_id), []).append(doc_id)
+        return sorted(sorted(group) for group in grouped.values())
+
+
+def build_index(
+    items: Iterable[Tuple[int, str]], threshold: float = DUPLICATE_THRESHOLD
+) -> MinHashIndex:
+    index = MinHashIndex(threshold)
+    for doc_id, text in items:
+        index.add(doc_id, text)
+    return index
+
+
+def duplicate_groups(
+    items: Iterable[Tuple[int, str]], threshold: float = DUPLICATE_THRESHOLD
+) -> List[List[int]]:
+    """Groups of near-duplicate ``(id, text)`` items, for a one-off pass over a store."""
+    return build_index(items, threshold).groups()
+
+
+def open_titles(tasks: Iterable[dict]) -> List[Tuple[int, str]]:
+    return [
+        (int(task["id"]), task.get("title") or "")
+        for task in tasks
+        if task.get("status") not in DONE_STATUSES
+    ]
+
+
+class TaskDuplicates:
+    """MinHash index over the titles of the API's open tasks.
+
+    The first index is built from a snapshot off the event loop (see
+    :meth:`ready`); until then :meth:`find` finds nothing. After that it is
+    caught up from the TaskIndex change log before each lookup (like
+    ``search.TaskSearch``), so a create costs one signature plus whatever
+    changed since the previous lookup. Completed tasks leave the index:
+    doing a task again is not a duplicate.
+    """
+
+    def __init__(self, threshold: float = DUPLICATE_THRESHOLD) -> None:
+        self.threshold = threshold
+        self.index: Optional[MinHashIndex] = None
+        self.revision = -1
+
+    def ready(self, index: MinHashIndex, revision: int) -> None:
+        """Start from ``index``, built from the tasks as of ``revision``."""
+        self.index = index
+        self.revision = revision
+
+    def sync(self, tasks: "TaskIndex") -> None:
+        if self.index is None:
+            return
+        changed, deleted, reset = tasks.changes_since(self.revision)
+        self.revision = tasks.revision
+        if reset:
+            self.index = MinHashIndex(self.threshold)
+        for task in changed:
+            task_id = int(task["id"])
+            if task.get("status") in DONE_STATUSES:
+                self.index.remove(task_id)
+            else:
+                self.index.add(task_id, task.get("title") or "")
+        for task_id in deleted:
+            self.index.remove(task_id)
+
+    def find(self, tasks: "TaskIndex", text: str, exclude: Optional[int] = None) -> Optional[int]:
+        """The open task ``text`` most likely duplicates, if any."""
+        self.sync(tasks)
+        if self.index is None:
+            return None
+        matches = self.index.similar(text, exclude=exclude, limit=1)
+        return matches[0][0] if matches else None
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import asyncio
+from threading import Lock
+from typing import Optional, Set
+
+
+def sse_frame(event: str, data: bytes, event_id: Optional[int] = None) -> bytes:
+    head = b"event: %s\n" % event.encode("utf-8")
+    if event_id is not None:
+        head = b"id: %d\n" % event_id + head
+    return head + b"data: " + data + b"\n\n"
+
+
+class Subscriber:
+    """One connected client: a bounded queue of ready-to-send SSE frames.
+
+    When a client falls ``queue_size`` frames behind, its backlog is thrown
+    away and replaced by a single ``resync`` frame so a slow reader costs a
+    bounded amount of memory and just refetches changes on its side.
+    """
+
+    def __init__(self, queue_size: int) -> None:
+        self.queue: "asyncio.Queue[bytes]" = asyncio.Queue(maxsize=queue_size)
+        self.overflows = 0
+
+    def offer(self, frame: bytes) -> None:
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self.overflows += 1
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(sse_frame("resync", b"{}"))
+
+
+class EventHub:
+    """In-process fan-out of task mutation events to SSE subscribers.
+
+    Handlers publish from the event loop, where frames are fanned out
+    directly. ``publish`` may also be called from other threads; it then
+    schedules a single fan-out callback on the loop, which keeps publishers
+    cheap and preserves the order events were published in.
+    """
+
+    def __init__(self, queue_size: int = 256) -> None:
+        self.queue_size = queue_size
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.published = 0
+        self._subscribers: Set[Subscriber] = set()
+        self._lock = Lock()
+
+    def bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.loop = loop
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self) -> Subscriber:
+        subscriber = Subscriber(self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, event: str, data: bytes, event_id: Optional[int] = None) -> None:
+        if self.loop is None or not self._subscribers:
+            return
+        self.published += 1
+        frame = sse_frame(event, data, event_id)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            self._fan_out(frame)
+        else:
+            self.loop.call_soon_threadsafe(self._fan_out, frame)
+
+    def _fan_out(self, frame: bytes) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.offer(frame)
@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(
+        self,
+        job_id: int,
+        kind: str,
+        run: Callable[[], Any],
+        on_success: Callable[[Any], Awaitable[None]],
+        on_failure: Callable[[Exception], Awaitable[None]],
+    ) -> None:
+        self.id = job_id
+        self.kind = kind
+        self.run = run
+        self.on_success = on_success
+        self.on_failure = on_failure
+        self.status = "queued"
+        self.attempts = 0
+        self.error: Optional[str] = None
+        self.queued_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "attempts": self.attempts,
+            "error": self.error,
+            "queuedAt": self.queued_at,
+            "finishedAt": self.finished_at,
+        }
+
+
+class JobQueue:
+    """In-process queue for slow, blocking work (the ollama tool loop).
+
+    ``workers`` asyncio workers take jobs in order and run them on a thread
+    pool of the same size, so at most that many model calls are in flight.
+    An attempt that raises or runs past ``timeout`` seconds is retried up to
+    ``retries`` times with exponential backoff; then the job's ``on_failure``
+    callback runs, otherwise ``on_success`` with the result. Callbacks run on
+    the event loop, where they can update the task cache directly.
+
+    A timed-out attempt cannot be interrupted; its thread finishes in the
+    background and its result is dropped. It keeps its slot until then:
+    every attempt takes one of ``workers`` permits, released when its call
+    returns rather than when it times out, so a retry waits for a permit
+    instead of piling another call onto a stalled model. :meth:`submit` raises
+    :class:`QueueFull` past ``max_queued`` waiting jobs (check :meth:`full`
+    first), so callers can push back instead of queueing work that would
+    time out anyway.
+    """
+
+    def __init__(
+        self,
+        workers: int = 2,
+        timeout: float = 30.0,
+        retries: int = 2,
+        backoff: float = 1.0,
+        max_queued: int = 100,
+        keep_finished: int = 500,
+    ) -> None:
+        self.workers = workers
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_queued = max_queued
+        self.keep_finished = keep_finished
+        self.stats = {"completed": 0, "failed": 0, "retried": 0, "timedOut": 0}
+        self._ids = itertools.count(1)
+        self._jobs: "OrderedDict[int, Job]" = OrderedDict()
+        self._queue: Optional["asyncio.Queue[Job]"] = None
+        self._tasks: list = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="job")
+        self._slots = asyncio.Semaphore(self.workers)
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _attempt(self, run: Callable[[], Any]) -> Any:
+        """``run()`` on the pool once a permit is free; the permit is held until it returns."""
+        assert self._slots is not None and self._executor is not None
+        loop = asyncio.get_running_loop()
+        await self._slots.acquire()
+        try:
+            future = self._executor.submit(run)
+        except BaseException:
+            self._slots.release()
+            raise
+
+        def release(_: Any) -> None:
+            try:
+                loop.call_soon_threadsafe(self._slots.release)
+            except RuntimeError:  # the loop is closed; nothing is waiting
+                pass
+
+        future.add_done_callback(release)
+        return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+
+    def full(self) -> bool:
+        return self._queue is not None and self._queue.qsize() >= self.max_queued
+
+    def submit(
+        self,
+        kind: str,
+        run: Callable[[], Any],
+        on_success: Callable[[Any], Awaitable[None]],
+        on_failure: Callable[[Exception], Awaitable[None]],
+    ) -> Job:
+        if self._queue is None:
+            raise RuntimeError("JobQueue.start() has not been called")
+        if self.full():
+            raise QueueFull(f"{self._queue.qsize()} jobs are already waiting")
+        job = Job(next(self._ids), kind, run, on_success, on_failure)
+        self._jobs[job.id] = job
+        self._queue.put_nowait(job)
+        return job
+
+    def get(self, job_id: int) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def summary(self) -> dict:
+        statuses: Dict[str, int] = {}
+        for job in self._jobs.values():
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {
+            **self.stats,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "running": statuses.get("running", 0),
+            "workers": self.workers,
+        }
+
+    async def _work(self) -> None:
+        assert self._queue is not None
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job) -> None:
+        job.status = "running"
+        while True:
+            job.attempts += 1
+            try:
+                result = await self._attempt(job.run)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                if isinstance(exc, asyncio.TimeoutError):
+                    self.stats["timedOut"] += 1
+                    exc = TimeoutError(f"no result after {self.timeout:g}s")
+                job.error = str(exc) or type(exc).__name__
+                if job.attempts <= self.retries:
+                    self.stats["retried"] += 1
+                    await asyncio.sleep(self.backoff * 2 ** (job.attempts - 1))
+                    continue
+                job.status = "failed"
+                self.stats["failed"] += 1
+                await self._finish(job, job.on_failure(exc))
+                return
+            job.status = "completed"
+            job.error = None
+            self.stats["completed"] += 1
+            await self._finish(job, job.on_success(result))
+            return
+
+    async def _finish(self, job: Job, callback: Awaitable[None]) -> None:
+        job.finished_at = time.time()
+        try:
+            await callback
+        except Exception as exc:  # keep the worker alive
+            job.error = f"callback failed: {exc}"
+        self._forget_finished()
+
+    def _forget_finished(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished_at is not None]
+        for job_id in finished[: max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job_id]
@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from threading import Lock, get_ident
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+Labels = Tuple[str, ...]
+
+# Seconds; from a cache hit to a slow model-backed request.
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+def escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: Labels, values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Labels = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: Dict[Labels, float] = {}
+        self._lock = Lock()
+
+    def inc(self, amount: float = 1, *label_values: str) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [
+            f"{self.name}{format_labels(self.labels, key)} {format_value(value)}"
+            for key, value in values
+        ]
+
+
+class Gauge:
+    """A value read when the metrics are scraped, from ``read()``.
+
+    ``read`` returns a number, or a dict of label values -> number.
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self, name: str, help: str, read: Callable[[], Any], labels: Labels = (), kind: str = ""
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.read = read
+        self.labels = labels
+        if kind:
+            self.kind = kind
+
+    def samples(self) -> List[str]:
+        value = self.read()
+        values = value.items() if isinstance(value, dict) else [((), value)]
+        return [
+            f"{self.name}{format_labels(self.labels, key)} {format_value(number)}"
+            for key, number in values
+        ]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Labels = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets) + (float("inf"),)
+        # label values -> [per-bucket counts, sum, count]
+        self._series: Dict[Labels, list] = {}
+        self._lock = Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *label_values: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            series = sorted(
+                (key, (list(counts), total, count))
+                for key, (counts, total, count) in self._series.items()
+            )
+        lines = []
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{format_labels(self.labels, key, le)} {cumulative}"
+                )
+            labels = format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    """Metrics rendered in the Prometheus text exposition format (0.0.4)."""
+
+    content_type = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self) -> None:
+        self.metrics: List[Any] = []
+
+    def add(self, metric: Any) -> Any:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+class RequestMetrics:
+    """ASGI middleware timing every HTTP request, labelled by endpoint.
+
+    Requests are labelled with the endpoint function's name (set on the scope
+    by the router), so path parameters do not multiply the series. Duration
+    is measured until the response body is complete; for streaming endpoints
+    (SSE) that is the life of the stream. ``phases``, when given, also gets
+    a ``handler`` observation per request: the time until the response
+    starts, which leaves out sending the body. ``profiler``, when given, is
+    told about each request so it can keep stacks of the slow ones.
+    """
+
+    def __init__(
+        self,
+        app: Any,
+        seconds: Histogram,
+        total: Counter,
+        phases: Optional[Histogram] = None,
+        profiler: Optional[Any] = None,
+    ) -> None:
+        self.app = app
+        self.seconds = seconds
+        self.total = total
+        self.phases = phases
+        self.profiler = profiler
+
+    async def __call__(self, scope: dict, receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = ["500"]
+
+        async def send_wrapper(message: dict) -> None:
+            if message["type"] == "http.response.start":
+                status[0] = str(message["status"])
+                if self.phases is not None:
+                    self.phases.observe(time.perf_counter() - started, "handler")
+            await send(message)
+
+        started = time.perf_counter()
+        thread = get_ident()
+        profiling = self.profiler is not None and self.profiler.enabled
+        if profiling:
+            self.profiler.request_started(thread)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            finished = time.perf_counter()
+            endpoint = scope.get("endpoint")
+            route = getattr(endpoint, "__name__", "unmatched")
+            method = scope.get("method", "")
+            self.seconds.observe(finished - started, method, route)
+            self.total.inc(1, method, route, status[0])
+            if profiling:
+                self.profiler.request_done(route, thread, started, finished)
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from threading import Event, Lock, Thread
+from typing import Deque, Dict, Optional, Tuple
+
+
+def folded_stack(frame) -> str:
+    """``outer;...;inner`` frame names, the collapsed format flamegraph tools read."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SlowRequestProfiler:
+    """Opt-in sampling profiler that keeps stacks of slow requests.
+
+    While enabled, a daemon thread samples the stack of every thread that
+    is serving requests (the event loop) every ``interval`` seconds into a
+    short ring buffer. When a request takes longer than ``threshold``
+    seconds, the samples taken during it are written to ``output_dir`` as a
+    ``.folded`` file (one ``stack count`` line per distinct stack), ready for
+    ``flamegraph.pl`` or speedscope. Files are written and old ones pruned
+    by a writer thread, never on the loop that was just slow.
+
+    Requests overlapping on the loop share its samples, so a slow request's
+    profile can include work done for others at the same time.
+    """
+
+    def __init__(
+        self,
+        output_dir: Path,
+        threshold: float = 0.25,
+        interval: float = 0.005,
+        window: float = 30.0,
+        keep_files: int = 200,
+    ) -> None:
+        self.output_dir = output_dir
+        self.threshold = threshold
+        self.interval = interval
+        self.keep_files = keep_files
+        self.written = 0
+        self._samples: Deque[Tuple[float, int, str]] = deque(maxlen=int(window / interval))
+        self._threads: Dict[int, int] = {}
+        self._lock = Lock()
+        self._stop: Optional[Event] = None
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="profiler-writer")
+
+    @property
+    def enabled(self) -> bool:
+        return self._stop is not None
+
+    def enable(self, threshold: Optional[float] = None) -> None:
+        if threshold is not None:
+            self.threshold = threshold
+        if self._stop is None:
+            self._stop = Event()
+            Thread(target=self._sample, args=(self._stop,), name="profiler", daemon=True).start()
+
+    def disable(self) -> None:
+        if self._stop is not None:
+            self._stop.set()
+            self._stop = None
+        with self._lock:
+            self._samples.clear()
+
+    def request_started(self, thread: int) -> None:
+        with self._lock:
+            self._threads[thread] = self._threads.get(thread, 0) + 1
+
+    def request_done(
+        self, route: str, thread: int, started: float, finished: float
+    ) -> Optional["Future[Path]"]:
+        with self._lock:
+            left = self._threads.get(thread, 1) - 1
+            if left:
+                self._threads[thread] = left
+            else:
+                self._threads.pop(thread, None)
+            if not self.enabled or finished - started < self.threshold:
+                return None
+            stacks: Dict[str, int] = {}
+            for at, sampled_thread, stack in self._samples:
+                if sampled_thread == thread and started <= at <= finished:
+                    stacks[stack] = stacks.get(stack, 0) + 1
+        if not stacks:
+            return None
+        return self._writer.submit(self._write, route, finished - started, stacks)
+
+    def _write(self, route: str, seconds: float, stacks: Dict[str, int]) -> Path:
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = self.output_dir / f"{stamp}-{route}-{int(seconds * 1000)}ms.folded"
+        with path.open("w", encoding="utf-8") as target:
+            for stack, count in sorted(stacks.items(), key=lambda item: -item[1]):
+                target.write(f"{stack} {count}\n")
+        self.written += 1
+        profiles = sorted(self.output_dir.glob("*.folded"))
+        for old in profiles[: max(0, len(profiles) - self.keep_files)]:
+            old.unlink()
+        return path
+
+    def _sample(self, stop: Event) -> None:
+        while not stop.wait(self.interval):
+            with self._lock:
+                threads = list(self._threads)
+            if not threads:
+                continue
+            frames = sys._current_frames()
+            now = time.perf_counter()
+            sampled = [
+                (now, thread, folded_stack(frames[thread])) for thread in threads if thread in frames
+            ]
+            with self._lock:
+                self._samples.extend(sampled)
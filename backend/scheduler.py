@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+Interval = Tuple[datetime, datetime]
+
+
+def parse_iso(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", ""))
+    except ValueError:
+        return None
+    # Offsets sneak in from timezone-aware payloads; compare everything as naive UTC.
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+class IntervalIndex:
+    """Scheduled blocks, kept as a sorted list of merged (disjoint) busy ranges.
+
+    Next to the merged ranges sits every task's block, sorted by start.
+    Adding a block merges it in place with ``bisect``. Removing one
+    re-merges only the blocks of the range it was part of, so moving a
+    task never rebuilds the whole index.
+    """
+
+    def __init__(self) -> None:
+        self._by_task: Dict[int, Interval] = {}
+        # (start, end, task id) for every block, sorted.
+        self._blocks: List[Tuple[datetime, datetime, int]] = []
+        self._starts: List[datetime] = []
+        self._ends: List[datetime] = []
+
+    def __len__(self) -> int:
+        return len(self._by_task)
+
+    def set(self, task_id: int, start: Optional[datetime], end: Optional[datetime]) -> None:
+        if start is None or end is None or end <= start:
+            self.discard(task_id)
+            return
+        previous = self._by_task.get(task_id)
+        if previous == (start, end):
+            return
+        if previous is not None:
+            self.discard(task_id)
+        self._by_task[task_id] = (start, end)
+        insort(self._blocks, (start, end, task_id))
+        self._merge(start, end)
+
+    def discard(self, task_id: int) -> None:
+        interval = self._by_task.pop(task_id, None)
+        if interval is None:
+            return
+        start, end = interval
+        del self._blocks[bisect_left(self._blocks, (start, end, task_id))]
+        # The merged range holding the block, rebuilt from the blocks left in it.
+        index = bisect_right(self._starts, start) - 1
+        range_start, range_end = self._starts[index], self._ends[index]
+        lo = bisect_left(self._blocks, (range_start,))
+        hi = bisect_right(self._blocks, (range_end, datetime.max))
+        starts: List[datetime] = []
+        ends: List[datetime] = []
+        for block_start, block_end, _ in self._blocks[lo:hi]:
+            if ends and block_start <= ends[-1]:
+                ends[-1] = max(ends[-1], block_end)
+            else:
+                starts.append(block_start)
+                ends.append(block_end)
+        self._starts[index : index + 1] = starts
+        self._ends[index : index + 1] = ends
+
+    def _merge(self, start: datetime, end: datetime) -> None:
+        # Blocks overlapping or touching [start, end] are absorbed into one.
+        lo = bisect_left(self._ends, start)
+        hi = bisect_right(self._starts, end)
+        if lo < hi:
+            start = min(start, self._starts[lo])
+            end = max(end, self._ends[hi - 1])
+        self._starts[lo:hi] = [start]
+        self._ends[lo:hi] = [end]
+
+    def first_fit(
+        self,
+        window_start: datetime,
+        window_end: datetime,
+        duration: timedelta,
+        step: timedelta,
+    ) -> Optional[datetime]:
+        """Earliest ``step``-aligned start in the window with ``duration`` free.
+
+        Each probe is a binary search; the loop only advances past busy
+        blocks, so the cost is O(log n) per block in the window.
+        """
+        candidate = window_start
+        while candidate + duration <= window_end:
+            # Ranges are disjoint and sorted, so the last one starting before
+            # the candidate ends is the only one that can still overlap it.
+            last = bisect_left(self._starts, candidate + duration) - 1
+            if last < 0 or self._ends[last] <= candidate:
+                return candidate
+            blocked_until = self._ends[last]
+            steps = -(-(blocked_until - window_start) // step)
+            candidate = window_start + steps * step
+        return None
+
+    def find_slot(
+        self,
+        now: datetime,
+        duration: timedelta,
+        days: int = 1,
+        work_start_hour: int = 8,
+        work_end_hour: int = 18,
+        step: timedelta = timedelta(minutes=30),
+    ) -> Optional[datetime]:
+        """Search working hours day by day from ``now``, for ``days`` days.
+
+        Slots start on the ``step`` grid from the start of working hours and
+        never before ``now``.
+        """
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        for offset in range(max(days, 1)):
+            window_start = midnight + timedelta(days=offset, hours=work_start_hour)
+            window_end = midnight + timedelta(days=offset, hours=work_end_hour)
+            if now > window_start:
+                steps = -(-(now - window_start) // step)
+                window_start += steps * step
+            slot = self.first_fit(window_start, window_end, duration, step)
+            if slot is not None:
+                return slot
+        return None
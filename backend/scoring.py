@@ -0,0 +1,259 @@
+from __future__ import annotations
+
+import math
+import time
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from scheduler import parse_iso
+
+try:
+    import numpy as np
+except ImportError:  # optional: without it rescoring runs one task at a time
+    np = None
+
+if TYPE_CHECKING:
+    from task_index import TaskIndex
+
+EPOCH = datetime(1970, 1, 1)
+DAY_SECONDS = 86400.0
+# How much a category matters on its own, 0-1 (the system prompt's categories).
+CATEGORY_WEIGHTS = {
+    "health": 0.8,
+    "financial": 0.7,
+    "finance": 0.7,
+    "work": 0.6,
+    "career": 0.6,
+    "administrative": 0.5,
+    "education": 0.5,
+    "relationships": 0.4,
+    "personal": 0.4,
+    "home": 0.3,
+    "household": 0.3,
+}
+# Weight of a task with a due date but an unknown category.
+NEUTRAL_WEIGHT = 0.5
+# Slack (days before a task must start to make its due date) at which urgency has decayed to 1/e.
+DUE_HORIZON_DAYS = 3.0
+# Waiting this long earns the full age boost, so old tasks do not sink forever.
+AGE_FULL_DAYS = 28.0
+AGE_BOOST = 1.0
+# Tasks this short or shorter get the full quick-win boost; it fades out at QUICK_WIN_MINUTES.
+QUICK_WIN_MINUTES = 120.0
+QUICK_WIN_BOOST = 0.5
+DONE_STATUSES = {"complete", "completed"}
+
+# (due, created) in epoch seconds, estimated minutes and category weight; NaN when unknown.
+Features = Tuple[float, float, float, float]
+
+
+def is_pinned(task: dict) -> bool:
+    # Tasks stored before the engine existed keep the score they were given.
+    return bool(task.get("priorityPinned", True))
+
+
+def engine_owns(task: dict) -> bool:
+    return not is_pinned(task) and task.get("status") not in DONE_STATUSES
+
+
+def category_weight(category: Optional[str]) -> float:
+    if not category:
+        return math.nan
+    name = category.strip().lower()
+    weight = CATEGORY_WEIGHTS.get(name)
+    if weight is None:
+        # "Work/Career", "Home/Household"
+        weight = CATEGORY_WEIGHTS.get(name.split("/")[0].strip())
+    return math.nan if weight is None else weight
+
+
+def timestamp(value: Optional[str]) -> float:
+    parsed = parse_iso(value)
+    if parsed is None:
+        return math.nan
+    return (parsed - EPOCH).total_seconds()
+
+
+def task_features(task: dict) -> Features:
+    minutes = task.get("estimatedMinutes")
+    return (
+        timestamp(task.get("dueAt")),
+        timestamp(task.get("createdAt")),
+        math.nan if minutes is None else float(minutes),
+        category_weight(task.get("category")),
+    )
+
+
+def score(features: Features, now: float) -> Optional[int]:
+    """Priority score 0-10, or None when neither due date nor category says anything.
+
+    The category sets the base (weight * 10) and a closing due date pulls
+    the score toward 10; slack is the time left once the estimated minutes
+    are taken off, so long tasks get urgent sooner. Age and quick wins
+    (short tasks) add up to ``AGE_BOOST`` and ``QUICK_WIN_BOOST``.
+    ``score_columns`` is the same formula over arrays; keep them in step.
+    """
+    due, created, minutes, weight = features
+    if math.isnan(due) and math.isnan(weight):
+        return None
+    if math.isnan(weight):
+        weight = NEUTRAL_WEIGHT
+    quick_win = 0.0
+    if math.isnan(minutes):
+        minutes = 0.0
+    else:
+        quick_win = QUICK_WIN_BOOST * min(max(1 - minutes / QUICK_WIN_MINUTES, 0.0), 1.0)
+    base = 10 * weight
+    value = base
+    if not math.isnan(due):
+        slack = max((due - now - minutes * 60) / DAY_SECONDS, 0.0)
+        value += (10 - base) * math.exp(-slack / DUE_HORIZON_DAYS)
+    if not math.isnan(created):
+        value += AGE_BOOST * min(max((now - created) / DAY_SECONDS, 0.0) / AGE_FULL_DAYS, 1.0)
+    value += quick_win
+    return int(min(max(round(value), 0), 10))
+
+
+def score_task(task: dict, now: Optional[float] = None) -> Optional[int]:
+    return score(task_features(task), time.time() if now is None else now)
+
+
+def score_columns(due, created, minutes, weight, now: float):
+    """:func:`score` for NumPy columns; NaN where the task is ambiguous."""
+    ambiguous = np.isnan(due) & np.isnan(weight)
+    weight = np.where(np.isnan(weight), NEUTRAL_WEIGHT, weight)
+    quick_win = QUICK_WIN_BOOST * np.nan_to_num(np.clip(1 - minutes / QUICK_WIN_MINUTES, 0.0, 1.0))
+    minutes = np.nan_to_num(minutes)
+    base = 10 * weight
+    slack = np.maximum((due - now - minutes * 60) / DAY_SECONDS, 0.0)
+    urgency = np.nan_to_num(np.exp(-slack / DUE_HORIZON_DAYS))
+    value = base + (10 - base) * urgency
+    age = np.maximum((now - created) / DAY_SECONDS, 0.0) / AGE_FULL_DAYS
+    value += AGE_BOOST * np.nan_to_num(np.minimum(age, 1.0))
+    value += quick_win
+    value = np.clip(np.rint(value), 0, 10)
+    return np.where(ambiguous, np.nan, value)
+
+
+class ScoreEngine:
+    """Scoring inputs of every task as columns, so a full rescore is a few array operations.
+
+    Each task is one row: due and creation time, estimated minutes, category
+    weight, its current score and whether the engine may change it (open and
+    not pinned). Rows are rewritten from the TaskIndex change log (like
+    ``search.TaskSearch``), so a task's dates are parsed once per change
+    rather than on every rescore. With NumPy the columns are arrays and
+    :meth:`rescore` runs :func:`score_columns` over all of them; without it
+    they are lists and each row goes through :func:`score`.
+    """
+
+    def __init__(self) -> None:
+        self.vectorized = np is not None
+        self.revision = -1
+        self._rows: Dict[int, int] = {}
+        self._ids: List[int] = []
+        self._reset(16)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _reset(self, capacity: int) -> None:
+        self._rows.clear()
+        self._ids.clear()
+        if self.vectorized:
+            # due, created, minutes, weight, current score, scored by the engine (0/1)
+            self._columns = np.full((6, capacity), np.nan)
+        else:
+            self._columns = [[] for _ in range(6)]
+
+    def set(self, task_id: int, features: Features, current: int, active: bool) -> None:
+        values = (*features, float(current), 1.0 if active else 0.0)
+        row = self._rows.get(task_id)
+        if self.vectorized:
+            if row is None:
+                row = len(self._ids)
+                if row == self._columns.shape[1]:
+                    grown = np.full((6, row * 2), np.nan)
+                    grown[:, :row] = self._columns
+                    self._columns = grown
+                self._rows[task_id] = row
+                self._ids.append(task_id)
+            self._columns[:, row] = values
+        elif row is None:
+            self._rows[task_id] = len(self._ids)
+            self._ids.append(task_id)
+            for column, value in zip(self._columns, values):
+                column.append(value)
+        else:
+            for column, value in zip(self._columns, values):
+                column[row] = value
+
+    def remove(self, task_id: int) -> None:
+        row = self._rows.pop(task_id, None)
+        if row is None:
+            return
+        # Move the last row into the gap.
+        last = len(self._ids) - 1
+        last_id = self._ids.pop()
+        if row != last:
+            self._ids[row] = last_id
+            self._rows[last_id] = row
+        if self.vectorized:
+            self._columns[:, row] = self._columns[:, last]
+        else:
+            for column in self._columns:
+                column[row] = column[last]
+                column.pop()
+
+    def set_task(self, task: dict) -> None:
+        self.set(
+            int(task["id"]), task_features(task), int(task["priorityScore"]), engine_owns(task)
+        )
+
+    def sync(self, tasks: "TaskIndex") -> None:
+        changed, deleted, reset = tasks.changes_since(self.revision)
+        self.revision = tasks.revision
+        if reset:
+            self._reset(max(16, len(changed)))
+        for task in changed:
+            self.set_task(task)
+        for task_id in deleted:
+            self.remove(task_id)
+
+    def rescore(self, now: Optional[float] = None) -> Tuple[List[Tuple[int, int]], List[int]]:
+        """``(id, new score)`` of the engine's tasks whose score moved, and the ambiguous ids."""
+        now = time.time() if now is None else now
+        count = len(self._ids)
+        if self.vectorized:
+            due, created, minutes, weight, current, active = self._columns[:, :count]
+            scores = score_columns(due, created, minutes, weight, now)
+            ambiguous = np.isnan(scores)
+            moved = np.flatnonzero((active == 1) & ~ambiguous & (scores != current))
+            waiting = np.flatnonzero((active == 1) & ambiguous)
+            ids = self._ids
+            return (
+                [(ids[row], int(scores[row])) for row in moved.tolist()],
+                [ids[row] for row in waiting.tolist()],
+            )
+        changed: List[Tuple[int, int]] = []
+        waiting_ids: List[int] = []
+        due, created, minutes, weight, current, active = self._columns
+        for row, task_id in enumerate(self._ids):
+            if not active[row]:
+                continue
+            value = score((due[row], created[row], minutes[row], weight[row]), now)
+            if value is None:
+                waiting_ids.append(task_id)
+            elif value != current[row]:
+                changed.append((task_id, value))
+        return changed, waiting_ids
+
+
+def build_engine(tasks: List[dict], revision: int) -> ScoreEngine:
+    """An engine holding ``tasks`` as of TaskIndex ``revision``, for building off the event loop."""
+    engine = ScoreEngine()
+    engine._reset(max(16, len(tasks)))
+    for task in tasks:
+        engine.set_task(task)
+    engine.revision = revision
+    return engine
@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import heapq
+import math
+import operator
+import re
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    from task_index import TaskIndex
+
+Vector = List[float]
+Embed = Callable[[List[str]], List[Vector]]
+
+TOKEN = re.compile(r"[^\W_]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by do for from has have i in into is it me my of on or "
+    "the this to was will with".split()
+)
+# Field weights for the API's tasks; the title says the most about a task. History
+# entries live in the store's archive, so TaskSearch keeps their text itself.
+TASK_FIELDS = {"title": 3.0, "description": 1.0, "rationale": 1.0, "history": 0.5}
+EMBED_BATCH = 64
+
+
+def stem(term: str) -> str:
+    # Plural "s" only: "emails" finds "email", "class" stays "class".
+    if len(term) > 3 and term.endswith("s") and not term.endswith("ss"):
+        return term[:-1]
+    return term
+
+
+def terms(text: str) -> List[str]:
+    return [stem(term) for term in TOKEN.findall(text.lower()) if term not in STOPWORDS]
+
+
+class SearchIndex:
+    """Inverted index ranking documents for a query with BM25.
+
+    Documents are dicts of field name -> text. Each term's frequency counts
+    once per occurrence times its field's weight, and the document length is
+    the sum of those weights, so a title match outranks a history match.
+    :meth:`add` replaces a document and leaves the postings alone when its
+    terms did not change.
+    """
+
+    def __init__(self, weights: Dict[str, float], k1: float = 1.2, b: float = 0.75) -> None:
+        self.weights = weights
+        self.k1 = k1
+        self.b = b
+        # term -> {doc id: weighted term frequency}
+        self._postings: Dict[str, Dict[int, float]] = {}
+        self._terms: Dict[int, Dict[str, float]] = {}
+        self._length: Dict[int, float] = {}
+        self._total_length = 0.0
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def __contains__(self, doc_id: object) -> bool:
+        return doc_id in self._terms
+
+    def add(self, doc_id: int, fields: Dict[str, Optional[str]]) -> None:
+        counts: Dict[str, float] = {}
+        for field, text in fields.items():
+            weight = self.weights[field]
+            for term in terms(text or ""):
+                counts[term] = counts.get(term, 0.0) + weight
+        if self._terms.get(doc_id) == counts:
+            return
+        self.remove(doc_id)
+        for term, count in counts.items():
+            self._postings.setdefault(term, {})[doc_id] = count
+        length = sum(counts.values())
+        self._terms[doc_id] = counts
+        self._length[doc_id] = length
+        self._total_length += length
+
+    def remove(self, doc_id: int) -> None:
+        counts = self._terms.pop(doc_id, None)
+        if counts is None:
+            return
+        for term in counts:
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+        self._total_length -= self._length.pop(doc_id)
+
+    def search(
+        self, query: str, limit: int = 20, accept: Optional[Callable[[int], bool]] = None
+    ) -> List[Tuple[int, float]]:
+        """The ``limit`` best ``(doc id, score)`` pairs, best first; ``accept`` filters ids."""
+        count = len(self._terms)
+        if not count:
+            return []
+        average = (self._total_length / count) or 1.0
+        k1, b = self.k1, self.b
+        scores: Dict[int, float] = {}
+        for term in set(terms(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, frequency in postings.items():
+                norm = k1 * (1 - b + b * self._length[doc_id] / average)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (k1 + 1) / (
+                    frequency + norm
+                )
+        matches = scores.items()
+        if accept is not None:
+            matches = [(doc_id, score) for doc_id, score in matches if accept(doc_id)]
+        # Equal scores: lower ids (older tasks) first.
+        return heapq.nlargest(limit, matches, key=lambda match: (match[1], -match[0]))
+
+
+def task_fields(task: dict, history: str = "") -> Dict[str, Optional[str]]:
+    return {
+        "title": task.get("title"),
+        "description": task.get("description"),
+        "rationale": task.get("rationale"),
+        "history": history,
+    }
+
+
+def semantic_text(task: dict) -> str:
+    # History is mostly "Updated"/"Created" noise; leave it out of the meaning.
+    parts = (task.get("title"), task.get("description"), task.get("rationale"))
+    return "\n".join(part for part in parts if part)
+
+
+def unit(vector: Sequence[float]) -> Vector:
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+def rank_by_similarity(
+    query: Vector, candidates: List[Tuple[int, Vector]], limit: int
+) -> List[Tuple[int, float]]:
+    """Cosine similarity of unit vectors; the ``limit`` best ``(id, similarity)``, best first."""
+    scored = ((doc_id, sum(map(operator.mul, query, vector))) for doc_id, vector in candidates)
+    return heapq.nlargest(limit, scored, key=lambda match: (match[1], -match[0]))
+
+
+def ollama_embedder(model: str) -> Optional[Embed]:
+    """Embeddings from a local ollama model, or None when ollama is not installed."""
+    try:
+        import ollama
+    except ImportError:
+        return None
+
+    def embed(texts: List[str]) -> List[Vector]:
+        vectors: List[Vector] = []
+        for start in range(0, len(texts), EMBED_BATCH):
+            reply = ollama.embed(model=model, input=texts[start : start + EMBED_BATCH])
+            vectors.extend(reply["embeddings"])
+        return vectors
+
+    return embed
+
+
+class TaskSearch:
+    """Search indexes over the API's tasks, caught up from a TaskIndex's change log.
+
+    :meth:`sync` applies the tasks changed since the last sync (see
+    ``TaskIndex.changes_since``), so creates, updates and deletes cost
+    nothing until the next search and a search only re-indexes what moved.
+    Tasks only count their history entries, so the text of each task's
+    entries is kept here with the count it covers; :meth:`sync` returns
+    the tasks whose count moved on, and the caller reads their entries
+    from the store's archive and hands them to :meth:`store_histories`.
+    The embedding side is off until the first semantic search; then it
+    keeps each task's text next to its unit vector and drops the vector
+    when the text changes. Vectors are computed by the caller (they need
+    the model, so they run off the event loop) and handed back through
+    :meth:`store_vectors`.
+    """
+
+    def __init__(self) -> None:
+        self.text = SearchIndex(TASK_FIELDS)
+        self.revision = -1
+        # task id -> (historyCount covered, the entries' descriptions)
+        self._history: Dict[int, Tuple[int, str]] = {}
+        self._semantic: Optional[Dict[int, str]] = None
+        self._vectors: Dict[int, Vector] = {}
+
+    def sync(self, tasks: "TaskIndex") -> Dict[int, int]:
+        """Catch up with ``tasks``; returns ``{id: historyCount}`` of stale histories."""
+        changed, deleted, reset = tasks.changes_since(self.revision)
+        self.revision = tasks.revision
+        previous = self._semantic
+        if reset:
+            self.text = SearchIndex(TASK_FIELDS)
+            if previous is not None:
+                self._semantic = {}
+        stale: Dict[int, int] = {}
+        for task in changed:
+            task_id = int(task["id"])
+            count, history = self._history.get(task_id, (0, ""))
+            if (task.get("historyCount") or 0) != count:
+                stale[task_id] = task.get("historyCount") or 0
+            self.text.add(task_id, task_fields(task, history))
+            if self._semantic is not None:
+                text = semantic_text(task)
+                if previous.get(task_id) != text:
+                    self._vectors.pop(task_id, None)
+                self._semantic[task_id] = text
+        for task_id in deleted:
+            self.text.remove(task_id)
+            self._history.pop(task_id, None)
+            if self._semantic is not None:
+                self._semantic.pop(task_id, None)
+                self._vectors.pop(task_id, None)
+        if reset and self._semantic is not None:
+            self._vectors = {
+                task_id: vector
+                for task_id, vector in self._vectors.items()
+                if task_id in self._semantic
+            }
+        if reset:
+            self._history = {
+                task_id: entry for task_id, entry in self._history.items() if task_id in tasks
+            }
+        return stale
+
+    def store_histories(
+        self, tasks: "TaskIndex", counts: Dict[int, int], histories: Dict[int, List[dict]]
+    ) -> None:
+        """Index the entries read for the ids :meth:`sync` returned, with their counts."""
+        for task_id, entries in histories.items():
+            task = tasks.get(task_id)
+            if task is None:
+                continue
+            history = " ".join(entry.get("description") or "" for entry in entries)
+            self._history[task_id] = (counts[task_id], history)
+            self.text.add(task_id, task_fields(task, history))
+
+    def search(
+        self, query: str, limit: int, accept: Optional[Callable[[int], bool]] = None
+    ) -> List[Tuple[int, float]]:
+        return self.text.search(query, limit, accept)
+
+    def unembedded(self, tasks: "TaskIndex") -> List[Tuple[int, str]]:
+        """``(id, text)`` of the tasks without a vector; turns the embedding side on."""
+        if self._semantic is None:
+            self._semantic = {int(task["id"]): semantic_text(task) for task in tasks}
+        return [
+            (task_id, text)
+            for task_id, text in self._semantic.items()
+            if task_id not in self._vectors and text
+        ]
+
+    def store_vectors(self, embedded: List[Tuple[int, str]], vectors: List[Vector]) -> None:
+        assert self._semantic is not None
+        for (task_id, text), vector in zip(embedded, vectors):
+            # The task may have changed while the model was busy.
+            if self._semantic.get(task_id) == text:
+                self._vectors[task_id] = unit(vector)
+
+    def vectors(self, accept: Optional[Callable[[int], bool]] = None) -> List[Tuple[int, Vector]]:
+        return [
+            (task_id, vector)
+            for task_id, vector in self._vectors.items()
+            if accept is None or accept(task_id)
+        ]
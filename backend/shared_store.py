@@ -0,0 +1,178 @@
+"""The task store shared by the API and the CLI agent, and the CLI's record format.
+
+Both processes open ``tasks_store.db`` through :func:`open_shared_store`.
+Tasks are stored in the API's camelCase shape; the CLI converts only the
+rows it reads or writes with :func:`task_to_cli` and :func:`task_from_cli`.
+"""
+from __future__ import annotations
+
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional
+
+from scheduler import parse_iso
+from storage import JsonTaskStore, SqliteTaskStore
+
+BACKEND_DIR = Path(__file__).resolve().parent
+DATA_PATH = BACKEND_DIR / "tasks_store.json"
+JOURNAL_PATH = BACKEND_DIR / "tasks_store.journal"
+HISTORY_PATH = BACKEND_DIR / "tasks_store.history"
+DB_PATH = BACKEND_DIR / "tasks_store.db"
+LEGACY_TASKS_PATH = BACKEND_DIR.parent / "tasks.json"
+
+# Score given to a task when the CLI sets only its label.
+LABEL_SCORES = {"High": 8, "Medium": 5, "Low": 2}
+
+
+def utc_now_iso() -> str:
+    return datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
+
+
+def compute_priority_label(score: int) -> str:
+    if score >= 8:
+        return "High"
+    if score >= 4:
+        return "Medium"
+    return "Low"
+
+
+def ensure_datetime(value: Optional[str]) -> Optional[str]:
+    if value is None or value == "":
+        return None
+    parsed = value if isinstance(value, datetime) else parse_iso(value)
+    if parsed is None:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.replace(microsecond=0).isoformat() + "Z"
+
+
+def task_to_cli(task: dict) -> dict:
+    """A stored task in the CLI's ``tasks.json`` record format."""
+    status = task.get("status") or "processing"
+    return {
+        "id": task["id"],
+        "text": task.get("title"),
+        "category": task.get("category"),
+        "priority label": task.get("priorityLabel"),
+        "priority score": task.get("priorityScore"),
+        "priority pinned": task.get("priorityPinned", True),
+        "status": "Complete" if status == "completed" else status.capitalize(),
+        "created_at": task.get("createdAt"),
+        "status_update_time": task.get("updatedAt"),
+    }
+
+
+def task_from_cli(item: dict, base: Optional[dict] = None, note: Optional[str] = None) -> dict:
+    """Merge a CLI record into ``base`` (the stored task), or build a new task from it.
+
+    Fields the CLI does not know about (schedule, history count, ...) are
+    kept from ``base``. With ``note``, ``history`` holds just that new
+    entry, which the store appends to the task's archived history.
+    """
+    now = utc_now_iso()
+    task = dict(base) if base else {
+        "id": int(item["id"]),
+        "title": "Untitled task",
+        "description": item.get("text") or "Imported task",
+        "category": "Administrative",
+        "priorityScore": 5,
+        "priorityLabel": compute_priority_label(5),
+        "status": "incomplete",
+        "estimatedMinutes": None,
+        "scheduledStart": None,
+        "scheduledEnd": None,
+        "rationale": None,
+        "suggestions": [],
+        "conflict": False,
+        "history": [],
+        "createdAt": now,
+        "updatedAt": now,
+    }
+    text = item.get("text")
+    if text and text != task["title"]:
+        if base and task.get("description") == task["title"]:
+            task["description"] = text
+        task["title"] = text
+    if item.get("category"):
+        task["category"] = item["category"]
+
+    score = item.get("priority score", item.get("priority_score"))
+    try:
+        score = int(score)
+    except (TypeError, ValueError):
+        score = task["priorityScore"]
+    label = item.get("priority label")
+    # A label the CLI changed without touching the score picks that label's
+    # score; an unchanged label keeps the stored score (7 is not reset to 5).
+    if (
+        score == task["priorityScore"]
+        and isinstance(label, str)
+        and label.capitalize() != task.get("priorityLabel")
+    ):
+        score = LABEL_SCORES.get(label.capitalize(), score)
+    task["priorityScore"] = score
+    task["priorityLabel"] = compute_priority_label(score)
+    if "priority pinned" in item:
+        task["priorityPinned"] = bool(item["priority pinned"])
+
+    if item.get("status"):
+        status = item["status"].lower()
+        task["status"] = "completed" if status == "complete" else status
+    task["createdAt"] = ensure_datetime(item.get("created_at")) or task["createdAt"]
+    task["updatedAt"] = ensure_datetime(item.get("status_update_time")) or task["updatedAt"]
+    if note:
+        task["history"] = [{"at": now, "description": note}]
+    return task
+
+
+def bootstrap_from_legacy() -> List[dict]:
+    if not LEGACY_TASKS_PATH.exists():
+        return []
+
+    with LEGACY_TASKS_PATH.open("r", encoding="utf-8") as legacy_file:
+        try:
+            legacy_tasks = legacy_file.read()
+        except OSError:
+            legacy_tasks = "[]"
+
+    try:
+        data = json.loads(legacy_tasks)
+    except ValueError:
+        data = []
+
+    tasks: List[dict] = []
+    for item in data:
+        item = {**item, "id": item.get("id") or len(tasks) + 1}
+        task = task_from_cli(item)
+        task["history"] = [
+            {
+                "at": task["createdAt"],
+                "description": "Imported from legacy tasks.json",
+            }
+        ]
+        if not item.get("status_update_time"):
+            task["updatedAt"] = task["createdAt"]
+        tasks.append(task)
+    return tasks
+
+
+def json_store() -> JsonTaskStore:
+    return JsonTaskStore(
+        DATA_PATH, JOURNAL_PATH, bootstrap=bootstrap_from_legacy, history_path=HISTORY_PATH
+    )
+
+
+def migrate_to_sqlite() -> List[dict]:
+    if DATA_PATH.exists():
+        json_source = json_store()
+        try:
+            return json_source.export()
+        finally:
+            json_source.close()
+    return bootstrap_from_legacy()
+
+
+def open_shared_store(db_path: Path = DB_PATH) -> SqliteTaskStore:
+    return SqliteTaskStore(db_path, migrate=migrate_to_sqlite)
@@ -0,0 +1,1037 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+from contextlib import contextmanager
+from threading import Condition, Lock, Thread, local
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+def write_snapshot(path: Path, tasks: Iterable[dict]) -> int:
+    """Atomically replace ``path`` with ``tasks`` (write to a temp file, fsync, rename).
+
+    Returns the number of bytes written.
+    """
+    if not path.parent.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with tmp_path.open("w", encoding="utf-8") as target:
+        json.dump(list(tasks), target, indent=2)
+        target.flush()
+        os.fsync(target.fileno())
+        size = os.fstat(target.fileno()).st_size
+    os.replace(tmp_path, path)
+    return size
+
+
+def file_size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+def history_entries(entries: Iterable[dict]) -> List[dict]:
+    return [{"at": entry.get("at"), "description": entry.get("description")} for entry in entries]
+
+
+def split_history(task: Any) -> Tuple[dict, List[dict]]:
+    """``task`` as a plain dict without inline history, and the entries it carried.
+
+    A task handed over with a ``history`` list (a new task, or one stored
+    before history was archived) gets ``historyCount`` from its length.
+    """
+    body = dict(task)
+    entries = body.pop("history", None)
+    if entries is None:
+        return body, []
+    body["historyCount"] = len(entries)
+    return body, history_entries(entries)
+
+
+def apply_record(tasks_by_id: Dict[int, dict], record: dict) -> None:
+    op = record.get("op")
+    if op == "put":
+        task = record["task"]
+        tasks_by_id[int(task["id"])] = task
+    elif op == "patch":
+        task = tasks_by_id.get(int(record["id"]))
+        if task is None:
+            return
+        task.update(record.get("fields") or {})
+        if record.get("history"):
+            # Journals written before history was archived. Entries are placed
+            # at a fixed offset so replaying a record that is already
+            # reflected in the snapshot leaves the history unchanged.
+            existing = task.get("history") or []
+            start = record.get("historyAt", len(existing))
+            task["history"] = existing[:start] + record["history"]
+    elif op == "delete":
+        tasks_by_id.pop(int(record["id"]), None)
+
+
+class TaskJournal:
+    """Append-only log of task mutations layered on top of a JSON snapshot.
+
+    Every mutation is one JSON line. Appends are made durable with group
+    commit: writers call :meth:`wait_durable` with the sequence number they
+    got back and a single background ``fsync`` covers every record appended
+    since the previous one. Once the log grows past ``compact_after`` records
+    the caller folds it into a fresh snapshot with :meth:`compact`.
+    ``before_sync`` runs ahead of every journal fsync and snapshot write,
+    for files the records point into (the history archive).
+    """
+
+    def __init__(
+        self,
+        snapshot_path: Path,
+        journal_path: Path,
+        fsync_interval: float = 0.005,
+        compact_after: int = 1000,
+        before_sync: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.fsync_interval = fsync_interval
+        self.compact_after = compact_after
+        self.before_sync = before_sync
+        self.records = 0
+        self.bytes_written = 0
+        self._handle = None
+        self._appended = 0
+        self._synced = 0
+        self._cond = Condition()
+        self._closed = False
+        self._syncer: Optional[Thread] = None
+
+    # -- recovery -----------------------------------------------------------
+
+    def replay(self, tasks: List[dict]) -> List[dict]:
+        """Apply the journal on top of ``tasks`` (the snapshot contents).
+
+        A torn trailing line left by a crash mid-append is discarded and the
+        journal is truncated back to its last complete record.
+        """
+        if not self.journal_path.exists():
+            return tasks
+        tasks_by_id = {int(task["id"]): task for task in tasks}
+        good_offset = 0
+        with self.journal_path.open("rb") as source:
+            for line in source:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                apply_record(tasks_by_id, record)
+                good_offset += len(line)
+                self.records += 1
+        if good_offset != self.journal_path.stat().st_size:
+            with self.journal_path.open("r+b") as journal:
+                journal.truncate(good_offset)
+        return list(tasks_by_id.values())
+
+    # -- appends ------------------------------------------------------------
+
+    def _open(self):
+        if self._handle is None:
+            if not self.journal_path.parent.exists():
+                self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+            self._handle = self.journal_path.open("ab", buffering=0)
+            self._syncer = Thread(target=self._sync_loop, name="journal-fsync", daemon=True)
+            self._syncer.start()
+        return self._handle
+
+    def append(self, record: dict) -> int:
+        line = json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n"
+        with self._cond:
+            self._open().write(line)
+            self.bytes_written += len(line)
+            self._appended += 1
+            self.records += 1
+            self._cond.notify_all()
+            return self._appended
+
+    def append_put(self, task: dict) -> int:
+        return self.append({"op": "put", "task": task})
+
+    def append_patch(self, task_id: int, fields: dict) -> int:
+        return self.append({"op": "patch", "id": task_id, "fields": fields})
+
+    def append_delete(self, task_id: int) -> int:
+        return self.append({"op": "delete", "id": task_id})
+
+    # -- durability ---------------------------------------------------------
+
+    def _sync_loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._closed and self._synced >= self._appended:
+                    self._cond.wait()
+                if self._closed:
+                    return
+            # Let concurrent writers pile onto this fsync before issuing it.
+            time.sleep(self.fsync_interval)
+            with self._cond:
+                handle = self._handle
+                target = self._appended
+            if handle is None:
+                continue
+            try:
+                if self.before_sync is not None:
+                    self.before_sync()
+                os.fsync(handle.fileno())
+            except (OSError, ValueError):
+                continue
+            with self._cond:
+                self._synced = max(self._synced, target)
+                self._cond.notify_all()
+
+    def wait_durable(self, seq: int) -> None:
+        with self._cond:
+            while self._synced < seq and self._handle is not None:
+                self._cond.wait()
+
+    def sync(self) -> None:
+        with self._cond:
+            if self._handle is not None:
+                if self.before_sync is not None:
+                    self.before_sync()
+                os.fsync(self._handle.fileno())
+                self._synced = self._appended
+                self._cond.notify_all()
+
+    # -- compaction ---------------------------------------------------------
+
+    def needs_compaction(self) -> bool:
+        return self.records >= self.compact_after
+
+    def compact(self, tasks: Iterable[dict]) -> None:
+        """Write ``tasks`` as the new snapshot and start an empty journal.
+
+        Every record type replays idempotently, so a crash between the
+        rename and the truncate only re-applies changes the snapshot has.
+        """
+        with self._cond:
+            if self.before_sync is not None:
+                self.before_sync()
+            self.bytes_written += write_snapshot(self.snapshot_path, tasks)
+            if self._handle is not None:
+                self._handle.truncate(0)
+                os.fsync(self._handle.fileno())
+            elif self.journal_path.exists():
+                self.journal_path.unlink()
+            self.records = 0
+            self._synced = self._appended
+            self._cond.notify_all()
+
+    def close(self) -> None:
+        with self._cond:
+            if self._handle is not None:
+                if self.before_sync is not None:
+                    self.before_sync()
+                os.fsync(self._handle.fileno())
+                self._handle.close()
+                self._handle = None
+            self._synced = self._appended
+            self._closed = True
+            self._cond.notify_all()
+
+
+class HistoryArchive:
+    """Append-only file of task history entries, read back one task at a time.
+
+    A line is one entry plus the offset of the same task's previous entry
+    (``{"id", "at", "description", "prev"}``), so a task's history is a
+    chain from its newest entry backwards: the owner remembers only that
+    newest offset per task, and reading a history seeks along the task's
+    own lines instead of scanning the file. The owner must :meth:`sync`
+    before it durably records a new offset, so a crash can lose entries
+    but never leave an offset pointing past the end of the file.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.bytes_written = 0
+        self._handle = None
+        self._size = 0
+        self._dirty = False
+        self._lock = Lock()
+
+    def append(self, task_id: int, entries: List[dict], tail: int) -> int:
+        """Chain ``entries`` after the entry at offset ``tail`` (-1: none); returns the new tail."""
+        if not entries:
+            return tail
+        with self._lock:
+            if self._handle is None:
+                if not self.path.parent.exists():
+                    self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._handle = self.path.open("ab", buffering=0)
+                self._size = self._handle.seek(0, os.SEEK_END)
+            lines = []
+            offset = self._size
+            for entry in entries:
+                line = {"id": task_id, **entry, "prev": tail}
+                lines.append(json.dumps(line, separators=(",", ":")).encode("utf-8") + b"\n")
+                tail, offset = offset, offset + len(lines[-1])
+            data = b"".join(lines)
+            self._handle.write(data)
+            self._size = offset
+            self.bytes_written += len(data)
+            self._dirty = True
+        return tail
+
+    def read(self, tail: int, limit: Optional[int] = None) -> List[dict]:
+        """The chain ending at ``tail``, oldest first; only the newest ``limit`` entries."""
+        entries: List[dict] = []
+        if tail < 0 or not self.path.exists():
+            return entries
+        with self.path.open("rb") as source:
+            while tail >= 0 and (limit is None or len(entries) < limit):
+                source.seek(tail)
+                line = json.loads(source.readline())
+                entries.append({"at": line.get("at"), "description": line.get("description")})
+                tail = line["prev"]
+        entries.reverse()
+        return entries
+
+    def sync(self) -> None:
+        with self._lock:
+            if self._handle is not None and self._dirty:
+                os.fsync(self._handle.fileno())
+                self._dirty = False
+
+    def close(self) -> None:
+        self.sync()
+        with self._lock:
+            if self._handle is not None:
+                self._handle.close()
+                self._handle = None
+
+
+class TaskStore:
+    """Persistence backend behind the tasks API.
+
+    The API keeps its working set in memory; a store only has to load it once
+    and durably record each mutation. ``put``/``patch``/``delete`` return a
+    token that :meth:`wait_durable` blocks on, which lets backends batch
+    their syncs.
+
+    History entries are kept apart from the tasks, in an append-only
+    archive read with :meth:`history`: loaded tasks only carry
+    ``historyCount``, so neither memory nor the cost of saving a task grows
+    with its number of edits. A task's ``history`` list given to :meth:`put`,
+    and the entries past ``history_len`` given to :meth:`patch`, are
+    appended to the archive.
+    """
+
+    # observe(phase, seconds), when set: "lock_wait" per write transaction,
+    # for backends that share a write lock with other processes.
+    observe: Optional[Callable[[str, float], None]] = None
+
+    def load(self) -> List[dict]:
+        return []
+
+    def put(self, task: dict) -> int:
+        return 0
+
+    def patch(self, task: dict, before: dict, history_len: int) -> int:
+        return self.put(task)
+
+    def delete(self, task_id: int) -> int:
+        return 0
+
+    def history(self, task_id: int, limit: Optional[int] = None) -> List[dict]:
+        """A task's archived entries, oldest first; only the newest ``limit`` if given."""
+        return []
+
+    def histories(self, task_ids: Iterable[int]) -> Dict[int, List[dict]]:
+        return {task_id: self.history(task_id) for task_id in task_ids}
+
+    def wait_durable(self, token: int) -> None:
+        return None
+
+    def bytes_written(self) -> int:
+        """Bytes this process has written to the store's files so far."""
+        return 0
+
+    def disk_bytes(self) -> int:
+        """Current size of the store's files."""
+        return 0
+
+    def reserve_ids(self, count: int = 1) -> Optional[int]:
+        """First of ``count`` fresh ids, for stores shared between processes; None otherwise."""
+        return None
+
+    def current_version(self) -> int:
+        return 0
+
+    def changes_since(self, version: int) -> Optional[Tuple[List[dict], List[int], int]]:
+        """``(tasks, deleted ids, version)`` written since ``version`` by any process.
+
+        Only stores shared between processes implement it; others return None.
+        """
+        return None
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """Group the writes made inside the block into one commit where supported."""
+        yield
+
+    @contextmanager
+    def savepoint(self) -> Iterator[None]:
+        """Inside a transaction, undo only the block's writes if it raises.
+
+        Stores without transactions keep whatever the block wrote before
+        the error.
+        """
+        yield
+
+    def needs_compaction(self) -> bool:
+        return False
+
+    def compact(self, tasks: Iterable[dict]) -> None:
+        return None
+
+    def close(self) -> None:
+        return None
+
+
+class MemoryTaskStore(TaskStore):
+    """Keeps nothing on disk; seeded from ``initial`` for tests and demos.
+
+    Its history archive is a dict of lists, so here history does take memory.
+    """
+
+    def __init__(self, initial: Optional[List[dict]] = None) -> None:
+        self.initial = initial or []
+        self._history: Dict[int, List[dict]] = {}
+
+    def load(self) -> List[dict]:
+        tasks = []
+        for task in self.initial:
+            body, entries = split_history(task)
+            self._history[int(body["id"])] = entries
+            tasks.append(body)
+        return tasks
+
+    def put(self, task: dict) -> int:
+        if "history" in task:
+            self._history[int(task["id"])] = history_entries(task["history"])
+        return 0
+
+    def patch(self, task: dict, before: dict, history_len: int) -> int:
+        added = task.get("history", [])[history_len:]
+        if added:
+            self._history.setdefault(int(task["id"]), []).extend(history_entries(added))
+        return 0
+
+    def delete(self, task_id: int) -> int:
+        self._history.pop(task_id, None)
+        return 0
+
+    def history(self, task_id: int, limit: Optional[int] = None) -> List[dict]:
+        entries = self._history.get(task_id, [])
+        return list(entries if limit is None else entries[-limit:])
+
+
+class JsonTaskStore(TaskStore):
+    """``tasks_store.json`` snapshot plus the append-only :class:`TaskJournal`.
+
+    History goes to a :class:`HistoryArchive` next to them; each task's
+    entry count and newest archive offset are kept here and written into
+    its snapshot and journal records as ``historyCount``/``historyTail``.
+    """
+
+    def __init__(
+        self,
+        snapshot_path: Path,
+        journal_path: Path,
+        bootstrap: Callable[[], List[dict]] = list,
+        compact_after: int = 1000,
+        history_path: Optional[Path] = None,
+    ) -> None:
+        self.snapshot_path = snapshot_path
+        self.bootstrap = bootstrap
+        self.archive = HistoryArchive(history_path or snapshot_path.with_suffix(".history"))
+        self.journal = TaskJournal(
+            snapshot_path,
+            journal_path,
+            compact_after=compact_after,
+            before_sync=self.archive.sync,
+        )
+        # id -> (history entries, offset of the newest one in the archive)
+        self._history: Dict[int, Tuple[int, int]] = {}
+
+    def _read(self) -> List[dict]:
+        with self.snapshot_path.open("r", encoding="utf-8") as source:
+            try:
+                tasks = json.load(source)
+            except ValueError:
+                tasks = []
+        return self.journal.replay(tasks)
+
+    def export(self) -> List[dict]:
+        """Every task with its whole history inline, for moving to another store; writes nothing."""
+        tasks = self._read() if self.snapshot_path.exists() else self.bootstrap()
+        for task in tasks:
+            tail = task.pop("historyTail", -1)
+            if "history" not in task:
+                task["history"] = self.archive.read(tail)
+        return tasks
+
+    def load(self) -> List[dict]:
+        if not self.snapshot_path.exists():
+            write_snapshot(self.snapshot_path, self.bootstrap())
+        tasks = self._read()
+        inline = False
+        for index, task in enumerate(tasks):
+            task_id = int(task["id"])
+            tail = task.pop("historyTail", -1)
+            if "history" in task:
+                # Stored before history was archived, or seeded by bootstrap().
+                task, entries = split_history(task)
+                tail = self.archive.append(task_id, entries, -1)
+                tasks[index] = task
+                inline = True
+            self._history[task_id] = (int(task.get("historyCount") or 0), tail)
+        if inline:
+            # Drop the inline copies now, so a restart does not archive them twice.
+            self.journal.compact(self._with_history(tasks))
+        return tasks
+
+    def _with_history(self, tasks: Iterable[dict]) -> Iterator[dict]:
+        for task in tasks:
+            body, _ = split_history(task)
+            count, tail = self._history.get(int(body["id"]), (0, -1))
+            body["historyCount"] = count
+            body["historyTail"] = tail
+            yield body
+
+    def put(self, task: dict) -> int:
+        body, entries = split_history(task)
+        task_id = int(body["id"])
+        if "history" in task:
+            count, tail = len(entries), self.archive.append(task_id, entries, -1)
+        else:
+            count, tail = self._history.get(task_id, (0, -1))
+        self._history[task_id] = (count, tail)
+        return self.journal.append_put({**body, "historyCount": count, "historyTail": tail})
+
+    def patch(self, task: dict, before: dict, history_len: int) -> int:
+        task_id = int(task["id"])
+        fields = {
+            key: value for key, value in task.items() if key not in before or before[key] != value
+        }
+        fields.pop("history", None)
+        fields.pop("historyCount", None)
+        added = task.get("history", [])[history_len:]
+        if added:
+            count, tail = self._history.get(task_id, (0, -1))
+            tail = self.archive.append(task_id, history_entries(added), tail)
+            self._history[task_id] = (count + len(added), tail)
+            fields["historyCount"] = count + len(added)
+            fields["historyTail"] = tail
+        return self.journal.append_patch(task_id, fields)
+
+    def delete(self, task_id: int) -> int:
+        # The archived entries stay behind, unreachable.
+        self._history.pop(task_id, None)
+        return self.journal.append_delete(task_id)
+
+    def history(self, task_id: int, limit: Optional[int] = None) -> List[dict]:
+        _, tail = self._history.get(task_id, (0, -1))
+        return self.archive.read(tail, limit)
+
+    def wait_durable(self, token: int) -> None:
+        self.journal.wait_durable(token)
+
+    def bytes_written(self) -> int:
+        return self.journal.bytes_written + self.archive.bytes_written
+
+    def disk_bytes(self) -> int:
+        return (
+            file_size(self.snapshot_path)
+            + file_size(self.journal.journal_path)
+            + file_size(self.archive.path)
+        )
+
+    def needs_compaction(self) -> bool:
+        return self.journal.needs_compaction()
+
+    def compact(self, tasks: Iterable[dict]) -> None:
+        self.journal.compact(self._with_history(tasks))
+
+    def close(self) -> None:
+        self.journal.close()
+        self.archive.close()
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    status TEXT,
+    category TEXT,
+    priority_score INTEGER,
+    scheduled_start TEXT,
+    scheduled_end TEXT,
+    updated_at TEXT,
+    body TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status);
+CREATE INDEX IF NOT EXISTS idx_tasks_category ON tasks(category);
+CREATE INDEX IF NOT EXISTS idx_tasks_priority_score ON tasks(priority_score);
+CREATE INDEX IF NOT EXISTS idx_tasks_scheduled_start ON tasks(scheduled_start);
+CREATE TABLE IF NOT EXISTS deleted_tasks (
+    id INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS task_history (
+    seq INTEGER PRIMARY KEY,
+    task_id INTEGER NOT NULL,
+    at TEXT,
+    description TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_task_history_task ON task_history(task_id, seq);
+"""
+
+TASK_COLUMNS = (
+    "id, status, category, priority_score, scheduled_start, scheduled_end, "
+    "updated_at, body, version"
+)
+UPSERT_TASK = f"INSERT OR REPLACE INTO tasks ({TASK_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+
+
+def task_row(task: dict, version: int = 0) -> tuple:
+    return (
+        int(task["id"]),
+        task.get("status"),
+        task.get("category"),
+        task.get("priorityScore"),
+        task.get("scheduledStart"),
+        task.get("scheduledEnd"),
+        task.get("updatedAt"),
+        json.dumps(task, separators=(",", ":")),
+        version,
+    )
+
+
+def history_rows(task_id: int, entries: List[dict]) -> List[tuple]:
+    return [(task_id, entry.get("at"), entry.get("description")) for entry in entries]
+
+
+class SqliteTaskStore(TaskStore):
+    """One row per task in an SQLite database running in WAL mode.
+
+    Hot columns are mirrored out of the JSON ``body`` so they can be indexed.
+    Each thread gets its own connection. On first open an empty database is
+    filled from ``migrate`` (the JSON store or the legacy ``tasks.json``).
+
+    The database is shared by the API and the CLI, so it is safe to write
+    from several processes at once:
+
+    - writes run in ``BEGIN IMMEDIATE`` transactions;
+    - :meth:`patch` merges only the fields the caller changed into the
+      stored row and appends its new history entries to ``task_history``,
+      so concurrent edits to different fields of a task are not lost;
+    - ids come from :meth:`reserve_ids`, never from a process's own max;
+    - every transaction stamps its rows (and delete tombstones) with a new
+      store version, which :meth:`changes_since` uses to hand each process
+      what the others changed.
+    """
+
+    def __init__(self, db_path: Path, migrate: Callable[[], List[dict]] = list) -> None:
+        self.db_path = db_path
+        self.migrate = migrate
+        self._bytes_written = 0
+        self._local = local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = Lock()
+        conn = self.connection()
+        conn.executescript(SQLITE_SCHEMA)
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(tasks)")]
+        if "version" not in columns:
+            with self.transaction():
+                # Databases created before the version column; re-check under the write lock.
+                columns = [row[1] for row in conn.execute("PRAGMA table_info(tasks)")]
+                if "version" not in columns:
+                    conn.execute("ALTER TABLE tasks ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if not self.db_path.parent.exists():
+                self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            # Autocommit mode: transactions are begun explicitly (see transaction()).
+            conn = sqlite3.connect(
+                str(self.db_path), timeout=30, check_same_thread=False, isolation_level=None
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def load(self) -> List[dict]:
+        conn = self.connection()
+        if self._meta(conn, "migrated") is None:
+            with self.transaction():
+                # Another process may have migrated while we waited for the lock.
+                if self._meta(conn, "migrated") is None:
+                    self._write(self.migrate(), self._version())
+                    conn.execute("INSERT OR REPLACE INTO meta VALUES ('migrated', '1')")
+        if self._meta(conn, "history_archived") is None:
+            with self.transaction():
+                if self._meta(conn, "history_archived") is None:
+                    self._archive_inline_history()
+                    conn.execute("INSERT OR REPLACE INTO meta VALUES ('history_archived', '1')")
+        rows = conn.execute("SELECT body FROM tasks ORDER BY id").fetchall()
+        return [json.loads(body) for (body,) in rows]
+
+    def _archive_inline_history(self) -> None:
+        """Move the history lists of rows written before ``task_history`` existed into it."""
+        conn = self.connection()
+        rows = conn.execute(
+            "SELECT body FROM tasks WHERE body LIKE '%\"history\":%' ORDER BY id"
+        ).fetchall()
+        tasks = [json.loads(body) for (body,) in rows]
+        self._write([task for task in tasks if "history" in task], self._version())
+
+    def _meta(self, conn: sqlite3.Connection, key: str) -> Optional[str]:
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def current_version(self) -> int:
+        return int(self._meta(self.connection(), "version") or 0)
+
+    def _version(self) -> int:
+        """The version stamped on this transaction's writes, allocated on first use."""
+        version = getattr(self._local, "version", None)
+        if version is None:
+            conn = self.connection()
+            version = int(self._meta(conn, "version") or 0) + 1
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (str(version),))
+            self._local.version = version
+        return version
+
+    def get(self, task_id: int) -> Optional[dict]:
+        row = self.connection().execute(
+            "SELECT body FROM tasks WHERE id = ?", (task_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        if getattr(self._local, "in_transaction", False):
+            yield
+            return
+        conn = self.connection()
+        started = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        if self.observe is not None:
+            self.observe("lock_wait", time.perf_counter() - started)
+        self._local.in_transaction = True
+        try:
+            yield
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+        finally:
+            self._local.in_transaction = False
+            self._local.version = None
+
+    @contextmanager
+    def read_snapshot(self) -> Iterator[None]:
+        """A deferred transaction, so several reads see one state without taking the write lock."""
+        if getattr(self._local, "in_transaction", False):
+            yield
+            return
+        conn = self.connection()
+        conn.execute("BEGIN")
+        try:
+            yield
+        finally:
+            conn.execute("COMMIT")
+
+    @contextmanager
+    def savepoint(self) -> Iterator[None]:
+        if not getattr(self._local, "in_transaction", False):
+            with self.transaction():
+                yield
+            return
+        conn = self.connection()
+        version = getattr(self._local, "version", None)
+        conn.execute("SAVEPOINT unit")
+        try:
+            yield
+        except BaseException:
+            conn.execute("ROLLBACK TO unit")
+            conn.execute("RELEASE unit")
+            # A version allocated inside the block was rolled back with it.
+            self._local.version = version
+            raise
+        else:
+            conn.execute("RELEASE unit")
+
+    def _upsert(self, rows: List[tuple]) -> None:
+        self.connection().executemany(UPSERT_TASK, rows)
+        # Bodies are ASCII JSON, so characters are bytes; the indexed columns are left out.
+        self._bytes_written += sum(len(row[7]) for row in rows)
+
+    def _append_history(self, rows: List[tuple]) -> None:
+        self.connection().executemany(
+            "INSERT INTO task_history (task_id, at, description) VALUES (?, ?, ?)", rows
+        )
+        self._bytes_written += sum(len(row[1] or "") + len(row[2] or "") for row in rows)
+
+    def _write(self, tasks: Iterable[Any], version: int) -> None:
+        """Upsert whole tasks; a task carrying a ``history`` list replaces its archived one."""
+        conn = self.connection()
+        rows = []
+        entries = []
+        for task in tasks:
+            body, added = split_history(task)
+            if "history" in task:
+                conn.execute("DELETE FROM task_history WHERE task_id = ?", (int(body["id"]),))
+                entries.extend(history_rows(int(body["id"]), added))
+            rows.append(task_row(body, version))
+        self._upsert(rows)
+        self._append_history(entries)
+
+    def bytes_written(self) -> int:
+        return self._bytes_written
+
+    def disk_bytes(self) -> int:
+        wal = self.db_path.with_name(self.db_path.name + "-wal")
+        return file_size(self.db_path) + file_size(wal)
+
+    def put(self, task: dict) -> int:
+        with self.transaction():
+            conn = self.connection()
+            self._write([task], self._version())
+            conn.execute("DELETE FROM deleted_tasks WHERE id = ?", (int(task["id"]),))
+        return 0
+
+    def patch(self, task: dict, before: dict, history_len: int) -> int:
+        task_id = int(task["id"])
+        with self.transaction():
+            current = self.get(task_id)
+            if current is None:
+                # Deleted by another writer in the meantime; the delete wins.
+                return 0
+            for key, value in task.items():
+                if key in ("history", "historyCount"):
+                    continue
+                if key not in before or before[key] != value:
+                    current[key] = value
+            added = task.get("history", [])[history_len:]
+            if added:
+                # Counted here, so entries another process added are not overwritten.
+                current["historyCount"] = int(current.get("historyCount") or 0) + len(added)
+                self._append_history(history_rows(task_id, added))
+            self._upsert([task_row(current, self._version())])
+        return 0
+
+    def history(self, task_id: int, limit: Optional[int] = None) -> List[dict]:
+        rows = self.connection().execute(
+            "SELECT at, description FROM task_history WHERE task_id = ?"
+            " ORDER BY seq DESC LIMIT ?",
+            (task_id, -1 if limit is None else limit),
+        ).fetchall()
+        return [{"at": at, "description": description} for at, description in reversed(rows)]
+
+    def histories(self, task_ids: Iterable[int]) -> Dict[int, List[dict]]:
+        found: Dict[int, List[dict]] = {}
+        ids = list(task_ids)
+        conn = self.connection()
+        # Chunks stay under SQLite's limit on bound parameters.
+        for start in range(0, len(ids), 500):
+            chunk = ids[start : start + 500]
+            rows = conn.execute(
+                "SELECT task_id, at, description FROM task_history"
+                f" WHERE task_id IN ({','.join('?' * len(chunk))}) ORDER BY seq",
+                chunk,
+            )
+            for task_id, at, description in rows:
+                found.setdefault(task_id, []).append({"at": at, "description": description})
+        return {task_id: found.get(task_id, []) for task_id in ids}
+
+    def delete(self, task_id: int) -> int:
+        with self.transaction():
+            conn = self.connection()
+            conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+            conn.execute("DELETE FROM task_history WHERE task_id = ?", (task_id,))
+            conn.execute(
+                "INSERT OR REPLACE INTO deleted_tasks VALUES (?, ?)", (task_id, self._version())
+            )
+        return 0
+
+    def reserve_ids(self, count: int = 1) -> Optional[int]:
+        """Claim ``count`` consecutive unused ids for this process; returns the first."""
+        with self.transaction():
+            conn = self.connection()
+            (max_id,) = conn.execute(
+                "SELECT MAX(id) FROM (SELECT MAX(id) AS id FROM tasks"
+                " UNION ALL SELECT MAX(id) FROM deleted_tasks)"
+            ).fetchone()
+            first = max(int(self._meta(conn, "next_id") or 1), (max_id or 0) + 1)
+            conn.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('next_id', ?)", (str(first + count),)
+            )
+        return first
+
+    def changes_since(self, version: int) -> Optional[Tuple[List[dict], List[int], int]]:
+        """Tasks written and ids deleted after ``version``, plus the current version."""
+        conn = self.connection()
+        with self.read_snapshot():
+            current = int(self._meta(conn, "version") or 0)
+            if current == version:
+                return [], [], current
+            rows = conn.execute(
+                "SELECT body FROM tasks WHERE version > ? ORDER BY version", (version,)
+            ).fetchall()
+            deleted = conn.execute(
+                "SELECT id FROM deleted_tasks WHERE version > ? ORDER BY version", (version,)
+            ).fetchall()
+        return [json.loads(body) for (body,) in rows], [task_id for (task_id,) in deleted], current
+
+    def compact(self, tasks: Iterable[dict]) -> None:
+        with self.transaction():
+            conn = self.connection()
+            version = self._version()
+            conn.execute("DELETE FROM tasks")
+            self._write(tasks, version)
+
+    def close(self) -> None:
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = local()
+
+
+# A store method and its arguments, run by the flush thread.
+StoreCall = Tuple[Callable[..., Any], tuple]
+
+
+class FlushQueue:
+    """Write-behind persistence for a store driven from an asyncio event loop.
+
+    Handlers mutate the in-memory cache on the loop and :meth:`submit` the
+    matching store call (with its own copy of the data), or
+    :meth:`submit_all` calls that must land together. A single flush task
+    drains everything queued so far in a worker thread, inside one store
+    transaction followed by one durable sync, then resolves the future of
+    every request in that batch with its call's return value. Each request
+    runs in its own savepoint, so a call that raises fails only its own
+    future; a failed commit or sync fails the whole batch. Reads can be
+    queued the same way to see every write submitted before them. Requests
+    arriving mid-flush form the next batch, so under load many writes share
+    each commit.
+    """
+
+    def __init__(
+        self,
+        store: TaskStore,
+        snapshot: Callable[[], List[dict]],
+        observe: Optional[Callable[[str, float], None]] = None,
+    ) -> None:
+        self.store = store
+        self.snapshot = snapshot
+        # observe(phase, seconds): "flush_wait" per request (queued until its
+        # batch starts), "persist" per batch and "compact".
+        self.observe = observe
+        self.batches = 0
+        self.writes = 0
+        # (calls, future, submitted at, whether the future gets the one call's result)
+        self._pending: List[Tuple[List[StoreCall], "asyncio.Future[Any]", float, bool]] = []
+        self._flushing: Optional["asyncio.Task[None]"] = None
+
+    def submit(self, write: Callable[..., Any], *args: Any) -> "asyncio.Future[Any]":
+        return self._queue([(write, args)], True)
+
+    def submit_all(self, calls: List[StoreCall]) -> "asyncio.Future[List[Any]]":
+        """Queue ``(write, args)`` calls that commit, or fail and roll back, together."""
+        return self._queue(calls, False)
+
+    def _queue(self, calls: List[StoreCall], single: bool) -> "asyncio.Future[Any]":
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((calls, future, time.perf_counter(), single))
+        flushing = self._flushing
+        if flushing is None or flushing.done() or flushing.get_loop() is not loop:
+            self._flushing = loop.create_task(self._flush())
+        return future
+
+    async def _flush(self) -> None:
+        while self._pending:
+            batch, self._pending = self._pending, []
+            started = time.perf_counter()
+            if self.observe is not None:
+                for _, _, submitted, _ in batch:
+                    self.observe("flush_wait", started - submitted)
+            try:
+                outcomes = await asyncio.to_thread(self._write, batch)
+            except Exception as exc:  # the commit or sync failed: nothing in the batch landed
+                for _, future, _, _ in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            if self.observe is not None:
+                self.observe("persist", time.perf_counter() - started)
+            for (_, future, _, single), (error, results) in zip(batch, outcomes):
+                if future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(results[0] if single else results)
+            if self.store.needs_compaction():
+                # Taken on the loop, so it is consistent; it may include
+                # changes still queued, which replay idempotently later.
+                started = time.perf_counter()
+                await asyncio.to_thread(self.store.compact, self.snapshot())
+                if self.observe is not None:
+                    self.observe("compact", time.perf_counter() - started)
+
+    def _write(
+        self, batch: List[Tuple[List[StoreCall], "asyncio.Future[Any]", float, bool]]
+    ) -> List[Tuple[Optional[Exception], List[Any]]]:
+        # (error, results) per request; a request that raised was rolled back alone.
+        outcomes: List[Tuple[Optional[Exception], List[Any]]] = []
+        token = None
+        with self.store.transaction():
+            for calls, _, _, _ in batch:
+                try:
+                    with self.store.savepoint():
+                        results = [write(*args) for write, args in calls]
+                except Exception as exc:
+                    outcomes.append((exc, []))
+                    continue
+                outcomes.append((None, results))
+                for result in results:
+                    if isinstance(result, int):
+                        token = result
+        if token is not None:
+            self.store.wait_durable(token)
+        self.batches += 1
+        self.writes += sum(len(calls) for calls, _, _, _ in batch)
+        return outcomes
+
+    async def drain(self) -> None:
+        """Wait until every write queued so far, and any queued meanwhile, has landed."""
+        while self._flushing is not None and not self._flushing.done():
+            await self._flushing
@@ -0,0 +1,365 @@
+from __future__ import annotations
+
+import sys
+import time
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict, defaultdict
+from collections.abc import Mapping, MutableMapping
+from typing import Any, Callable, Collection, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+SortKey = Tuple[int, str, int]
+# (status, category, scheduledStart) as last indexed for a task.
+Facets = Tuple[Optional[str], Optional[str], Optional[str]]
+# Fields of an API task, held in a TaskRecord's slots in this order.
+RECORD_FIELDS = (
+    "id",
+    "title",
+    "description",
+    "category",
+    "priorityScore",
+    "priorityLabel",
+    "priorityPinned",
+    "status",
+    "estimatedMinutes",
+    "scheduledStart",
+    "scheduledEnd",
+    "dueAt",
+    "rationale",
+    "suggestions",
+    "conflict",
+    "duplicateOf",
+    "historyCount",
+    "createdAt",
+    "updatedAt",
+)
+_SLOTTED = frozenset(RECORD_FIELDS)
+# Revisions a process starts above per millisecond since the epoch; still
+# exact as a JavaScript number (below 2**53) until the 2200s.
+REVISIONS_PER_MS = 1024
+# Values shared by many tasks; interned so each record points at one string.
+_INTERNED = frozenset(("category", "priorityLabel", "status"))
+
+
+class TaskRecord(MutableMapping):
+    """One task of the working set: a mapping over ``__slots__`` instead of a dict.
+
+    A dict per task carries a hash table on top of its values; slots keep
+    the known fields at fixed offsets, values most tasks repeat (status,
+    category, label) are interned and suggestions are a tuple, so a record
+    is several times smaller (see benchmarks/bench_memory.py). Keys outside
+    :data:`RECORD_FIELDS` go to an overflow dict. The task's history is
+    not here: records only count it (``historyCount``) and the store's
+    archive holds the entries.
+
+    It behaves like the dict it replaces (item access, ``get``, ``in``,
+    ``update``, ``clear``, ``{**task}``, equality with dicts) but is not a
+    dict: use ``dict(task)`` before handing it to ``json``.
+    """
+
+    __slots__ = RECORD_FIELDS + ("_extra",)
+
+    def __init__(self, task: Any = ()) -> None:
+        self._extra: Optional[Dict[str, Any]] = None
+        self.update(task)
+
+    def __getitem__(self, key: str) -> Any:
+        if key in _SLOTTED:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in _SLOTTED:
+            return getattr(self, key, default)
+        return default if self._extra is None else self._extra.get(key, default)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key in _SLOTTED:
+            if key in _INTERNED and type(value) is str:
+                value = sys.intern(value)
+            elif key == "suggestions" and value is not None:
+                value = tuple(value)
+            setattr(self, key, value)
+        elif self._extra is None:
+            self._extra = {key: value}
+        else:
+            self._extra[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if key in _SLOTTED:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif self._extra is None:
+            raise KeyError(key)
+        else:
+            del self._extra[key]
+
+    def __contains__(self, key: object) -> bool:
+        if key in _SLOTTED:
+            return hasattr(self, key)  # type: ignore[arg-type]
+        return self._extra is not None and key in self._extra
+
+    def __iter__(self) -> Iterator[str]:
+        for name in RECORD_FIELDS:
+            if hasattr(self, name):
+                yield name
+        if self._extra:
+            yield from list(self._extra)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Mapping):
+            return NotImplemented
+        return dict(self) == dict(other)
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def clear(self) -> None:
+        for name in RECORD_FIELDS:
+            if hasattr(self, name):
+                delattr(self, name)
+        self._extra = None
+
+    def __repr__(self) -> str:
+        return f"TaskRecord({dict(self)!r})"
+
+
+def priority_key(task: dict) -> SortKey:
+    return (-int(task.get("priorityScore", 0)), task.get("title", ""), int(task["id"]))
+
+
+def task_facets(task: dict) -> Facets:
+    return (task.get("status"), task.get("category"), task.get("scheduledStart"))
+
+
+class TaskIndex:
+    """In-memory working set of tasks.
+
+    Tasks (:class:`TaskRecord` objects in the API) are held in a dict keyed
+    by id (insertion ordered, which is also the order they are persisted
+    in) next to a list of ``(-priorityScore, title, id)`` keys kept sorted
+    with ``bisect``, plus secondary indexes on status, category and
+    scheduledStart for :meth:`query`, and each task's encoded JSON.
+    Callers must run :meth:`reindex` after changing a stored task.
+
+    Every add, reindex and remove bumps :attr:`revision`. Revisions start at
+    the process start time in milliseconds times :data:`REVISIONS_PER_MS`,
+    so a process would need over a million changes per second of uptime to
+    reach the revisions of the next one; :meth:`changes_since` answers
+    delta-sync requests from them, from the end of the initial load on.
+    Only the newest ``max_tombstones`` deleted ids are remembered; asking
+    for changes since before the oldest one dropped gets a resync.
+    """
+
+    def __init__(self, tasks: Iterable[dict] = (), max_tombstones: int = 10_000) -> None:
+        self.by_id: Dict[int, dict] = {}
+        self._keys: List[SortKey] = []
+        self._key_of: Dict[int, SortKey] = {}
+        self._facets_of: Dict[int, Facets] = {}
+        self._by_status: Dict[str, Set[int]] = defaultdict(set)
+        self._by_category: Dict[str, Set[int]] = defaultdict(set)
+        # (scheduledStart, id); normalised ISO strings sort chronologically.
+        self._by_start: List[Tuple[str, int]] = []
+        self._encoded: Dict[int, bytes] = {}
+        # id -> revision of its last change, ordered oldest change first: live
+        # tasks, and deleted ids (tombstones) capped at max_tombstones.
+        self._changed: "OrderedDict[int, int]" = OrderedDict()
+        self._deleted: "OrderedDict[int, int]" = OrderedDict()
+        self.max_tombstones = max_tombstones
+        self.base_revision = int(time.time() * 1000) * REVISIONS_PER_MS
+        self.revision = self.base_revision
+        self.max_id = 0
+        for task in tasks:
+            self.add(task)
+        # changes_since() can answer from this revision on; the load used one per task.
+        self.retained_revision = self.revision
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+    def __iter__(self) -> Iterator[dict]:
+        return iter(self.by_id.values())
+
+    def __contains__(self, task_id: object) -> bool:
+        return task_id in self.by_id
+
+    def get(self, task_id: int) -> Optional[dict]:
+        return self.by_id.get(task_id)
+
+    def add(self, task: dict) -> None:
+        task_id = int(task["id"])
+        if task_id in self.by_id:
+            self.remove(task_id)
+        self.by_id[task_id] = task
+        key = priority_key(task)
+        self._key_of[task_id] = key
+        insort(self._keys, key)
+        self._index_facets(task_id, task_facets(task))
+        self.max_id = max(self.max_id, task_id)
+        self._touch(task_id)
+
+    def reindex(self, task: dict) -> None:
+        task_id = int(task["id"])
+        self._encoded.pop(task_id, None)
+        self._touch(task_id)
+        old_key = self._key_of[task_id]
+        new_key = priority_key(task)
+        if old_key != new_key:
+            del self._keys[bisect_left(self._keys, old_key)]
+            insort(self._keys, new_key)
+            self._key_of[task_id] = new_key
+        facets = task_facets(task)
+        if facets != self._facets_of[task_id]:
+            self._unindex_facets(task_id)
+            self._index_facets(task_id, facets)
+
+    def remove(self, task_id: int) -> Optional[dict]:
+        task = self.by_id.pop(task_id, None)
+        if task is not None:
+            key = self._key_of.pop(task_id)
+            del self._keys[bisect_left(self._keys, key)]
+            self._unindex_facets(task_id)
+            self._encoded.pop(task_id, None)
+            self._touch(task_id, deleted=True)
+        return task
+
+    def _touch(self, task_id: int, deleted: bool = False) -> None:
+        self.revision += 1
+        log, other = (self._deleted, self._changed) if deleted else (self._changed, self._deleted)
+        other.pop(task_id, None)
+        log[task_id] = self.revision
+        log.move_to_end(task_id)
+        if len(self._deleted) > self.max_tombstones:
+            _, dropped_at = self._deleted.popitem(last=False)
+            self.retained_revision = dropped_at
+
+    def changes_since(self, revision: int) -> Tuple[List[dict], List[int], bool]:
+        """Tasks changed and ids deleted after ``revision``, newest last.
+
+        The flag is True when ``revision`` predates this process or the
+        oldest tombstone kept (or is from the future) and the caller must
+        resync from the full list instead.
+        """
+        if revision < self.retained_revision or revision > self.revision:
+            return list(self.by_id.values()), [], True
+        changed = [self.by_id[task_id] for task_id in self._since(self._changed, revision)]
+        return changed, self._since(self._deleted, revision), False
+
+    @staticmethod
+    def _since(log: "OrderedDict[int, int]", revision: int) -> List[int]:
+        ids = []
+        for task_id, changed_at in reversed(log.items()):
+            if changed_at <= revision:
+                break
+            ids.append(task_id)
+        ids.reverse()
+        return ids
+
+    def changed_after(self, task_id: int, revision: int) -> bool:
+        changed_at = self._changed.get(task_id)
+        if changed_at is None:
+            changed_at = self._deleted.get(task_id, 0)
+        return changed_at > revision
+
+    def _index_facets(self, task_id: int, facets: Facets) -> None:
+        status, category, start = facets
+        self._facets_of[task_id] = facets
+        if status is not None:
+            self._by_status[status].add(task_id)
+        if category is not None:
+            self._by_category[category].add(task_id)
+        if start:
+            insort(self._by_start, (start, task_id))
+
+    def _unindex_facets(self, task_id: int) -> None:
+        status, category, start = self._facets_of.pop(task_id)
+        if status is not None:
+            self._by_status[status].discard(task_id)
+        if category is not None:
+            self._by_category[category].discard(task_id)
+        if start:
+            del self._by_start[bisect_left(self._by_start, (start, task_id))]
+
+    def encoded(self, task: dict, encode: Callable[[dict], bytes]) -> bytes:
+        """``encode(task)``, memoised until the task is next reindexed or removed."""
+        task_id = int(task["id"])
+        data = self._encoded.get(task_id)
+        if data is None:
+            data = self._encoded[task_id] = encode(task)
+        return data
+
+    def ordered(self) -> Iterator[dict]:
+        """Tasks by descending priority score, then title."""
+        by_id = self.by_id
+        return (by_id[key[2]] for key in self._keys)
+
+    def next_id(self) -> int:
+        return self.max_id + 1
+
+    def query(
+        self,
+        statuses: Optional[Collection[str]] = None,
+        categories: Optional[Collection[str]] = None,
+        min_score: Optional[int] = None,
+        max_score: Optional[int] = None,
+        scheduled_from: Optional[str] = None,
+        scheduled_to: Optional[str] = None,
+        after: Optional[SortKey] = None,
+        limit: Optional[int] = None,
+    ) -> Tuple[List[dict], Optional[SortKey]]:
+        """One page of matching tasks in priority order, plus the key to resume after.
+
+        The priority range is a slice of the sorted keys. When status,
+        category or schedule filters are given, the smallest matching id set
+        drives the scan so unrelated tasks are never visited.
+        """
+        lo = 0 if max_score is None else bisect_left(self._keys, (-max_score,))
+        hi = len(self._keys) if min_score is None else bisect_left(self._keys, (-min_score + 1,))
+        if after is not None:
+            lo = max(lo, bisect_right(self._keys, after))
+
+        candidate_sets: List[Set[int]] = []
+        if statuses is not None:
+            candidate_sets.append(set().union(*(self._by_status.get(s, ()) for s in statuses)))
+        if categories is not None:
+            candidate_sets.append(set().union(*(self._by_category.get(c, ()) for c in categories)))
+        if scheduled_from is not None or scheduled_to is not None:
+            start = 0 if scheduled_from is None else bisect_left(self._by_start, (scheduled_from,))
+            end = (
+                len(self._by_start)
+                if scheduled_to is None
+                else bisect_left(self._by_start, (scheduled_to,))
+            )
+            candidate_sets.append({task_id for _, task_id in self._by_start[start:end]})
+
+        if lo >= hi:
+            keys = []
+        elif candidate_sets:
+            candidate_sets.sort(key=len)
+            smallest, others = candidate_sets[0], candidate_sets[1:]
+            low_key = self._keys[lo]
+            high_key = self._keys[hi] if hi < len(self._keys) else None
+            keys = sorted(
+                self._key_of[task_id]
+                for task_id in smallest
+                if all(task_id in other for other in others)
+                and self._key_of[task_id] >= low_key
+                and (high_key is None or self._key_of[task_id] < high_key)
+            )
+        else:
+            end = hi if limit is None else min(hi, lo + limit + 1)
+            keys = self._keys[lo:end]
+
+        next_after = None
+        if limit is not None and len(keys) > limit:
+            keys = keys[:limit]
+            next_after = keys[-1]
+        return [self.by_id[key[2]] for key in keys], next_after
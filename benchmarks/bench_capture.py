@@ -0,0 +1,110 @@
+"""Capturing a multi-task dump: the add_task tool loop vs batch capture.
+
+Run from the repository root with ``python benchmarks/bench_capture.py``.
+Both paths talk to a stub ``chat_fn`` instead of ollama, which answers
+instantly and charges a modelled latency per call instead: a fixed
+overhead, plus prompt prefill and output decoding at typical
+llama3.2:3b-on-CPU rates. Tasks go to a MemoryTaskManager, so nothing on
+disk is touched.
+"""
+from __future__ import annotations
+
+import contextlib
+import io
+import json
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import task_prioritizer as agent  # noqa: E402
+
+CALL_OVERHEAD_SECONDS = 0.15
+PREFILL_CHARS_PER_SECOND = 4_000
+DECODE_CHARS_PER_SECOND = 80
+SIZES = (1, 5, 10, 25)
+
+
+def dump(size: int) -> str:
+    return "; ".join(f"errand number {number}" for number in range(size))
+
+
+class StubModel:
+    """Answers like a model that understood the dump perfectly."""
+
+    def __init__(self, size: int) -> None:
+        self.tasks = [
+            {"task_text": f"errand number {number}", "category": "Home/Household",
+             "priority_score": number % 11}
+            for number in range(size)
+        ]
+        self.calls = 0
+        self.prompt_chars = 0
+        self.output_chars = 0
+
+    def charge(self, messages, tools, output: str) -> None:
+        self.calls += 1
+        self.prompt_chars += len(json.dumps(messages)) + len(json.dumps(tools or []))
+        self.output_chars += len(output)
+
+    def seconds(self) -> float:
+        return (
+            self.calls * CALL_OVERHEAD_SECONDS
+            + self.prompt_chars / PREFILL_CHARS_PER_SECOND
+            + self.output_chars / DECODE_CHARS_PER_SECOND
+        )
+
+    def chat(self, model, messages, stream=False, tools=None, format=None, **options):
+        if format is not None:
+            content = json.dumps({"tasks": self.tasks})
+            self.charge(messages, tools, content)
+            return {"message": {"role": "assistant", "content": content}}
+        if messages[-1]["role"] == "tool":
+            content = "Added: " + ", ".join(task["task_text"] for task in self.tasks)
+            self.charge(messages, tools, content)
+            return iter([{"message": {"role": "assistant", "content": content}}])
+        calls = [
+            {"function": {"name": "add_task", "arguments": {
+                **task, "priority_label": agent.score_label(task["priority_score"])}}}
+            for task in self.tasks
+        ]
+        self.charge(messages, tools, json.dumps(calls))
+        return iter([{"message": {"role": "assistant", "content": "", "tool_calls": calls}}])
+
+
+def run(size: int, batch: bool) -> tuple:
+    stub = StubModel(size)
+    tasks = agent.MemoryTaskManager()
+    llm = agent.LLM(
+        agent.tools, tasks, system_prompt_path=str(ROOT / "system_prompt.md"), chat_fn=stub.chat
+    )
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if batch:
+            llm.capture_tasks(dump(size))
+        else:
+            for _ in llm.stream_command(f"Add these to my list: {dump(size)}"):
+                pass
+    elapsed = time.perf_counter() - started
+    assert len(tasks.by_id) == size
+    return stub.calls, stub.prompt_chars, stub.output_chars, stub.seconds(), elapsed
+
+
+def main() -> None:
+    print(
+        f"{'tasks':>5} {'mode':>10} {'calls':>5} {'prompt ch':>10} {'output ch':>10}"
+        f" {'model s':>8} {'local ms':>9}"
+    )
+    for size in SIZES:
+        for batch in (False, True):
+            calls, prompt, output, seconds, elapsed = run(size, batch)
+            print(
+                f"{size:>5} {'batch' if batch else 'tool loop':>10} {calls:>5} {prompt:>10}"
+                f" {output:>10} {seconds:>8.2f} {elapsed * 1000:>9.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""End-to-end latency of the CLI agent and the API, over growing task lists.
+
+Run from the repository root::
+
+    python benchmarks/bench_e2e.py [--sizes 10,100,1000,10000,100000] [--reps 50]
+        [--token-latency 0] [--first-token-latency 0] [--json results.json]
+
+The model is benchmarks/stub_ollama.py, served on a local port and reached
+through the real ``ollama`` client, so runs are deterministic and need no
+daemon. With the default zero latencies the numbers are this code's own
+overhead (HTTP to the stub included). The CLI runs on a temporary
+``tasks.json`` and the API on the in-memory store, so nothing in the
+repository is touched.
+
+For every size and operation it reports p50/p99 latency, sequential
+throughput and the peak Python memory allocated while running it once
+more under tracemalloc. ``--json`` also writes the rows to a file, for
+comparing runs between revisions.
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from stub_ollama import StubConfig, start_stub  # noqa: E402
+
+DEFAULT_SIZES = "10,100,1000,10000,100000"
+# Upper bound on operations per (size, op), so the 100k runs stay short.
+WORK_BUDGET = 200_000
+
+
+def percentile(samples: List[float], share: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+
+def measure(name: str, size: int, reps: int, operation: Callable[[int], None]) -> Dict:
+    samples = []
+    started = time.perf_counter()
+    for rep in range(reps):
+        begun = time.perf_counter()
+        operation(rep)
+        samples.append(time.perf_counter() - begun)
+    total = time.perf_counter() - started
+    tracemalloc.start()
+    operation(reps)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "size": size,
+        "op": name,
+        "reps": reps,
+        "p50_ms": statistics.median(samples) * 1000,
+        "p99_ms": percentile(samples, 0.99) * 1000,
+        "ops_per_s": reps / total,
+        "peak_kib": peak / 1024,
+    }
+
+
+def cli_task(task_id: int) -> dict:
+    return {
+        "id": task_id,
+        "text": f"Task {task_id}",
+        "category": "Work",
+        "priority label": "Medium",
+        "priority score": task_id % 11,
+        "status": "Incomplete",
+        "created_at": "2025-01-01T09:00:00",
+        "status_update_time": "2025-01-01T09:00:00",
+    }
+
+
+def api_task(task_id: int) -> dict:
+    score = task_id % 11
+    return {
+        "id": task_id,
+        "title": f"Task {task_id}",
+        "description": "Benchmark task",
+        "category": "Work",
+        "priorityScore": score,
+        "priorityLabel": "High" if score >= 8 else "Medium" if score >= 4 else "Low",
+        "status": "incomplete",
+        "estimatedMinutes": 30,
+        "scheduledStart": None,
+        "scheduledEnd": None,
+        "rationale": None,
+        "suggestions": [],
+        "conflict": False,
+        "historyCount": 1,
+        "createdAt": "2025-01-01T09:00:00Z",
+        "updatedAt": "2025-01-01T09:00:00Z",
+    }
+
+
+def bench_cli(agent, size: int, reps: int, workdir: Path) -> List[Dict]:
+    path = workdir / f"tasks_{size}.json"
+    path.write_text(json.dumps([cli_task(task_id) for task_id in range(1, size + 1)]))
+    llm = agent.LLM(
+        agent.tools,
+        agent.TaskManager(str(path)),
+        system_prompt_path=str(ROOT / "system_prompt.md"),
+    )
+
+    def command(text: Callable[[int], str]) -> Callable[[int], None]:
+        def run(rep: int) -> None:
+            with contextlib.redirect_stdout(io.StringIO()):
+                llm.process_command(text(rep))
+
+        return run
+
+    return [
+        measure("cli.list", size, reps, command(lambda rep: "show my tasks")),
+        measure("cli.search", size, reps, command(lambda rep: f"find task {rep % size + 1}")),
+        measure("cli.add", size, reps, command(lambda rep: f"add bench errand {rep}")),
+        measure("cli.rescore", size, reps, command(lambda rep: "reprioritize my tasks")),
+        measure(
+            "cli.complete",
+            size,
+            reps,
+            command(lambda rep: f"complete task {rep % size + 1}"),
+        ),
+    ]
+
+
+def bench_api(backend, size: int, reps: int) -> List[Dict]:
+    from fastapi.testclient import TestClient
+
+    backend.tasks_cache = backend.TaskIndex(
+        backend.TaskRecord(api_task(task_id)) for task_id in range(1, size + 1)
+    )
+    backend.schedule_index = backend.IntervalIndex()
+    rows = []
+    with TestClient(backend.app) as client:
+
+        def get(path: str) -> Callable[[int], None]:
+            def run(rep: int) -> None:
+                assert client.get(path).status_code == 200
+
+            return run
+
+        def create(rep: int) -> None:
+            response = client.post("/api/tasks", json={"title": f"Bench {rep}", "priorityScore": 5})
+            assert response.status_code == 201
+
+        def rescore(rep: int) -> None:
+            assert client.post("/api/tasks/rescore").status_code == 200
+
+        def update(rep: int) -> None:
+            response = client.patch(
+                f"/api/tasks/{rep % size + 1}", json={"priorityScore": rep % 11}
+            )
+            assert response.status_code == 200
+
+        def capture(rep: int) -> None:
+            # Accepted, then structured by a background job: time until the job is done.
+            with contextlib.redirect_stdout(io.StringIO()):
+                job = client.post("/api/capture", json={"text": f"errand {rep}; call {rep}"})
+                path = f"/api/jobs/{job.json()['jobId']}"
+                while client.get(path).json()["status"] not in ("completed", "failed"):
+                    time.sleep(0.001)
+
+        rows.append(measure("api.page", size, reps, get("/api/tasks?limit=50")))
+        rows.append(
+            measure(
+                "api.filter",
+                size,
+                reps,
+                get("/api/tasks?status=incomplete&minPriority=8&limit=50"),
+            )
+        )
+        rows.append(measure("api.list_all", size, max(3, reps // 10), get("/api/tasks")))
+        rows.append(measure("api.search", size, reps, get("/api/tasks/search?q=task+7&limit=20")))
+        rows.append(measure("api.create", size, reps, create))
+        rows.append(measure("api.update", size, reps, update))
+        rows.append(measure("api.rescore", size, reps, rescore))
+        rows.append(measure("api.capture", size, max(3, reps // 5), capture))
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=DEFAULT_SIZES)
+    parser.add_argument("--reps", type=int, default=50)
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    parser.add_argument("--first-token-latency", type=float, default=0.0)
+    parser.add_argument("--json", help="also write the rows to this file")
+    args = parser.parse_args()
+
+    stub = StubConfig(
+        first_token_latency=args.first_token_latency, token_latency=args.token_latency
+    )
+    server, url = start_stub(stub)
+    # Read by the ollama client when it is first imported.
+    os.environ["OLLAMA_HOST"] = url
+    os.environ["PRIORITYOS_STORE"] = "memory"
+    sys.path.insert(0, str(ROOT))
+    sys.path.insert(0, str(ROOT / "backend"))
+    import app as backend
+    import task_prioritizer as agent
+
+    rows = []
+    print(
+        f"{'tasks':>7} {'op':<13} {'reps':>5} {'p50 ms':>9} {'p99 ms':>9}"
+        f" {'ops/s':>9} {'peak KiB':>9}"
+    )
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in (int(size) for size in args.sizes.split(",")):
+            reps = max(3, min(args.reps, WORK_BUDGET // size))
+            for row in bench_cli(agent, size, reps, Path(workdir)) + bench_api(
+                backend, size, reps
+            ):
+                rows.append(row)
+                print(
+                    f"{row['size']:>7} {row['op']:<13} {row['reps']:>5} {row['p50_ms']:>9.2f}"
+                    f" {row['p99_ms']:>9.2f} {row['ops_per_s']:>9.1f} {row['peak_kib']:>9.0f}"
+                )
+    server.shutdown()
+    print(f"stub model requests: {stub.requests}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as out:
+            json.dump(rows, out, indent=2)
+
+
+if __name__ == "__main__":
+    main()
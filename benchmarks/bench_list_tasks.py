@@ -0,0 +1,92 @@
+"""GET /api/tasks: cached pre-encoded task JSON vs per-request pydantic validation.
+
+Run from the repository root with ``python benchmarks/bench_list_tasks.py``.
+Uses the in-memory store, so nothing on disk is touched.
+"""
+from __future__ import annotations
+
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+os.environ.setdefault("PRIORITYOS_STORE", "memory")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import app as backend  # noqa: E402
+
+SIZES = (1_000, 10_000)
+ROUNDS = 5
+
+
+@backend.app.get("/bench/legacy_tasks", response_model=List[backend.TaskResponse])
+def legacy_list_tasks() -> List[backend.TaskResponse]:
+    # The handler as it was before the encoded-JSON cache.
+    return [backend.TaskResponse.parse_obj(task) for task in backend.tasks_cache.ordered()]
+
+
+def fill_store(size: int) -> None:
+    # Straight into the index: apply_create() needs the server's event loop.
+    now = backend.utc_now_iso()
+    tasks = []
+    for number in range(1, size + 1):
+        score = number % 11
+        tasks.append(
+            {
+                "id": number,
+                "title": f"Task {number}",
+                "description": "Benchmark task with a few history entries",
+                "category": "Administrative",
+                "priorityScore": score,
+                "priorityLabel": backend.compute_priority_label(score),
+                "status": "processing",
+                "estimatedMinutes": 30,
+                "scheduledStart": None,
+                "scheduledEnd": None,
+                "rationale": None,
+                "suggestions": [],
+                "conflict": False,
+                "historyCount": 4,
+                "createdAt": now,
+                "updatedAt": now,
+            }
+        )
+    backend.tasks_cache = backend.TaskIndex(backend.TaskRecord(task) for task in tasks)
+
+
+def timed(client: TestClient, path: str) -> float:
+    best = []
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        response = client.get(path)
+        best.append(time.perf_counter() - started)
+        assert response.status_code == 200
+    return statistics.median(best)
+
+
+def main() -> None:
+    client = TestClient(backend.app)
+    print(f"{'tasks':>8} {'legacy ms':>10} {'cold ms':>9} {'warm ms':>9} {'speedup':>8}")
+    for size in SIZES:
+        fill_store(size)
+        assert client.get("/api/tasks").json() == client.get("/bench/legacy_tasks").json()
+        legacy = timed(client, "/bench/legacy_tasks")
+        # Cold: every task's bytes invalidated, as after a full reload.
+        for task in backend.tasks_cache:
+            backend.tasks_cache.reindex(task)
+        started = time.perf_counter()
+        client.get("/api/tasks")
+        cold = time.perf_counter() - started
+        warm = timed(client, "/api/tasks")
+        print(
+            f"{size:>8} {legacy * 1000:>10.1f} {cold * 1000:>9.1f} "
+            f"{warm * 1000:>9.1f} {legacy / warm:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
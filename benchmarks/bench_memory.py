@@ -0,0 +1,179 @@
+"""Memory per task and save cost as history grows: inline history vs records + archive.
+
+Run from the repository root with
+``python benchmarks/bench_memory.py [--size 100000] [--edits 1,10,25] [--lengths 10,100,1000]``.
+
+``inline`` is how tasks were held before the history archive: a dict per
+task carrying every history entry. ``record`` is a ``TaskRecord`` that only
+counts them (``historyCount``). Memory is what tracemalloc sees allocated
+by loading ``--size`` tasks that each had ``--edits`` history entries and
+building the TaskIndex over them, per task. ``snapshot ms`` writes them
+all as a JSON store compaction does.
+
+The second table times one SQLite ``patch`` of a task whose history has
+``--lengths`` entries: ``inline`` reads and rewrites the whole body with
+its history, as patches did before; ``archived`` appends one row.
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import storage  # noqa: E402
+from task_index import TaskIndex, TaskRecord  # noqa: E402
+
+CATEGORIES = ["Health", "Work/Career", "Financial", "Administrative", "Home/Household"]
+NOTES = [
+    "Updated from the CLI",
+    "Structured by the assistant",
+    "Auto-scheduled via backend endpoint",
+]
+REPS = 50
+
+
+def make_task(task_id: int, edits: int) -> dict:
+    return {
+        "id": task_id,
+        "title": f"Task {task_id}",
+        "description": f"Description of task {task_id}",
+        "category": CATEGORIES[task_id % len(CATEGORIES)],
+        "priorityScore": task_id % 11,
+        "priorityLabel": "Medium",
+        "priorityPinned": False,
+        "status": "incomplete",
+        "estimatedMinutes": 30,
+        "scheduledStart": None,
+        "scheduledEnd": None,
+        "dueAt": None,
+        "rationale": None,
+        "suggestions": [],
+        "conflict": False,
+        "duplicateOf": None,
+        "history": [
+            {"at": f"2025-01-{1 + edit % 28:02d}T09:00:00Z", "description": NOTES[edit % 3]}
+            for edit in range(edits)
+        ],
+        "createdAt": "2025-01-01T09:00:00Z",
+        "updatedAt": "2025-01-01T09:00:00Z",
+    }
+
+
+def traced_bytes(build: Callable[[], object]) -> int:
+    gc.collect()
+    tracemalloc.start()
+    built = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del built
+    gc.collect()
+    return current
+
+
+def timed_ms(run: Callable[[], object]) -> float:
+    started = time.perf_counter()
+    run()
+    return (time.perf_counter() - started) * 1000
+
+
+def memory_rows(size: int, edits: int, workdir: Path) -> List[Dict]:
+    inline = [json.dumps(make_task(task_id, edits)) for task_id in range(1, size + 1)]
+    archived = [json.dumps(storage.split_history(json.loads(body))[0]) for body in inline]
+    rows = []
+    for kind, bodies, load in (
+        ("inline", inline, json.loads),
+        ("record", archived, lambda body: TaskRecord(json.loads(body))),
+    ):
+        used = traced_bytes(lambda: TaskIndex(load(body) for body in bodies))
+        tasks = [load(body) for body in bodies]
+        path = workdir / f"{kind}.json"
+        snapshot = timed_ms(lambda: storage.write_snapshot(path, (dict(task) for task in tasks)))
+        rows.append(
+            {
+                "edits": edits,
+                "kind": kind,
+                "bytes_per_task": used / size,
+                "snapshot_ms": snapshot,
+                "snapshot_mib": path.stat().st_size / 2**20,
+            }
+        )
+        tasks.clear()
+    return rows
+
+
+def patch_inline(store: storage.SqliteTaskStore, task_id: int, entry: dict) -> None:
+    # What SqliteTaskStore.patch did while history lived in the body.
+    with store.transaction():
+        current = store.get(task_id)
+        current["status"] = "scheduled" if current["status"] == "incomplete" else "incomplete"
+        current["history"] = current["history"] + [entry]
+        store._upsert([storage.task_row(current, store._version())])
+
+
+def patch_rows(size: int, lengths: List[int], workdir: Path) -> List[Dict]:
+    store = storage.SqliteTaskStore(workdir / "bench.db")
+    store.compact(make_task(task_id, 1) for task_id in range(1, size + 1))
+    entry = {"at": "2025-02-01T09:00:00Z", "description": "Updated from the CLI"}
+    rows = []
+    for offset, length in enumerate(lengths):
+        inline_id = size + 1 + 2 * offset
+        archived_id = inline_id + 1
+        with store.transaction():
+            # Bodies with history inline, as stored before the archive existed.
+            store._upsert([storage.task_row(make_task(inline_id, length))])
+        store.put(make_task(archived_id, length))
+        before = storage.split_history(make_task(archived_id, length))[0]
+        inline_ms = []
+        archived_ms = []
+        for rep in range(REPS):
+            inline_ms.append(timed_ms(lambda: patch_inline(store, inline_id, entry)))
+            status = "scheduled" if rep % 2 == 0 else "incomplete"
+            task = {**before, "status": status, "history": [entry]}
+            archived_ms.append(timed_ms(lambda: store.patch(task, before, 0)))
+            before = {**before, "status": status}
+        rows.append(
+            {
+                "history": length,
+                "inline_ms": statistics.median(inline_ms),
+                "archived_ms": statistics.median(archived_ms),
+            }
+        )
+    store.close()
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--edits", default="1,10,25")
+    parser.add_argument("--lengths", default="10,100,1000")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as workdir:
+        print(f"{args.size} tasks")
+        print(
+            f"{'edits':>6} {'kind':<7} {'bytes/task':>11} {'snapshot ms':>12} {'snapshot MiB':>13}"
+        )
+        for edits in (int(edits) for edits in args.edits.split(",")):
+            for row in memory_rows(args.size, edits, Path(workdir)):
+                print(
+                    f"{row['edits']:>6} {row['kind']:<7} {row['bytes_per_task']:>11.0f}"
+                    f" {row['snapshot_ms']:>12.1f} {row['snapshot_mib']:>13.1f}"
+                )
+        print()
+        print(f"{'history':>8} {'inline patch ms':>16} {'archived patch ms':>18}")
+        lengths = [int(length) for length in args.lengths.split(",")]
+        for row in patch_rows(args.size, lengths, Path(workdir)):
+            print(f"{row['history']:>8} {row['inline_ms']:>16.3f} {row['archived_ms']:>18.3f}")
+
+
+if __name__ == "__main__":
+    main()
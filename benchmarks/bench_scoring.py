@@ -0,0 +1,97 @@
+"""Full rescore of the task list: NumPy columns vs the list fallback vs scoring each task dict.
+
+Run from the repository root with ``python benchmarks/bench_scoring.py [--sizes 1000,10000,100000]``.
+
+``per-task`` parses every task's dates and scores it on each pass, which is
+what rescoring without the engine's columns costs. ``columns (python)`` is
+the engine without NumPy. ``update one`` is the write path: one changed
+task's row rewritten and scored.
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import scoring  # noqa: E402
+
+CATEGORIES = ["Health", "Work/Career", "Financial", "Administrative", "Home/Household", "Errands"]
+ROUNDS = 5
+
+
+def make_tasks(size: int, now: datetime) -> List[dict]:
+    rng = random.Random(size)
+    tasks = []
+    for task_id in range(1, size + 1):
+        due = now + timedelta(days=rng.uniform(-3, 30)) if rng.random() < 0.6 else None
+        tasks.append(
+            {
+                "id": task_id,
+                "category": rng.choice(CATEGORIES),
+                "dueAt": due.isoformat() + "Z" if due else None,
+                "createdAt": (now - timedelta(days=rng.uniform(0, 90))).isoformat() + "Z",
+                "estimatedMinutes": rng.choice([None, 15, 30, 60, 240]),
+                "priorityScore": 5,
+                "priorityPinned": False,
+                "status": "incomplete",
+            }
+        )
+    return tasks
+
+
+def best_ms(run: Callable[[], object], rounds: int = ROUNDS) -> float:
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        run()
+        samples.append(time.perf_counter() - started)
+    return min(samples) * 1000
+
+
+def build(tasks: List[dict], vectorized: bool) -> scoring.ScoreEngine:
+    engine = scoring.ScoreEngine()
+    engine.vectorized = vectorized and scoring.np is not None
+    engine._reset(len(tasks))
+    for task in tasks:
+        engine.set_task(task)
+    return engine
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    args = parser.parse_args()
+    now = datetime.utcnow()
+    stamp = time.time()
+    if scoring.np is None:
+        print("numpy is not installed: the columns (numpy) row uses the fallback too")
+    print(f"{'tasks':>7} {'method':<17} {'ms':>9}")
+    for size in (int(size) for size in args.sizes.split(",")):
+        tasks = make_tasks(size, now)
+        vector = build(tasks, vectorized=True)
+        python = build(tasks, vectorized=False)
+        assert vector.rescore(stamp) == python.rescore(stamp)
+        rows = [
+            ("per-task", best_ms(lambda: [scoring.score_task(task, stamp) for task in tasks])),
+            ("columns (python)", best_ms(lambda: python.rescore(stamp))),
+            ("columns (numpy)", best_ms(lambda: vector.rescore(stamp))),
+        ]
+        changed = tasks[size // 2]
+        updates = [
+            best_ms(lambda: (vector.set_task(changed), scoring.score_task(changed, stamp)), 1)
+            for _ in range(200)
+        ]
+        rows.append(("update one", statistics.median(updates)))
+        for method, ms in rows:
+            print(f"{size:>7} {method:<17} {ms:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
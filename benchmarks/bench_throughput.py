@@ -0,0 +1,120 @@
+"""Mixed read/write HTTP throughput against a real uvicorn worker.
+
+Run from the repository root::
+
+    python benchmarks/bench_throughput.py [backend_dir] [store]
+
+``backend_dir`` defaults to ``backend/``; point it at an older checkout
+(``git worktree add /tmp/old <rev>``) to compare implementations. The
+directory is copied to a temp dir first so its data files are untouched.
+The load is 64 concurrent clients, 80% GET /api/tasks?limit=50 and 20%
+PATCH, for 10 seconds, against 1000 seeded tasks.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+
+CONCURRENCY = 64
+DURATION = 10.0
+SEED_TASKS = 1000
+WRITE_SHARE = 0.2
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(backend_dir: Path, store: str, port: int) -> subprocess.Popen:
+    env = dict(os.environ, PRIORITYOS_STORE=store)
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app:app",
+            "--port", str(port), "--log-level", "warning",
+        ],
+        cwd=backend_dir,
+        env=env,
+    )
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/api/health", timeout=1)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("server did not start")
+
+
+async def worker(
+    client: httpx.AsyncClient, ids: List[int], stop: float, stats: Dict[str, List[float]]
+) -> None:
+    while time.perf_counter() < stop:
+        started = time.perf_counter()
+        if random.random() < WRITE_SHARE:
+            kind = "write"
+            response = await client.patch(
+                f"/tasks/{random.choice(ids)}", json={"priorityScore": random.randint(0, 10)}
+            )
+        else:
+            kind = "read"
+            response = await client.get("/tasks", params={"limit": 50})
+        response.raise_for_status()
+        stats[kind].append(time.perf_counter() - started)
+
+
+async def run(port: int) -> None:
+    limits = httpx.Limits(max_connections=CONCURRENCY, max_keepalive_connections=CONCURRENCY)
+    base_url = f"http://127.0.0.1:{port}/api"
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        ids = []
+        for number in range(SEED_TASKS):
+            response = await client.post(
+                "/tasks", json={"title": f"Task {number}", "priorityScore": number % 11}
+            )
+            ids.append(response.json()["id"])
+        stats: Dict[str, List[float]] = {"read": [], "write": []}
+        stop = time.perf_counter() + DURATION
+        await asyncio.gather(*(worker(client, ids, stop, stats) for _ in range(CONCURRENCY)))
+
+    total = len(stats["read"]) + len(stats["write"])
+    print(f"requests/second   {total / DURATION:,.0f}")
+    for kind, samples in stats.items():
+        samples.sort()
+        p99 = samples[int(len(samples) * 0.99) - 1] * 1000
+        p50 = statistics.median(samples) * 1000
+        print(f"{kind:<6} n={len(samples):<7} p50 {p50:7.1f} ms   p99 {p99:7.1f} ms")
+
+
+def main() -> None:
+    default_dir = Path(__file__).resolve().parent.parent / "backend"
+    source = Path(sys.argv[1]) if len(sys.argv) > 1 else default_dir
+    store = sys.argv[2] if len(sys.argv) > 2 else "sqlite"
+    with tempfile.TemporaryDirectory() as workdir:
+        backend_dir = Path(workdir) / "backend"
+        ignore = shutil.ignore_patterns("tasks_store.db*", "*.journal", "__pycache__")
+        shutil.copytree(source, backend_dir, ignore=ignore)
+        port = free_port()
+        server = start_server(backend_dir, store, port)
+        try:
+            asyncio.run(run(port))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Load test for GET /api/events: many SSE subscribers on one uvicorn worker.
+
+Run from the repository root with ``python benchmarks/sse_load.py [subscribers] [events]``.
+Starts the API in-process on a free port with the in-memory store, connects
+the subscribers, then issues PATCH requests and measures how long each event
+takes to reach every subscriber.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List
+
+os.environ.setdefault("PRIORITYOS_STORE", "memory")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+
+import app as backend  # noqa: E402
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port: int) -> uvicorn.Server:
+    config = uvicorn.Config(backend.app, host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def subscriber(
+    client: httpx.AsyncClient,
+    received: Dict[str, List[float]],
+    ready: asyncio.Event,
+    expected: int,
+) -> None:
+    seen = 0
+    async with client.stream("GET", "/events") as response:
+        response.raise_for_status()
+        ready.set()
+        async for line in response.aiter_lines():
+            if line.startswith("data: ") and '"title":"load ' in line:
+                title = line.split('"title":"', 1)[1].split('"', 1)[0]
+                received.setdefault(title, []).append(time.perf_counter())
+                seen += 1
+                if seen >= expected:
+                    return
+
+
+async def run(subscribers: int, events: int) -> None:
+    port = free_port()
+    server = start_server(port)
+    limits = httpx.Limits(max_connections=subscribers + 10, max_keepalive_connections=subscribers + 10)
+    base = f"http://127.0.0.1:{port}/api"
+    received: Dict[str, List[float]] = {}
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=None) as client:
+        task_id = (await client.post("/tasks", json={"title": "load target"})).json()["id"]
+        readiness = [asyncio.Event() for _ in range(subscribers)]
+        listeners = [
+            asyncio.create_task(subscriber(client, received, ready, events)) for ready in readiness
+        ]
+        await asyncio.gather(*(ready.wait() for ready in readiness))
+        while backend.hub.subscriber_count < subscribers:
+            await asyncio.sleep(0.01)
+
+        sent: Dict[str, float] = {}
+        started = time.perf_counter()
+        for number in range(events):
+            title = f"load {number}"
+            sent[title] = time.perf_counter()
+            response = await client.patch(f"/tasks/{task_id}", json={"title": title})
+            assert response.status_code == 200
+        await asyncio.wait_for(asyncio.gather(*listeners), timeout=120)
+        elapsed = time.perf_counter() - started
+
+    latencies = sorted(
+        (max(times) - sent[title]) * 1000 for title, times in received.items() if title in sent
+    )
+    delivered = sum(len(times) for times in received.values())
+    print(f"subscribers          {subscribers}")
+    print(f"events published     {events}")
+    print(f"frames delivered     {delivered} / {subscribers * events}")
+    print(f"fan-out p50 (ms)     {statistics.median(latencies):.1f}")
+    print(f"fan-out p99 (ms)     {latencies[int(len(latencies) * 0.99) - 1]:.1f}")
+    print(f"frames / second      {delivered / elapsed:,.0f}")
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    total = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    asyncio.run(run(count, total))
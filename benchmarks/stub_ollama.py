@@ -0,0 +1,227 @@
+"""Deterministic stand-in for the ollama chat API, for benchmarks and offline runs.
+
+Serves ``POST /api/chat`` (streamed NDJSON or a single JSON reply) plus
+``/api/version`` and ``/api/tags``, so the real ``ollama`` client can talk
+to it: point ``OLLAMA_HOST`` at it before ``task_prioritizer`` is imported.
+Run it on its own with::
+
+    python benchmarks/stub_ollama.py --port 11435 --token-latency 0.02
+    OLLAMA_HOST=http://127.0.0.1:11435 python task_prioritizer.py
+
+Replies are scripted, never sampled. The last user message is matched
+against ``rules`` (regex -> reply with optional tool calls, where ``{1}``
+in an argument is the regex group), a request whose last message is a
+tool result gets a short final answer, and a request with ``format`` set
+(batch capture) gets ``{"tasks": [...]}`` with one task per ``;``/``,``
+separated part. Latency is modelled as a fixed first-token delay, prompt
+prefill per character and a delay per generated token (4 characters).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+CHARS_PER_TOKEN = 4
+
+DEFAULT_RULES: List[Dict[str, Any]] = [
+    {"match": r"\b(show|list|view)\b", "tool_calls": [{"name": "list_task", "arguments": {}}]},
+    {
+        "match": r"\b(?:find|search for) (.+)",
+        "tool_calls": [{"name": "search_task", "arguments": {"query": "{1}"}}],
+    },
+    {
+        "match": r"\b(reprioriti[sz]e|rescore)\b",
+        "tool_calls": [{"name": "rescore_tasks", "arguments": {}}],
+    },
+    {
+        "match": r"\badd (.+)",
+        "tool_calls": [
+            {
+                "name": "add_task",
+                "arguments": {
+                    "task_text": "{1}",
+                    "category": "Home/Household",
+                    "priority_score": 5,
+                    "priority_label": "Medium",
+                },
+            }
+        ],
+    },
+    {
+        "match": r"\bcomplete task (\d+)",
+        "tool_calls": [
+            {"name": "update_task", "arguments": {"task_id": "{1}", "status": "Complete"}}
+        ],
+    },
+    {
+        "match": r"\bdelete task (\d+)",
+        "tool_calls": [{"name": "delete_task", "arguments": {"task_id": "{1}"}}],
+    },
+]
+FINAL_ANSWER = "Done. Here is your updated task list."
+FALLBACK_ANSWER = "I can show, add, complete or delete tasks for you."
+
+
+class StubConfig:
+    def __init__(
+        self,
+        rules: Optional[List[Dict[str, Any]]] = None,
+        first_token_latency: float = 0.0,
+        token_latency: float = 0.0,
+        prefill_chars_per_second: float = 0.0,
+    ) -> None:
+        self.rules = [(re.compile(rule["match"], re.I), rule) for rule in rules or DEFAULT_RULES]
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.prefill_chars_per_second = prefill_chars_per_second
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def reply(self, request: dict) -> Tuple[str, List[dict]]:
+        messages = request.get("messages") or [{"role": "user", "content": ""}]
+        last = messages[-1]
+        if request.get("format"):
+            parts = [part.strip() for part in re.split(r"[;,\n]", last.get("content") or "")]
+            tasks = [
+                {"task_text": part, "category": "Home/Household", "priority_score": 5}
+                for part in parts
+                if part
+            ]
+            return json.dumps({"tasks": tasks}), []
+        if last.get("role") == "tool":
+            return FINAL_ANSWER, []
+        text = last.get("content") or ""
+        for pattern, rule in self.rules:
+            found = pattern.search(text)
+            if found:
+                calls = [
+                    {"function": {"name": call["name"], "arguments": fill(call["arguments"], found)}}
+                    for call in rule.get("tool_calls", [])
+                ]
+                return rule.get("content", ""), calls
+        return FALLBACK_ANSWER, []
+
+    def count(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+
+def fill(arguments: Dict[str, Any], found: "re.Match[str]") -> Dict[str, Any]:
+    filled = {}
+    for key, value in arguments.items():
+        if isinstance(value, str):
+            value = re.sub(r"\{(\d+)\}", lambda ref: found.group(int(ref.group(1))) or "", value)
+        filled[key] = value
+    return filled
+
+
+def tokens(text: str) -> List[str]:
+    return [text[i : i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    config: StubConfig
+
+    def log_message(self, format: str, *args: Any) -> None:  # quiet
+        pass
+
+    def send_json(self, body: dict) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        if self.path == "/api/version":
+            self.send_json({"version": "0.0.0-stub"})
+        elif self.path == "/api/tags":
+            self.send_json({"models": [{"name": "llama3.2:3b", "model": "llama3.2:3b"}]})
+        else:
+            self.send_error(404)
+
+    def do_POST(self) -> None:
+        if self.path != "/api/chat":
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length)
+        request = json.loads(raw or b"{}")
+        config = self.config
+        config.count()
+        content, tool_calls = config.reply(request)
+        delay = config.first_token_latency
+        if config.prefill_chars_per_second:
+            delay += len(raw) / config.prefill_chars_per_second
+        time.sleep(delay)
+        model = request.get("model") or "llama3.2:3b"
+        stats = {
+            "prompt_eval_count": len(raw) // CHARS_PER_TOKEN,
+            "eval_count": len(tokens(content)) + len(tool_calls),
+        }
+        if not request.get("stream", True):
+            time.sleep(config.token_latency * stats["eval_count"])
+            message = {"role": "assistant", "content": content}
+            if tool_calls:
+                message["tool_calls"] = tool_calls
+            self.send_json({"model": model, "message": message, "done": True, **stats})
+            return
+
+        # Close-delimited NDJSON, one line per token, like ollama's stream.
+        self.protocol_version = "HTTP/1.0"
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        chunks: List[dict] = [{"role": "assistant", "content": token} for token in tokens(content)]
+        if tool_calls:
+            chunks.append({"role": "assistant", "content": "", "tool_calls": tool_calls})
+        for message in chunks:
+            time.sleep(config.token_latency)
+            line = {"model": model, "message": message, "done": False}
+            self.wfile.write(json.dumps(line).encode("utf-8") + b"\n")
+            self.wfile.flush()
+        final = {"model": model, "message": {"role": "assistant", "content": ""}, "done": True}
+        self.wfile.write(json.dumps({**final, **stats}).encode("utf-8") + b"\n")
+
+
+def start_stub(
+    config: Optional[StubConfig] = None, host: str = "127.0.0.1", port: int = 0
+) -> Tuple[ThreadingHTTPServer, str]:
+    """Serve the stub from a daemon thread; returns the server and its OLLAMA_HOST url."""
+    handler = type("Handler", (StubHandler,), {"config": config or StubConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--first-token-latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="seconds per token")
+    parser.add_argument("--prefill", type=float, default=0.0, help="prompt chars per second")
+    parser.add_argument("--script", help="JSON file with a list of rules replacing the defaults")
+    args = parser.parse_args()
+    rules = None
+    if args.script:
+        with open(args.script, "r", encoding="utf-8") as script:
+            rules = json.load(script)
+    config = StubConfig(rules, args.first_token_latency, args.token_latency, args.prefill)
+    server, url = start_stub(config, args.host, args.port)
+    print(f"Stub ollama listening; export OLLAMA_HOST={url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
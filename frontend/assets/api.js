@@ -28,9 +28,40 @@ async function request(path, options = {}) {
   }
 }
 
-export async function fetchTasks() {
+const etagCache = new Map();
+
+// GET that revalidates with If-None-Match and reuses the last body on 304.
+async function requestWithEtag(path) {
+  const cached = etagCache.get(path);
+  const headers = cached ? { 'If-None-Match': cached.etag } : {};
+  const response = await fetch(`${API_BASE}${path}`, { credentials: 'include', headers });
+  if (response.status === 304 && cached) {
+    return cached.data;
+  }
+  if (!response.ok) {
+    const message = await response.text();
+    throw new Error(message || `Request failed with status ${response.status}`);
+  }
+  const text = await response.text();
+  const data = text ? JSON.parse(text) : null;
+  const etag = response.headers.get('ETag');
+  if (etag) {
+    etagCache.set(path, { etag, data });
+  }
+  return data;
+}
+
+export async function fetchTasks(params = {}) {
+  const search = new URLSearchParams();
+  Object.entries(params).forEach(([key, value]) => {
+    if (value === undefined || value === null) {
+      return;
+    }
+    (Array.isArray(value) ? value : [value]).forEach((item) => search.append(key, String(item)));
+  });
+  const suffix = search.toString() ? `?${search.toString()}` : '';
   try {
-    const data = await request('/tasks');
+    const data = await requestWithEtag(`/tasks${suffix}`);
     return Array.isArray(data) ? data : null;
   } catch (error) {
     console.warn('[PriorityOS] Backend unavailable, using local seed data.', error.message || error);
@@ -38,6 +69,10 @@ export async function fetchTasks() {
   }
 }
 
+export async function fetchTaskChanges(since) {
+  return request(`/tasks/changes?since=${encodeURIComponent(String(since))}`);
+}
+
 export async function createTask(payload) {
   return request('/tasks', {
     method: 'POST',
@@ -45,6 +80,13 @@ export async function createTask(payload) {
   });
 }
 
+export async function captureTask(text, { model } = {}) {
+  return request('/capture', {
+    method: 'POST',
+    body: JSON.stringify(model ? { text, model } : { text }),
+  });
+}
+
 export async function updateTask(id, payload) {
   return request(`/tasks/${id}`, {
     method: 'PATCH',
@@ -52,13 +94,101 @@ export async function updateTask(id, payload) {
   });
 }
 
-export async function autoScheduleTask(id, params = {}) {
+export async function deleteTask(id) {
+  return request(`/tasks/${id}`, {
+    method: 'DELETE',
+  });
+}
+
+export async function batchTasks({ create = [], update = [], remove = [] } = {}) {
+  return request('/tasks/batch', {
+    method: 'POST',
+    body: JSON.stringify({ create, update, delete: remove }),
+  });
+}
+
+function scheduleQuery(params) {
   const search = new URLSearchParams();
   if (params.minutes) {
     search.set('minutes', String(params.minutes));
   }
-  const suffix = search.toString() ? `?${search.toString()}` : '';
-  return request(`/tasks/${id}/auto_schedule${suffix}`, {
+  if (params.days) {
+    search.set('days', String(params.days));
+  }
+  if (params.workStart !== undefined) {
+    search.set('workStart', String(params.workStart));
+  }
+  if (params.workEnd !== undefined) {
+    search.set('workEnd', String(params.workEnd));
+  }
+  return search.toString() ? `?${search.toString()}` : '';
+}
+
+export async function autoScheduleTask(id, params = {}) {
+  return request(`/tasks/${id}/auto_schedule${scheduleQuery(params)}`, {
+    method: 'POST',
+  });
+}
+
+export async function autoScheduleTasks(taskIds = null, params = {}) {
+  return request(`/tasks/auto_schedule${scheduleQuery(params)}`, {
+    method: 'POST',
+    body: JSON.stringify(taskIds ? { taskIds } : {}),
+  });
+}
+
+// Live task mutations over server-sent events. Returns a function that closes the stream.
+export function subscribeToTaskEvents(onEvent, { since } = {}) {
+  const suffix = since !== undefined ? `?since=${encodeURIComponent(String(since))}` : '';
+  const source = new EventSource(`${API_BASE}/events${suffix}`, { withCredentials: true });
+  ['task.created', 'task.updated', 'task.scheduled', 'task.deleted', 'resync'].forEach((type) => {
+    source.addEventListener(type, (event) => {
+      onEvent({ type, revision: Number(event.lastEventId) || null, data: JSON.parse(event.data) });
+    });
+  });
+  return () => source.close();
+}
+
+// Streams a natural-language command through the assistant. onEvent receives
+// { type, data } for each token, tool_call, tool_result, done or error frame.
+export async function streamCommand(message, onEvent, { model, signal } = {}) {
+  const response = await fetch(`${API_BASE}/assistant/stream`, {
     method: 'POST',
+    credentials: 'include',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(model ? { message, model } : { message }),
+    signal,
   });
+  if (!response.ok) {
+    const text = await response.text();
+    throw new Error(text || `Request failed with status ${response.status}`);
+  }
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) {
+      break;
+    }
+    buffer += decoder.decode(value, { stream: true });
+    let boundary = buffer.indexOf('\n\n');
+    while (boundary !== -1) {
+      const frame = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      let type = 'message';
+      let data = '';
+      frame.split('\n').forEach((line) => {
+        if (line.startsWith('event: ')) {
+          type = line.slice(7);
+        } else if (line.startsWith('data: ')) {
+          data += line.slice(6);
+        }
+      });
+      if (data) {
+        onEvent({ type, data: JSON.parse(data) });
+      }
+      boundary = buffer.indexOf('\n\n');
+    }
+  }
 }
@@ -0,0 +1,200 @@
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from threading import Lock
+
+try:
+    import fcntl
+except ImportError:  # not on Windows: saves still merge, but without a file lock
+    fcntl = None
+
+# Tools that only read, so a plan made of them is safe to reuse for a merely
+# similar request.
+READ_ONLY_TOOLS = {'list_task', 'search_task'}
+
+
+def normalize(text):
+    return ' '.join(re.sub(r'[^\w\s]', ' ', text.lower()).split())
+
+
+def trigrams(text):
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def fingerprint(value):
+    encoded = json.dumps(value, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+class PlanCache:
+    """
+    Cache of the model's tool-planning step (content + tool calls) per request.
+
+    Entries are keyed on the normalized user input within a namespace made
+    of the model name and hashes of the system prompt and tool schema, so
+    editing either invalidates everything planned against the old version.
+
+    Exact matches reuse any plan, but plans that change tasks are only
+    stored and served for the first turn of a conversation, where the input
+    alone decides them ("delete it" depends on earlier turns). Fuzzy
+    matches (character trigram similarity) only ever return read-only plans
+    without arguments: "find dentist tasks" must not reuse a search for
+    "find doctor tasks".
+    Least recently used entries are evicted past max_entries, and the cache
+    is written to disk after every store. Safe to share between threads,
+    and between processes using the same file (the CLI and the backend):
+    a save takes a lock file and merges with what is on disk first.
+    """
+    def __init__(self, path=None, max_entries=256, fuzzy_threshold=0.8):
+        self.path = path
+        self.max_entries = max_entries
+        self.fuzzy_threshold = fuzzy_threshold
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.stats = {
+            'exact_hits': 0,
+            'fuzzy_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+            'latency_saved_seconds': 0.0,
+        }
+        self.load()
+
+    def namespace(self, model, system_prompt, tools):
+        return f'{model}:{fingerprint(system_prompt)}:{fingerprint(tools)}'
+
+    def lookup(self, user_input, namespace, first_turn=True):
+        """
+        Returns (plan, 'exact' | 'fuzzy') or (None, None)
+        """
+        with self.lock:
+            return self.match(normalize(user_input), namespace, first_turn)
+
+    def match(self, text, namespace, first_turn):
+        key = f'{namespace}:{text}'
+        entry = self.entries.get(key)
+        if entry is not None and (first_turn or entry['read_only']):
+            self.entries.move_to_end(key)
+            return self.hit(entry, 'exact')
+
+        grams = trigrams(text)
+        best, best_score = None, self.fuzzy_threshold
+        for entry_key, entry in self.entries.items():
+            if not entry['read_only'] or entry['namespace'] != namespace:
+                continue
+            if any(call['function']['arguments'] for call in entry['tool_calls']):
+                continue
+            other = trigrams(entry['text'])
+            score = len(grams & other) / len(grams | other)
+            if score >= best_score:
+                best, best_score = entry_key, score
+        if best is not None:
+            self.entries.move_to_end(best)
+            return self.hit(self.entries[best], 'fuzzy')
+
+        self.stats['misses'] += 1
+        return None, None
+
+    def hit(self, entry, match):
+        self.stats[f'{match}_hits'] += 1
+        self.stats['latency_saved_seconds'] += entry['latency']
+        return {'content': entry['content'], 'tool_calls': entry['tool_calls']}, match
+
+    def store(self, user_input, namespace, content, tool_calls, latency, first_turn=True):
+        """
+        Remember a plan the model produced in ``latency`` seconds
+        """
+        if not tool_calls:
+            # A plain answer is the reply itself, not a plan; it depends on context.
+            return
+        calls = [
+            {'function': {'name': call['function']['name'],
+                          'arguments': dict(call['function'].get('arguments') or {})}}
+            for call in tool_calls
+        ]
+        read_only = all(call['function']['name'] in READ_ONLY_TOOLS for call in calls)
+        if not read_only and not first_turn:
+            return
+        text = normalize(user_input)
+        entry = {
+            'namespace': namespace,
+            'text': text,
+            'content': content or '',
+            'tool_calls': calls,
+            'read_only': read_only,
+            'latency': latency,
+            'stored_at': time.time(),
+        }
+        with self.lock:
+            self.remember(f'{namespace}:{text}', entry)
+            self.save()
+
+    def remember(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        self.stats['stores'] += 1
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def summary(self):
+        lookups = self.stats['exact_hits'] + self.stats['fuzzy_hits'] + self.stats['misses']
+        hits = self.stats['exact_hits'] + self.stats['fuzzy_hits']
+        return {
+            **self.stats,
+            'entries': len(self.entries),
+            'hit_rate': hits / lookups if lookups else 0.0,
+        }
+
+    def load(self):
+        if not self.path:
+            return
+        for key, entry in self.read()[-self.max_entries:]:
+            self.entries[key] = entry
+
+    def read(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return []
+
+    @contextmanager
+    def file_lock(self):
+        with open(f'{self.path}.lock', 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def save(self):
+        """
+        Merge with the entries on disk (the newer copy of a key wins, ours
+        count as most recently used), then write the result atomically.
+        """
+        if not self.path:
+            return
+        with self.file_lock():
+            merged = OrderedDict(self.read())
+            for key, entry in self.entries.items():
+                on_disk = merged.get(key)
+                if on_disk is not None and on_disk['stored_at'] > entry['stored_at']:
+                    entry = on_disk
+                merged[key] = entry
+                merged.move_to_end(key)
+            while len(merged) > self.max_entries:
+                merged.popitem(last=False)
+            self.entries = merged
+            tmp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(list(merged.items()), f)
+            os.replace(tmp_path, self.path)
@@ -28,12 +28,251 @@
 from ollama import chat
 from ollama import ChatResponse
 import json
+import logging
+import os
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+import time
 from datetime import datetime
+from pathlib import Path
+from threading import Lock
+
+from plan_cache import PlanCache, READ_ONLY_TOOLS
+
+# The backend's store and search modules, so the CLI and the API share one
+# database and rank search results the same way.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+from shared_store import (
+    DB_PATH,
+    compute_priority_label,
+    open_shared_store,
+    task_from_cli,
+    task_to_cli,
+)
+from search import SearchIndex
+from dedupe import MinHashIndex, duplicate_groups
+from scoring import ScoreEngine, score, task_features
+
+logger = logging.getLogger(__name__)
+
+# Field weights for search_task
+CLI_SEARCH_FIELDS = {"text": 1.0, "category": 0.5}
 
 class TaskManager:
+    """
+    Tasks held in memory by id, written back to tasks.json only when changed.
+
+    Mutations mark the manager dirty and call save_tasks(), which writes
+    immediately unless a transaction is open; then the writes coalesce into
+    one flush when the outermost transaction commits (LLM wraps each
+    command in one). Flushes write a temp file and rename it over
+    tasks.json, so a crash mid-dump leaves the previous file intact.
+
+    The file's (inode, mtime, size) is remembered after every load and
+    flush. refresh() compares it with a stat() and reloads only when
+    another process (the FastAPI backend, another CLI) replaced the file.
+    Rendered list_task lines are cached per task and dropped when the task
+    changes, so listing an unchanged file costs one stat(). The search_task
+    and duplicate indexes are built on first use and after that only
+    re-index the tasks that changed (see synced_index).
+    """
     def __init__(self, filename="tasks.json"):
         self.filename = filename
+        self.index_lock = Lock()
+        self.by_id = {}
+        self.max_id = 0
+        self.lines_by_id = {}
+        self.rendered = None
+        self.file_stamp = self.stat_file()
         self.tasks = self.load_tasks()
+        # While > 0, save_tasks only leaves the list dirty (see transaction)
+        self.batch_depth = 0
+        self.dirty = False
+
+    @property
+    def tasks(self):
+        return list(self.by_id.values())
+
+    @tasks.setter
+    def tasks(self, tasks):
+        self.by_id = {task["id"]: task for task in tasks}
+        self.max_id = max(self.by_id, default=0)
+        self.lines_by_id = {}
+        self.rendered = None
+        # name -> index, and the ids changed since each was last synced
+        self.indexes = {}
+        self.stale = {}
+
+    def stat_file(self):
+        try:
+            stat = os.stat(self.filename)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def refresh(self):
+        """
+        Reload tasks.json if another process changed it. Unflushed local
+        changes win, since the next flush overwrites the file anyway.
+        """
+        if self.dirty or self.batch_depth:
+            return
+        stamp = self.stat_file()
+        if stamp != self.file_stamp:
+            self.file_stamp = stamp
+            self.tasks = self.load_tasks()
+
+    def changed(self, task_id):
+        self.lines_by_id.pop(task_id, None)
+        self.rendered = None
+        for stale in self.stale.values():
+            stale.add(task_id)
+
+    @staticmethod
+    def render_task(task):
+        return f"{task['id']} {task['text']} / Category: {task['category']} / Priority: {task['priority label']} / Status: {task['status']}"
+
+    def task_lines(self):
+        """
+        One formatted line per task for list_task, reused while nothing changes
+        """
+        self.refresh()
+        if self.rendered is None:
+            lines_by_id = self.lines_by_id
+            for task_id, task in self.by_id.items():
+                if task_id not in lines_by_id:
+                    lines_by_id[task_id] = self.render_task(task)
+            self.rendered = list(lines_by_id[task_id] for task_id in self.by_id)
+        return self.rendered
+
+    def search_tasks(self, query, limit=10):
+        """
+        list_task lines of the tasks best matching query (BM25 over text and
+        category), best first
+        """
+        def index_task(index, task_id, task):
+            if task is None:
+                index.remove(task_id)
+            else:
+                index.add(task_id, {"text": task['text'], "category": task['category']})
+
+        self.refresh()
+        with self.index_lock:
+            index = self.synced_index('search', lambda: SearchIndex(CLI_SEARCH_FIELDS), index_task)
+            ranked = index.search(query, limit)
+        return [self.render_task(self.by_id[task_id]) for task_id, _ in ranked]
+
+    def find_duplicate(self, task_text):
+        """
+        The incomplete task task_text is a near-duplicate of (MinHash over
+        word shingles, see backend/dedupe.py), or None
+        """
+        def index_task(index, task_id, task):
+            if task is None or task['status'] == 'Complete':
+                index.remove(task_id)
+            else:
+                index.add(task_id, task['text'] or '')
+
+        self.refresh()
+        with self.index_lock:
+            index = self.synced_index('dedupe', MinHashIndex, index_task)
+            matches = index.similar(task_text, limit=1)
+        return self.by_id[matches[0][0]] if matches else None
+
+    def duplicate_groups(self):
+        """
+        Ids of incomplete tasks that are near-duplicates of each other,
+        oldest first in each group
+        """
+        self.refresh()
+        return duplicate_groups(
+            (task_id, task['text'] or '')
+            for task_id, task in self.by_id.items()
+            if task['status'] != 'Complete'
+        )
+
+    def merge_duplicates(self, groups):
+        """
+        Keep the oldest task of each group, give it the group's highest
+        priority and delete the rest, in one transaction
+        """
+        with self.transaction():
+            for keep_id, *duplicate_ids in groups:
+                top = max(
+                    (self.by_id[task_id] for task_id in [keep_id] + duplicate_ids),
+                    key=lambda task: task['priority score'] or 0,
+                )
+                self.update_task(keep_id, **{
+                    'priority score': top['priority score'],
+                    'priority label': top['priority label'],
+                })
+                for task_id in duplicate_ids:
+                    self.delete_task(task_id)
+
+    def score_features(self, task):
+        """
+        Scoring engine inputs of a task; CLI tasks only have a category and an age
+        """
+        return self.features(task, None, None)
+
+    def features(self, task, due_at, minutes):
+        """
+        A category alone would give every task in it the same score, so a
+        task with neither a due date nor an estimate is left ambiguous and
+        keeps the model's score
+        """
+        known = due_at is not None or minutes is not None
+        return task_features({
+            "dueAt": due_at,
+            "estimatedMinutes": minutes,
+            "createdAt": task['created_at'],
+            "category": task['category'] if known else None,
+        })
+
+    def rescore_tasks(self):
+        """
+        Recompute the priority of every incomplete, unpinned task with the
+        local engine (backend/scoring.py) in one pass. Returns the tasks whose
+        score changed and the ones the engine cannot score (no due date, and
+        no estimate or an unknown category), which keep their score.
+        """
+        def index_task(engine, task_id, task):
+            if task is None:
+                engine.remove(task_id)
+            else:
+                active = task['status'] != 'Complete' and not task.get('priority pinned', True)
+                engine.set(task_id, self.score_features(task), task['priority score'] or 0, active)
+
+        self.refresh()
+        with self.index_lock:
+            moved, ambiguous = self.synced_index('score', ScoreEngine, index_task).rescore()
+        with self.transaction():
+            for task_id, value in moved:
+                task = self.by_id[task_id]
+                task['priority score'] = value
+                task['priority label'] = compute_priority_label(value)
+                self.changed(task_id)
+            self.save_tasks()
+        return [self.by_id[task_id] for task_id, _ in moved], [self.by_id[task_id] for task_id in ambiguous]
+
+    def synced_index(self, name, new_index, index_task):
+        """
+        The index called name (built with new_index() on first use), after
+        index_task(index, task_id, task) for every task changed since the
+        last call; task is None when it was deleted. Hold index_lock.
+        """
+        index = self.indexes.get(name)
+        if index is None:
+            index = self.indexes[name] = new_index()
+            changed = self.by_id
+        else:
+            changed = self.stale[name]
+        self.stale[name] = set()
+        for task_id in list(changed):
+            index_task(index, task_id, self.by_id.get(task_id))
+        return index
     
     def load_tasks(self):
         try:
@@ -43,27 +282,120 @@ class TaskManager:
             return []
     
     def save_tasks(self):
-        with open(self.filename, 'w') as f:
+        self.dirty = True
+        if not self.batch_depth:
+            self.flush()
+
+    def flush(self):
+        if not self.dirty:
+            return
+        tmp_path = f"{self.filename}.tmp"
+        with open(tmp_path, 'w') as f:
             json.dump(self.tasks, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.filename)
+        self.file_stamp = self.stat_file()
+        self.dirty = False
+
+    def close(self):
+        self.flush()
+
+    def begin(self):
+        if not self.batch_depth:
+            self.refresh()
+        self.batch_depth += 1
+
+    def commit(self):
+        self.batch_depth -= 1
+        if self.batch_depth == 0:
+            self.flush()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Group changes so tasks.json is written once, when the block ends.
+        If the block raises, the in-memory list is restored instead.
+        """
+        snapshot = [dict(task) for task in self.by_id.values()]
+        dirty = self.dirty
+        self.begin()
+        try:
+            yield self
+        except BaseException:
+            self.tasks = snapshot
+            self.dirty = dirty
+            self.batch_depth -= 1
+            raise
+        self.commit()
     
+    def allocate_ids(self, count):
+        return list(range(self.max_id + 1, self.max_id + 1 + count))
+
     # How is task_text extracted from the user_input?
     def add_task(self, task_text, category=None, priority_score=None, priority_label=None):
+        self.refresh()
         # Generate next available ID
-        existing_ids = [task["id"] for task in self.tasks] if self.tasks else []
-        next_id = max(existing_ids) + 1 if existing_ids else 1
-        
+        next_id = self.allocate_ids(1)[0]
+        task = self.insert_task(next_id, task_text, category, priority_score, priority_label)
+        self.save_tasks()
+        return task
+
+    def add_tasks(self, items, skip_duplicates=False):
+        """
+        Bulk add: items are dicts with task_text, category and priority_score
+        (priority_label is derived from the score when missing). One id
+        allocation and one save for the whole list. With skip_duplicates,
+        items that repeat an incomplete task or an earlier item are dropped
+        and logged at INFO level.
+        """
+        self.refresh()
+        if skip_duplicates:
+            batch = MinHashIndex()
+            kept = []
+            for item in items:
+                text = item['task_text']
+                if self.find_duplicate(text) is None and not batch.similar(text, limit=1):
+                    batch.add(len(kept), text)
+                    kept.append(item)
+                else:
+                    logger.info("Skipping duplicate task: %s", text)
+            items = kept
+        ids = self.allocate_ids(len(items))
+        with self.transaction():
+            added = []
+            for task_id, item in zip(ids, items):
+                priority_score = item.get('priority_score')
+                priority_label = item.get('priority_label')
+                if not priority_label and priority_score is not None:
+                    priority_label = compute_priority_label(priority_score)
+                added.append(
+                    self.insert_task(
+                        task_id, item['task_text'], item.get('category'), priority_score, priority_label
+                    )
+                )
+            return added
+
+    def insert_task(self, next_id, task_text, category, priority_score, priority_label):
         task = {
             "id": next_id,
             "text": task_text,
             "category": category,
             "priority label": priority_label,
             "priority score": priority_score,
+            "priority pinned": False,
             "status": "Incomplete",
             "created_at": datetime.now().isoformat(),
             "status_update_time": datetime.now().isoformat()
         }
-        self.tasks.append(task)
-        self.save_tasks()
+        # The model's score stands when the engine cannot tell tasks apart
+        value = score(self.score_features(task), time.time())
+        if value is not None:
+            task['priority score'] = value
+            task['priority label'] = compute_priority_label(value)
+        self.by_id[next_id] = task
+        self.max_id = max(self.max_id, next_id)
+        self.changed(next_id)
         return task
     
     def delete_task(self, task_id):
@@ -72,15 +404,11 @@ class TaskManager:
         """
         # Convert to int if needed
         task_id = int(task_id) if isinstance(task_id, str) else task_id
-        
-        # Count tasks before deletion
-        original_count = len(self.tasks)
-        
-        # Filter out the task with matching ID
-        self.tasks = [task for task in self.tasks if task["id"] != task_id]
+        self.refresh()
         
         # Check if anything was actually deleted
-        if len(self.tasks) < original_count:
+        if self.by_id.pop(task_id, None) is not None:
+            self.changed(task_id)
             self.save_tasks()
             print(f"Task {task_id} deleted successfully!")
             return True
@@ -93,21 +421,388 @@ class TaskManager:
         Update task with any provided fields
         """
         task_id = int(task_id) if isinstance(task_id, str) else task_id
+        self.refresh()
         
-        for task in self.tasks:
-            if task["id"] == task_id:
-                # Update any provided fields
-                for key, value in updates.items():
-                    if key in task:
-                        task[key] = value
-                task["status_update_time"] = datetime.now().isoformat()
-                self.save_tasks()
-                print(f'Task {task_id} updated')
-                return task
+        task = self.by_id.get(task_id)
+        if task is not None:
+            # Update any provided fields
+            for key, value in updates.items():
+                if key in task:
+                    task[key] = value
+            task["status_update_time"] = datetime.now().isoformat()
+            self.changed(task_id)
+            self.save_tasks()
+            print(f'Task {task_id} updated')
+            return task
         
         print(f'Task {task_id} not found')
         return False
-                
+
+
+class MemoryTaskManager(TaskManager):
+    """
+    TaskManager that never touches disk. The backend's capture jobs run the
+    agent against one and apply the tasks it added themselves.
+    """
+    def __init__(self, tasks=()):
+        self.seed = [dict(task) for task in tasks]
+        super().__init__(None)
+
+    def stat_file(self):
+        return None
+
+    def load_tasks(self):
+        return self.seed
+
+    def flush(self):
+        self.dirty = False
+
+
+class SharedTaskManager(TaskManager):
+    """
+    TaskManager over the SQLite store the FastAPI backend uses
+    (backend/tasks_store.db), so both can change tasks at the same time.
+
+    The store keeps the API's camelCase tasks; records holds them by id and
+    only rows that changed are converted to and from the CLI's format.
+    refresh() asks the store for rows written since the last version seen
+    instead of reloading everything. flush() writes only the tasks changed
+    since the last flush, in one store transaction: updates are merged
+    into the stored row field by field (so an API edit to another field
+    survives) with their history note appended to the store's history
+    archive, new ids are reserved from the store and deletes leave a
+    tombstone the API picks up.
+    """
+    def __init__(self, db_path=DB_PATH):
+        self.store = open_shared_store(Path(db_path))
+        self.records = {}
+        self.pending = set()
+        self.version = 0
+        super().__init__(str(db_path))
+
+    def stat_file(self):
+        return None
+
+    def load_tasks(self):
+        self.version = self.store.current_version()
+        self.records = {task["id"]: task for task in self.store.load()}
+        return [task_to_cli(task) for task in self.records.values()]
+
+    def score_features(self, task):
+        """
+        Shared tasks also have the API's due date and estimated minutes
+        """
+        record = self.records.get(task['id']) or {}
+        return self.features(task, record.get("dueAt"), record.get("estimatedMinutes"))
+
+    def refresh(self):
+        """
+        Pull in rows other processes wrote since the last refresh
+        """
+        if self.dirty or self.batch_depth:
+            return
+        changed, deleted, self.version = self.store.changes_since(self.version)
+        for task in changed:
+            task_id = task["id"]
+            if self.records.get(task_id) == task:
+                # Our own write coming back
+                continue
+            self.records[task_id] = task
+            self.by_id[task_id] = task_to_cli(task)
+            self.max_id = max(self.max_id, task_id)
+            super().changed(task_id)
+        for task_id in deleted:
+            self.records.pop(task_id, None)
+            if self.by_id.pop(task_id, None) is not None:
+                super().changed(task_id)
+
+    def changed(self, task_id):
+        self.pending.add(task_id)
+        super().changed(task_id)
+
+    def allocate_ids(self, count):
+        first = self.store.reserve_ids(count)
+        return list(range(first, first + count))
+
+    def flush(self):
+        if not self.dirty:
+            return
+        written = {}
+        with self.store.transaction():
+            for task_id in sorted(self.pending):
+                task = self.by_id.get(task_id)
+                record = self.records.get(task_id)
+                if task is None:
+                    if record is not None:
+                        self.store.delete(task_id)
+                    written[task_id] = None
+                elif record is None:
+                    self.store.put(task_from_cli(task, note="Task captured through CLI"))
+                    # As stored: the history entry went to the archive
+                    written[task_id] = self.store.get(task_id)
+                elif task != task_to_cli(record):
+                    updated = task_from_cli(task, base=record, note="Updated from the CLI")
+                    self.store.patch(updated, record, 0)
+                    written[task_id] = self.store.get(task_id)
+        for task_id, record in written.items():
+            if record is None:
+                self.records.pop(task_id, None)
+            else:
+                self.records[task_id] = record
+        self.pending.clear()
+        self.dirty = False
+
+    def close(self):
+        super().close()
+        self.store.close()
+
+
+class ToolRunner:
+    """
+    Executes one turn's tool calls, accepting them one at a time as they arrive.
+
+    Reads (READ_ONLY_TOOLS) run concurrently on a small pool. Writes run
+    one after another on a single writer thread, and each run of
+    consecutive writes is one TaskManager transaction, so tasks.json is
+    saved at most once per run instead of once per call (and only once
+    per command when the command holds a transaction). A read waits for
+    the write run before it to finish; a write run waits for the reads
+    before it. Each submit returns a future, so results can be collected
+    in the original call order.
+    """
+    def __init__(self, execute, task_manager, max_readers=4):
+        self.execute = execute
+        self.task_manager = task_manager
+        self.writer = ThreadPoolExecutor(max_workers=1)
+        self.readers = ThreadPoolExecutor(max_workers=max_readers)
+        self.in_write_run = False
+        self.last_commit = None
+        self.reads = []
+
+    def is_read(self, tool_call):
+        return tool_call['function']['name'] in READ_ONLY_TOOLS
+
+    def submit(self, tool_call):
+        if self.is_read(tool_call):
+            self.end_write_run()
+            after = [self.last_commit] if self.last_commit else []
+            future = self.readers.submit(self.run_after, after, tool_call)
+            self.reads.append(future)
+            return future
+        if not self.in_write_run:
+            reads, self.reads = self.reads, []
+            self.writer.submit(self.begin_write_run, reads)
+            self.in_write_run = True
+        return self.writer.submit(self.execute, tool_call)
+
+    def run_after(self, futures, tool_call):
+        wait(futures)
+        return self.execute(tool_call)
+
+    def begin_write_run(self, reads):
+        wait(reads)
+        self.task_manager.begin()
+
+    def end_write_run(self):
+        if self.in_write_run:
+            self.last_commit = self.writer.submit(self.task_manager.commit)
+            self.in_write_run = False
+
+    def close(self):
+        """
+        Save any open write run and wait for every call to finish
+        """
+        self.end_write_run()
+        self.writer.shutdown(wait=True)
+        self.readers.shutdown(wait=True)
+
+
+class ToolCallScanner:
+    """
+    Split streamed text into plain text and complete top-level JSON objects.
+    Small models often write a tool call as JSON in the message content
+    instead of using tool_calls, so that JSON is held back until its closing
+    brace arrives while everything outside braces passes straight through.
+    """
+    def __init__(self):
+        self.buffer = ''
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, text):
+        """
+        Returns ('text', str) and ('json', str) pieces in stream order
+        """
+        pieces = []
+        plain = ''
+        for char in text:
+            if self.depth == 0:
+                if char == '{':
+                    if plain:
+                        pieces.append(('text', plain))
+                        plain = ''
+                    self.depth = 1
+                    self.buffer = char
+                else:
+                    plain += char
+                continue
+
+            self.buffer += char
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char == '{':
+                self.depth += 1
+            elif char == '}':
+                self.depth -= 1
+                if self.depth == 0:
+                    pieces.append(('json', self.buffer))
+                    self.buffer = ''
+        if plain:
+            pieces.append(('text', plain))
+        return pieces
+
+    def flush(self):
+        """
+        Whatever is left of an unfinished object once the stream ends
+        """
+        rest = self.buffer
+        self.buffer = ''
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        return rest
+
+
+class ConversationContext:
+    """
+    Conversation history held to a prompt token budget.
+
+    Before each model call, tool results from earlier turns are swapped for
+    a short reference (the model can call the tool again for fresh data).
+    If the prompt is still over budget, the oldest turns are folded into
+    one-line notes in a summary message after the system prompt. The
+    current turn is never shortened.
+
+    Tokens are estimated from characters. turn_stats keeps, per turn, the
+    estimate for every model call next to the prompt_eval_count ollama
+    reports back.
+    """
+    CHARS_PER_TOKEN = 4
+    MESSAGE_OVERHEAD = 4
+    SUMMARY_HEADER = 'Summary of earlier conversation:'
+    CLIP_CHARS = 80
+
+    def __init__(self, system_prompt=None, token_budget=4000, messages=None, max_summary_lines=20):
+        if messages is None:
+            messages = [{'role': 'system', 'content': system_prompt}]
+        self.messages = messages
+        self.token_budget = token_budget
+        self.max_summary_lines = max_summary_lines
+        self.summary_lines = []
+        self.turn_stats = []
+
+    def estimate_tokens(self, message):
+        text = message.get('content') or ''
+        if message.get('tool_calls'):
+            text += json.dumps([dict(call['function']) for call in message['tool_calls']], default=str)
+        return len(text) // self.CHARS_PER_TOKEN + self.MESSAGE_OVERHEAD
+
+    def prompt_tokens(self):
+        return sum(self.estimate_tokens(message) for message in self.messages)
+
+    def add_user(self, user_input):
+        self.messages.append({
+            'role': 'user',
+            'content': user_input
+        })
+        self.turn_stats.append({'turn': len(self.turn_stats) + 1, 'estimated': [], 'reported': []})
+
+    def record_usage(self, prompt_eval_count):
+        if self.turn_stats and prompt_eval_count:
+            self.turn_stats[-1]['reported'].append(prompt_eval_count)
+
+    def is_first_turn(self):
+        return len(self.turn_starts()) <= 1 and not self.summary_lines
+
+    def turn_starts(self):
+        return [index for index, message in enumerate(self.messages) if message['role'] == 'user']
+
+    def fit(self):
+        """
+        Compact the history for the next model call; returns the estimated prompt tokens
+        """
+        starts = self.turn_starts()
+        self.shorten_tool_results(starts[-1] if starts else len(self.messages))
+        while self.prompt_tokens() > self.token_budget and len(starts) > 1:
+            self.fold_turn(starts[0], starts[1])
+            starts = self.turn_starts()
+        while self.prompt_tokens() > self.token_budget and self.summary_lines:
+            self.summary_lines.pop(0)
+            self.write_summary()
+
+        estimate = self.prompt_tokens()
+        if self.turn_stats:
+            self.turn_stats[-1]['estimated'].append(estimate)
+        return estimate
+
+    def shorten_tool_results(self, end):
+        names = deque()
+        for message in self.messages[:end]:
+            if message['role'] == 'assistant':
+                names = deque(call['function']['name'] for call in message.get('tool_calls') or [])
+            elif message['role'] == 'tool':
+                name = names.popleft() if names else 'tool'
+                if not message['content'].startswith('{"omitted"'):
+                    message['content'] = json.dumps({
+                        'omitted': f'{name} result from an earlier turn; call {name} again for current data'
+                    })
+
+    def fold_turn(self, start, end):
+        turn = self.messages[start:end]
+        answers = [m['content'] for m in turn if m['role'] == 'assistant' and m.get('content')]
+        tool_names = [
+            call['function']['name']
+            for m in turn if m['role'] == 'assistant'
+            for call in m.get('tool_calls') or []
+        ]
+        line = f"- User: {self.clip(turn[0]['content'])}"
+        if tool_names:
+            line += f" (tools: {', '.join(tool_names)})"
+        if answers:
+            line += f" / Assistant: {self.clip(answers[-1])}"
+        del self.messages[start:end]
+        self.summary_lines = (self.summary_lines + [line])[-self.max_summary_lines:]
+        self.write_summary()
+
+    def clip(self, text):
+        text = ' '.join((text or '').split())
+        return text if len(text) <= self.CLIP_CHARS else text[:self.CLIP_CHARS - 3] + '...'
+
+    def write_summary(self):
+        index = 1 if self.messages and self.messages[0]['role'] == 'system' else 0
+        has_summary = (
+            len(self.messages) > index
+            and self.messages[index]['role'] == 'system'
+            and self.messages[index]['content'].startswith(self.SUMMARY_HEADER)
+        )
+        if not self.summary_lines:
+            if has_summary:
+                del self.messages[index]
+            return
+        summary = {'role': 'system', 'content': '\n'.join([self.SUMMARY_HEADER] + self.summary_lines)}
+        if has_summary:
+            self.messages[index] = summary
+        else:
+            self.messages.insert(index, summary)
+
 
 # user enters prompt into chatbox
 # LLM interprets user query and identifies what action needs to be taken
@@ -116,13 +811,19 @@ class TaskManager:
 class LLM:
     
     # create instance of tool set agent can use to interact with the to do list
-    def __init__(self, tools, task_manager):
+    def __init__(self, tools, task_manager, system_prompt_path='system_prompt.md', token_budget=4000,
+                 plan_cache=None, chat_fn=None):
         self.tools = tools
+        # ollama's chat(), or a stand-in with the same signature (benchmarks)
+        self.chat = chat_fn or chat
+        self.token_budget = token_budget
+        self.plan_cache = plan_cache
+        self.tool_names = {tool['function']['name'] for tool in tools}
         self.task_manager = task_manager
         
         # Load system prompt once at initialization
         try:
-            with open('system_prompt.md', 'r') as f:
+            with open(system_prompt_path, 'r') as f:
                 self.system_prompt = f.read()
         except FileNotFoundError:
             print('The product was unable to load the prompt')
@@ -141,12 +842,10 @@ class LLM:
         
         # Map function names to TaskManager methods
         if function_name == 'list_task':
-            tasks = self.task_manager.load_tasks()
-            formatted_tasks = [
-                f"{task['id']} {task['text']} / Category: {task['category']} / Priority: {task['priority label']} / Status: {task['status']}"
-                for task in tasks
-            ]
-            return {"tasks": formatted_tasks}
+            return {"tasks": self.task_manager.task_lines()}
+        elif function_name == 'search_task':
+            limit = int(arguments.get('limit') or 10)
+            return {"tasks": self.task_manager.search_tasks(arguments['query'], limit=limit)}
         elif function_name == 'save_task':
             self.task_manager.save_tasks()
             return {"result": "Tasks saved successfully"}
@@ -155,6 +854,10 @@ class LLM:
             category = arguments['category']
             priority_label = arguments['priority_label']
             priority_score = arguments['priority_score']
+            if not arguments.get('allow_duplicate'):
+                existing = self.task_manager.find_duplicate(task_text)
+                if existing is not None:
+                    return {"result": f"Not added: task {existing['id']} is already on the list", "task": existing}
             task = self.task_manager.add_task(task_text, category=category, priority_score=priority_score, priority_label=priority_label)
             return {"result": "Task added successfully", "task": task}
         elif function_name == 'delete_task':
@@ -162,37 +865,260 @@ class LLM:
             print(f"DEBUG: task_id type: {type(arguments['task_id'])}")
             success = self.task_manager.delete_task(arguments['task_id'])
             return {"result": "Task deleted successfully" if success else "Task not found"}
+        elif function_name == 'rescore_tasks':
+            moved, ambiguous = self.task_manager.rescore_tasks()
+            return {
+                "rescored": [self.task_manager.render_task(task) for task in moved],
+                "ambiguous": [self.task_manager.render_task(task) for task in ambiguous],
+            }
         elif function_name == 'update_task':
             task_id = arguments['task_id']
             updates = {k: v for k, v in arguments.items() if k != 'task_id'}
+            if 'priority score' in updates or 'priority label' in updates:
+                # The user asked for this priority: rescoring leaves it alone
+                updates['priority pinned'] = True
             task = self.task_manager.update_task(task_id, **updates)
-            if task:  # If update succeeded
-                print("DEBUG: Update successful, triggering save")
-                self.task_manager.save_tasks()  # Force save
             return {"result": "Task updated and saved" if task else "Task not found"}
         else:
             return {"error": f"Unknown function: {function_name}"}
 
-    def process_command(self, user_input, conversation_history=None):
+    def parse_content_tool_call(self, raw):
+        """
+        Turn a JSON object the model wrote into its content into a tool call,
+        or None if it is not a call to one of our tools
+        """
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            return None
+        if not isinstance(data, dict) or data.get('name') not in self.tool_names:
+            return None
+        arguments = data.get('parameters', data.get('arguments')) or {}
+        if not isinstance(arguments, dict):
+            return None
+        return {'function': {'name': data['name'], 'arguments': arguments}}
+
+    def execute_tool_calls(self, tool_calls):
+        """
+        Run a turn's tool calls (see ToolRunner); results are in call order
+        """
+        runner = ToolRunner(self.run_tool_call, self.task_manager)
+        # One flush for the whole command, however the calls split into runs
+        self.task_manager.begin()
+        try:
+            futures = [runner.submit(tool_call) for tool_call in tool_calls]
+        finally:
+            runner.close()
+            self.task_manager.commit()
+        return [future.result() for future in futures]
+
+    def run_tool_call(self, tool_call):
+        try:
+            return self.execute_tool_call(tool_call)
+        except Exception as error:
+            # Report back to the model instead of killing the stream
+            return {"error": f"{tool_call['function']['name']} failed: {error}"}
+
+    def stream_command(self, user_input, conversation_history=None, model='llama3.2:3b'):
+        """
+        Streaming version of process_command. Yields events as dicts:
+        {'type': 'token', 'content': ...} for text as it arrives,
+        'tool_call' and 'tool_result' events, and finally 'done' with the
+        answer text, the updated conversation history in 'messages' and
+        this turn's prompt token counts in 'prompt_tokens'.
+
+        Each tool call is handed to a ToolRunner as soon as its JSON is
+        complete, so it runs while the model is still streaming the rest of
+        its reply. Results are reported in the order the calls were made.
+        A plan_cache hit replays the cached tool calls without asking the
+        model to plan, and is announced by a 'plan_cache' event.
+        """
+        context = self.start_turn(user_input, conversation_history)
+        messages = context.messages
+        runner = ToolRunner(self.run_tool_call, self.task_manager)
+        tool_calls = []
+        results = []
+        pending = deque()
+
+        def start(tool_call):
+            tool_calls.append(tool_call)
+            pending.append((tool_call, runner.submit(tool_call)))
+            return {
+                'type': 'tool_call',
+                'name': tool_call['function']['name'],
+                'arguments': dict(tool_call['function'].get('arguments') or {}),
+            }
+
+        def finished(wait=False):
+            while pending and (wait or pending[0][1].done()):
+                tool_call, future = pending.popleft()
+                result = future.result()
+                results.append(result)
+                yield {'type': 'tool_result', 'name': tool_call['function']['name'], 'result': result}
+
+        def finish_tools():
+            # Wait for every call, then flush the command's changes once
+            nonlocal flushed
+            runner.close()
+            if not flushed:
+                flushed = True
+                self.task_manager.commit()
+
+        flushed = False
+        self.task_manager.begin()
+        try:
+            content = ''
+            plan, match = self.cached_plan(user_input, context, model)
+            if plan is not None:
+                yield {'type': 'plan_cache', 'match': match}
+                content = plan['content']
+                for tool_call in plan['tool_calls']:
+                    yield start(tool_call)
+            else:
+                scanner = ToolCallScanner()
+                context.fit()
+                started = time.perf_counter()
+                for chunk in self.chat(model=model, stream=True, messages=messages, tools=self.tools):
+                    context.record_usage(chunk.get('prompt_eval_count'))
+                    message = chunk['message']
+                    for kind, text in scanner.feed(message.get('content') or ''):
+                        tool_call = self.parse_content_tool_call(text) if kind == 'json' else None
+                        if tool_call is None:
+                            content += text
+                            yield {'type': 'token', 'content': text}
+                        else:
+                            yield start(tool_call)
+                    for tool_call in message.get('tool_calls') or []:
+                        yield start(tool_call)
+                    yield from finished()
+                rest = scanner.flush()
+                if rest:
+                    content += rest
+                    yield {'type': 'token', 'content': rest}
+                self.remember_plan(
+                    user_input, context, model, content, tool_calls, time.perf_counter() - started
+                )
+
+            if tool_calls:
+                finish_tools()
+                yield from finished(wait=True)
+                messages.append({
+                    'role': 'assistant',
+                    'content': content,
+                    'tool_calls': tool_calls
+                })
+                for result in results:
+                    messages.append({
+                        'role': 'tool',
+                        'content': json.dumps(result)
+                    })
+
+                # Stream the final answer after tool execution
+                content = ''
+                context.fit()
+                for chunk in self.chat(model=model, stream=True, messages=messages, tools=self.tools):
+                    context.record_usage(chunk.get('prompt_eval_count'))
+                    text = chunk['message'].get('content') or ''
+                    if text:
+                        content += text
+                        yield {'type': 'token', 'content': text}
+
+            messages.append({
+                'role': 'assistant',
+                'content': content
+            })
+            yield {
+                'type': 'done',
+                'content': content,
+                'messages': messages,
+                'prompt_tokens': context.turn_stats[-1],
+            }
+        finally:
+            # Let started tools finish even if the consumer stopped listening
+            finish_tools()
+
+    def capture_tasks(self, text, model='llama3.2:3b'):
+        """
+        Batch capture: one model call turns a freeform dump into tasks.
+        The reply is constrained to TASK_BATCH_SCHEMA, checked against it
+        and inserted with a single add_tasks(), which drops tasks already
+        on the list. No tools or task list are sent. Raises ValueError for a reply that is not JSON or does not
+        match the schema.
+        """
+        response = self.chat(
+            model=model,
+            stream=False,
+            messages=[
+                {'role': 'system', 'content': BATCH_CAPTURE_PROMPT},
+                {'role': 'user', 'content': text},
+            ],
+            format=TASK_BATCH_SCHEMA,
+        )
+        content = response['message']['content']
+        try:
+            data = json.loads(content)
+        except ValueError as error:
+            raise ValueError(f'Capture reply is not JSON: {error}')
+        errors = schema_errors(data, TASK_BATCH_SCHEMA)
+        if errors:
+            raise ValueError(f"Capture reply does not match the schema: {'; '.join(errors[:5])}")
+        return self.task_manager.add_tasks(data['tasks'], skip_duplicates=True)
+
+    def plan_namespace(self, model):
+        return self.plan_cache.namespace(model, self.system_prompt, self.tools)
+
+    def cached_plan(self, user_input, context, model):
+        if self.plan_cache is None:
+            return None, None
+        return self.plan_cache.lookup(
+            user_input, self.plan_namespace(model), first_turn=context.is_first_turn()
+        )
+
+    def remember_plan(self, user_input, context, model, content, tool_calls, latency):
+        if self.plan_cache is not None:
+            self.plan_cache.store(
+                user_input, self.plan_namespace(model), content, tool_calls, latency,
+                first_turn=context.is_first_turn()
+            )
+
+    def open_context(self, conversation_history=None):
         """
-        Process user input and determine what action to take
+        conversation_history may be a ConversationContext, a plain message
+        list (compacted in place) or None to start a new conversation
         """
+        if isinstance(conversation_history, ConversationContext):
+            return conversation_history
         if conversation_history is None:
-            messages = [
-                {
-                    'role': 'system',
-                    'content': self.system_prompt  # Use the loaded prompt
-                }
-            ]
-        else:
-            # Use existing conversation history
-            messages = conversation_history
-        
+            return ConversationContext(self.system_prompt, self.token_budget)
+        return ConversationContext(token_budget=self.token_budget, messages=conversation_history)
+
+    def start_turn(self, user_input, conversation_history=None):
+        context = self.open_context(conversation_history)
         # Add the latest user input to messages
-        messages.append({
-            'role': 'user',
-            'content': user_input
-        })
+        context.add_user(user_input)
+        return context
+
+    def process_command(self, user_input, conversation_history=None, stream=False):
+        """
+        Process user input and determine what action to take.
+        Returns the ConversationContext to pass back in on the next call
+        (or the same list, if a plain message list was passed in)
+        """
+        context = self.open_context(conversation_history)
+        history = conversation_history if isinstance(conversation_history, list) else context
+        if stream:
+            for event in self.stream_command(user_input, context):
+                if event['type'] == 'token':
+                    print(event['content'], end='', flush=True)
+                elif event['type'] == 'tool_call':
+                    print(f"\nDEBUG: Calling tool: {event['name']}")
+                elif event['type'] == 'done':
+                    print()
+                    print(f"DEBUG: Prompt tokens this turn: {event['prompt_tokens']}")
+            return history
+
+        self.start_turn(user_input, context)
+        messages = context.messages
 
         model = 'llama3.2:3b'
         
@@ -200,32 +1126,45 @@ class LLM:
         print("DEBUG: Number of tools being passed:", len(self.tools))
         print("DEBUG: Tool names:", [tool['function']['name'] for tool in self.tools])
 
-        # Get initial response from LLM
-        response = chat(
-            model=model,
-            stream=False,
-            messages=messages,
-            tools=self.tools
-        )
+        # Reuse a cached plan for a repeated request, or get one from the LLM
+        plan, match = self.cached_plan(user_input, context, model)
+        if plan is not None:
+            print(f"DEBUG: Plan cache {match} hit")
+            content, tool_calls = plan['content'], plan['tool_calls']
+        else:
+            context.fit()
+            started = time.perf_counter()
+            response = self.chat(
+                model=model,
+                stream=False,
+                messages=messages,
+                tools=self.tools
+            )
+            context.record_usage(response.get('prompt_eval_count'))
+            # Subscripts work on both ollama's dict replies (<0.4) and ChatResponse
+            content = response['message']['content']
+            tool_calls = response['message'].get('tool_calls') or []
+            self.remember_plan(
+                user_input, context, model, content, tool_calls, time.perf_counter() - started
+            )
 
-        print('user input passed to LLM API')
+            print('user input passed to LLM API')
 
         # Check if the LLM wants to use tools
-        if hasattr(response.message, 'tool_calls') and response.message.tool_calls:
-            print(f"DEBUG: LLM wants to use {len(response.message.tool_calls)} tools")
-            for tool_call in response.message.tool_calls:
+        if tool_calls:
+            print(f"DEBUG: LLM wants to use {len(tool_calls)} tools")
+            for tool_call in tool_calls:
                 print(f"DEBUG: Calling tool: {tool_call['function']['name']}")
             # Add the assistant's response to conversation
             messages.append({
                 'role': 'assistant',
-                'content': response.message.content,
-                'tool_calls': response.message.tool_calls
+                'content': content,
+                'tool_calls': tool_calls
             })
             
-            # Execute each tool call
-            for tool_call in response.message.tool_calls:
-                tool_result = self.execute_tool_call(tool_call)
-                
+            # Execute the tool calls, reads in parallel and writes saved once per run
+            tool_results = self.execute_tool_calls(tool_calls)
+            for tool_call, tool_result in zip(tool_calls, tool_results):
                 # Debug: Print the tool_call structure to see what's available
                 print("DEBUG: tool_call structure:", tool_call)
                 
@@ -237,32 +1176,35 @@ class LLM:
                 })
             
             # Get final response from LLM after tool execution
-            final_response = chat(
+            context.fit()
+            final_response = self.chat(
                 model=model,
                 stream=False,
                 messages=messages,
                 tools=self.tools
             )
+            context.record_usage(final_response.get('prompt_eval_count'))
             
             # Add the final response to conversation history
             messages.append({
                 'role': 'assistant',
-                'content': final_response.message.content
+                'content': final_response['message']['content']
             })
             
-            print(final_response.message.content)
+            print(final_response['message']['content'])
         else:
             print("DEBUG: No tool calls made by LLM")
-            print(response.model)
+            print(response['model'])
             # No tools needed, just add the response to conversation history
             messages.append({
                 'role': 'assistant',
-                'content': response.message.content
+                'content': content
             })
-            print(response.message.content)
+            print(content)
         
+        print(f"DEBUG: Prompt tokens this turn: {context.turn_stats[-1]}")
         # Return the updated conversation history
-        return messages
+        return history
 
 # create tool set
 tools = [
@@ -278,6 +1220,27 @@ tools = [
             }
         }
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "search_task",
+            "description": "Find the tasks matching some words, best match first. Use this instead of list_task when the user refers to particular tasks (e.g. 'what do I have about taxes', 'complete the dentist task'), so only the matching tasks are loaded.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": {
+                        "type": "string",
+                        "description": "Words to look for in the task text and category"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Most tasks to return (default 10)"
+                    }
+                },
+                "required": ["query"]
+            }
+        }
+    },
     {
         "type": "function",
         "function": {
@@ -309,12 +1272,28 @@ tools = [
                     "priority": {
                         "type": "string",
                         "description": "Task priority: High, Medium, or Low"
+                    },
+                    "allow_duplicate": {
+                        "type": "boolean",
+                        "description": "Add the task even if a similar incomplete task exists (only when the user asks for it)"
                     }
                 },
                 "required": ["task_text", "category", "priority_score", "priority_label"]
             }
         }
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "rescore_tasks",
+            "description": "Recompute the priority of every task locally from its category, due date and age. Returns the tasks whose priority changed and the ambiguous ones it could not score",
+            "parameters": {
+                "type": "object",
+                "properties": {},
+                "required": []
+            }
+        }
+    },
     {
         "type": "function",
         "function": {
@@ -351,9 +1330,75 @@ tools = [
     }
 ]
 
+# JSON schema for batch capture replies (see LLM.capture_tasks)
+TASK_BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "tasks": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "task_text": {"type": "string", "minLength": 1},
+                    "category": {"type": "string", "minLength": 1},
+                    "priority_score": {"type": "integer", "minimum": 0, "maximum": 10}
+                },
+                "required": ["task_text", "category", "priority_score"]
+            }
+        }
+    },
+    "required": ["tasks"]
+}
+
+BATCH_CAPTURE_PROMPT = """Split the user's message into separate tasks. Reply only with JSON of the form
+{"tasks": [{"task_text": "...", "category": "...", "priority_score": 0}]}.
+task_text: a short description of one task, in the user's words.
+category: one of Health, Work/Career, Financial, Administrative, Home/Household, Relationships, Education, unless the user names one.
+priority_score: 0-10 (lowest to highest importance)."""
+
+JSON_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+}
+
+
+def schema_errors(value, schema, path='$'):
+    """
+    Check value against the subset of JSON Schema used here (type,
+    properties, required, items, minLength, minimum, maximum). Returns a
+    list of error messages, empty when it matches.
+    """
+    expected = schema.get('type')
+    if expected and (not isinstance(value, JSON_TYPES[expected])
+                     or (isinstance(value, bool) and expected != 'boolean')):
+        return [f'{path}: expected {expected}']
+    errors = []
+    if expected == 'object':
+        for key in schema.get('required', []):
+            if key not in value:
+                errors.append(f'{path}: missing {key}')
+        for key, subschema in schema.get('properties', {}).items():
+            if key in value:
+                errors += schema_errors(value[key], subschema, f'{path}.{key}')
+    elif expected == 'array':
+        for i, item in enumerate(value):
+            errors += schema_errors(item, schema.get('items', {}), f'{path}[{i}]')
+    if 'minLength' in schema and len(value) < schema['minLength']:
+        errors.append(f'{path}: shorter than {schema["minLength"]}')
+    if 'minimum' in schema and value < schema['minimum']:
+        errors.append(f'{path}: below {schema["minimum"]}')
+    if 'maximum' in schema and value > schema['maximum']:
+        errors.append(f'{path}: above {schema["maximum"]}')
+    return errors
+
+
 def main():
-    tm = TaskManager()
-    llm = LLM(tools, tm)
+    tm = SharedTaskManager()
+    llm = LLM(tools, tm, plan_cache=PlanCache('plan_cache.json'))
     
     # Initialize conversation history
     conversation_history = None
@@ -361,10 +1406,29 @@ def main():
     while True:
         user_input = input("What would you like to do with your task list today? (type 'exit' to quit): ")
         if user_input.lower() == 'exit':
+            print(f"DEBUG: Plan cache: {llm.plan_cache.summary()}")
             break
+        if user_input.lower().startswith('capture:'):
+            # Batch capture: many tasks from one message, one model call
+            try:
+                for task in llm.capture_tasks(user_input[len('capture:'):]):
+                    print(TaskManager.render_task(task))
+            except ValueError as error:
+                print(f"Could not capture tasks: {error}")
+            continue
+        if user_input.lower() == 'dedupe':
+            # Near-duplicate incomplete tasks, merged into the oldest of each group on confirmation
+            groups = tm.duplicate_groups()
+            for group in groups:
+                print(' / '.join(TaskManager.render_task(tm.by_id[task_id]) for task_id in group))
+            if not groups:
+                print("No duplicate tasks found")
+            elif input(f"Merge {len(groups)} group(s) into their oldest task? (y/n): ").lower() == 'y':
+                tm.merge_duplicates(groups)
+            continue
         
         # Process command and get updated conversation history
-        conversation_history = llm.process_command(user_input, conversation_history)
+        conversation_history = llm.process_command(user_input, conversation_history, stream=True)
 
 if __name__ == "__main__":
     # # Test block only